@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from app.calendar_publisher import CalendarPublisher
+from app.repo import OutboxSlot, Repo
+
+logger = logging.getLogger(__name__)
+
+# (заголовок, текст ошибки, слот) — см. AdminNotifier.error
+Notify = Callable[[str, str, str], None]
+
+
+class CalendarOutboxWorker:
+    """
+    Фоновый разбор таблицы calendar_outbox.
+
+    Бронь/отмена только пишет строку в outbox (в своей транзакции), а воркер
+    схлопывает накопившиеся задачи до одного upsert на слот и повторяет
+    неудачные попытки с экспоненциальной задержкой. Так трафик в Calendar
+    растёт с числом разных слотов, а не с числом броней.
+    """
+
+    def __init__(
+        self,
+        repo: Repo,
+        publisher: CalendarPublisher,
+        notify: Optional[Notify] = None,
+        batch_size: int = 50,
+        poll_interval: float = 30.0,
+        base_backoff: float = 5.0,
+        max_backoff: float = 900.0,
+    ):
+        self.repo = repo
+        self.publisher = publisher
+        self.notify = notify
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    async def run(self) -> None:
+        logger.info("Calendar outbox worker started")
+        while True:
+            try:
+                # сбрасываем сигнал до выборки, чтобы не потерять бронь, пришедшую во время прохода
+                self.repo.outbox_event.clear()
+                slots = await self.repo.get_due_outbox_slots(time.time(), self.batch_size)
+                if slots:
+                    await self.process(slots)
+                    continue
+                await self._wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Calendar outbox worker error: {e}", exc_info=True)
+                await asyncio.sleep(self.base_backoff)
+
+    async def _wait(self) -> None:
+        timeout = self.poll_interval
+        next_at = await self.repo.get_next_outbox_attempt()
+        if next_at is not None:
+            timeout = min(timeout, max(0.0, next_at - time.time()))
+        try:
+            await asyncio.wait_for(self.repo.outbox_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def process(self, slots: list[OutboxSlot]) -> None:
+        logger.info(f"Syncing {len(slots)} slot(s) to Google Calendar")
+        if len(slots) == 1:
+            slot = slots[0]
+            try:
+                await self.publisher.upsert_slot_event(slot.service_id, slot.date, slot.time)
+            except Exception as e:
+                await self._fail(slot, e)
+            else:
+                await self.repo.complete_outbox_slot(slot)
+            return
+
+        # много слотов сразу (после простоя, смены вместимости) — одним batch'ем
+        try:
+            results = await self.publisher.upsert_slots([(s.service_id, s.date, s.time) for s in slots])
+        except Exception as e:
+            for slot in slots:
+                await self._fail(slot, e)
+            return
+        for slot in slots:
+            result = results.get((slot.service_id, slot.date, slot.time))
+            if result is None:
+                # слот без результата не синхронизирован: строку outbox оставляем на повтор
+                await self._fail(slot, RuntimeError("No Calendar result for slot"))
+            elif isinstance(result, Exception):
+                await self._fail(slot, result)
+            else:
+                await self.repo.complete_outbox_slot(slot)
+
+    async def _fail(self, slot: OutboxSlot, e: Exception) -> None:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** slot.attempts))
+        logger.error(
+            f"Calendar update failed for slot {self.repo.services.name(slot.service_id)} {slot.date} {slot.time} "
+            f"(attempt {slot.attempts + 1}, retry in {delay:.0f}s): {e}",
+            exc_info=e,
+        )
+        await self.repo.fail_outbox_slot(slot, str(e), time.time() + delay)
+        # админам пишем только о первой неудаче слота, а не о каждом ретрае
+        if slot.attempts == 0 and self.notify is not None:
+            try:
+                self.notify("Calendar update failed", str(e), f"{self.repo.services.name(slot.service_id)} {slot.date} {slot.time}")
+            except Exception as notify_error:
+                logger.error(f"Failed to notify admin about calendar update error: {notify_error}")
@@ -1,16 +1,48 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Callable, Optional, Sequence, Union
 import logging
 from zoneinfo import ZoneInfo
 
-from app.repo import Repo, SERVICE_KEYS
-from app.gcal_client import get_calendar_service
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.repo import Repo
+from app.gcal_client import build_service, load_credentials, refresh_credentials
 
 logger = logging.getLogger(__name__)
 
+# (service_id, date, time)
+Slot = tuple[int, str, str]
+
+# Calendar API принимает до 50 запросов в одном batch
+BATCH_LIMIT = 50
+
+
+class SyncTokenExpired(Exception):
+    """Calendar отклонил syncToken (410 Gone) — нужна полная синхронизация."""
+
+
+def _is_gone(e: HttpError) -> bool:
+    return getattr(e.resp, "status", None) in (404, 410)
+
+
+def _match_slot_event(events: list[dict], service_id: int, date: str, time: str, name: str) -> Optional[dict]:
+    # события до появления строки Service ID узнаём по названию услуги
+    for ev in events:
+        desc = (ev.get("description") or "")
+        if not desc.startswith("[RKBOOK]") or f"Slot: {date} {time}\n" not in desc:
+            continue
+        if f"Service ID: {service_id}\n" in desc or f"Service: {name}\n" in desc:
+            return ev
+    return None
+
 
 def parse_dt(date_str: str, time_str: str, tz: str) -> tuple[str, str]:
     """
@@ -37,18 +69,112 @@ class CalendarPublisher:
     credentials_path: str
     token_path: str
     tz: str
+    # googleapiclient синхронный: все вызовы идут через отдельный пул потоков,
+    # чтобы не блокировать event loop aiogram
+    max_workers: int = 4
+    call_timeout: float = 30.0
+    # путь к ключу сервисного аккаунта: если задан, OAuth в браузере не нужен
+    service_account_path: str = ""
+    # за сколько секунд до истечения токена обновлять его в фоне
+    refresh_margin: float = 300.0
+    # пауза перед повторной сборкой клиента, если он не построился
+    init_retry: float = 60.0
+    _executor: ThreadPoolExecutor = field(init=False, repr=False)
+    _creds: Any = field(init=False, default=None, repr=False)
+    _svc: Any = field(init=False, default=None, repr=False)
+    _svc_lock: asyncio.Lock = field(init=False, repr=False)
+    _local: threading.local = field(init=False, repr=False)
+    _refresh_task: Optional[asyncio.Task] = field(init=False, default=None, repr=False)
 
-    def _service(self):
-        return get_calendar_service(self.credentials_path, self.token_path)
+    def __post_init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gcal")
+        self._svc_lock = asyncio.Lock()
+        self._local = threading.local()
 
-    async def upsert_slot_event(self, service: str, date: str, time: str) -> str:
+    async def start(self) -> None:
         """
-        Создаёт или обновляет 1 событие на слот.
-        Возвращает eventId.
+        Загружает credentials, строит клиент и запускает фоновое обновление токена.
+        Фоновая задача запускается и при ошибке: она же повторяет сборку клиента.
         """
-        logger.info(f"Upserting slot event for {service} on {date} at {time}")
-        cap = await self.repo.get_capacity(service)
-        bookings = await self.repo.get_active_bookings_for_slot(service, date, time)
+        try:
+            await self._service()
+        finally:
+            if self._refresh_task is None:
+                self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _service(self):
+        # клиент и credentials живут всё время процесса; строим один раз
+        if self._svc is not None:
+            return self._svc
+        async with self._svc_lock:
+            if self._svc is None:
+                # без call_timeout: первая OAuth-авторизация ждёт пользователя в
+                # браузере, а сетевые вызовы внутри ограничены таймаутом google-auth
+                loop = asyncio.get_running_loop()
+                creds = await loop.run_in_executor(
+                    self._executor, load_credentials, self.credentials_path, self.token_path, self.service_account_path
+                )
+                self._svc = await self._run(build_service, creds)
+                self._creds = creds
+        return self._svc
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            if self._svc is None:
+                # клиент не построился на старте (нет сети, токен отозван) — пробуем снова
+                await asyncio.sleep(self.init_retry)
+                try:
+                    await self._service()
+                except Exception as e:
+                    logger.error(f"Calendar client init failed, retrying in {self.init_retry:.0f}s: {e}", exc_info=True)
+                continue
+            expiry = self._creds.expiry if self._creds is not None else None
+            if expiry is None:
+                delay = self.refresh_margin
+            else:
+                # google-auth хранит expiry как naive UTC
+                left = (expiry - datetime.utcnow()).total_seconds()
+                delay = max(0.0, left - self.refresh_margin)
+            await asyncio.sleep(delay)
+            if self._creds is None or (self._creds.expiry is None and self._creds.valid):
+                continue
+            try:
+                token_path = None if self.service_account_path else self.token_path
+                await self._run(refresh_credentials, self._creds, token_path)
+            except Exception as e:
+                logger.error(f"Background credentials refresh failed: {e}", exc_info=True)
+                await asyncio.sleep(60)
+
+    def _thread_http(self):
+        # httplib2.Http не потокобезопасен: у каждого потока пула свой транспорт
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self._creds, http=httplib2.Http(timeout=self.call_timeout))
+            self._local.http = http
+        return http
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет блокирующий вызов в пуле Calendar с таймаутом."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, fn, *args), self.call_timeout)
+
+    async def _execute(self, request) -> Any:
+        return await self._run(lambda: request.execute(http=self._thread_http()))
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _slot_body(self, service_id: int, date: str, time: str) -> tuple[int, dict]:
+        service = self.repo.services.name(service_id)
+        cap = await self.repo.get_capacity(service_id)
+        bookings = await self.repo.get_active_bookings_for_slot(service_id, date, time)
 
         used = len(bookings)
         title = f"{service} {used}/{cap}"
@@ -58,6 +184,7 @@ class CalendarPublisher:
         description = (
             "[RKBOOK]\n"
             f"Service: {service}\n"
+            f"Service ID: {service_id}\n"
             f"Slot: {date} {time}\n"
             f"Used: {used}/{cap}\n\n"
             "Participants:\n"
@@ -65,20 +192,26 @@ class CalendarPublisher:
         )
 
         start_iso, end_iso = parse_dt(date, time, self.tz)
+        body = {
+            "summary": title,
+            "description": description,
+            "start": {"dateTime": start_iso, "timeZone": self.tz},
+            "end": {"dateTime": end_iso, "timeZone": self.tz},
+            # patch удалённого вручную события вернёт его обратно
+            "status": "confirmed",
+        }
+        return used, body
 
-        svc = self._service()
-
-        # найти существующее событие по маркеру Slot: date time + service
-        query = f"[RKBOOK] {service} {date} {time}"
-        # Calendar API не ищет по description напрямую нормально; поэтому делаем грубее:
-        # ищем события в окне 1 часа и фильтруем по description/summary.
-        time_min = start_iso
-        time_max = end_iso
-
+    async def _find_slot_event(self, svc, service_id: int, date: str, time: str) -> Optional[dict]:
+        """
+        Fallback-поиск события слота, когда сохранённого eventId нет в календаре.
+        Calendar API не ищет по description напрямую нормально; поэтому делаем грубее:
+        ищем события в окне 1 часа и фильтруем по description.
+        """
+        time_min, time_max = parse_dt(date, time, self.tz)
         logger.debug(f"Searching for existing events in time range {time_min} to {time_max}")
-        events = (
-            svc.events()
-            .list(
+        listed = await self._execute(
+            svc.events().list(
                 calendarId=self.calendar_id,
                 timeMin=time_min,
                 timeMax=time_max,
@@ -86,46 +219,213 @@ class CalendarPublisher:
                 orderBy="startTime",
                 maxResults=20,
             )
-            .execute()
-            .get("items", [])
         )
+        events = listed.get("items", [])
         logger.debug(f"Found {len(events)} events in range")
 
-        target = None
-        for ev in events:
-            desc = (ev.get("description") or "")
-            summ = (ev.get("summary") or "")
-            if desc.startswith("[RKBOOK]") and f"Slot: {date} {time}" in desc and f"Service: {service}" in desc:
-                target = ev
-                logger.debug(f"Found existing event with id={ev.get('id')}")
-                break
+        target = _match_slot_event(events, service_id, date, time, self.repo.services.name(service_id))
+        if target:
+            logger.debug(f"Found existing event with id={target.get('id')}")
+        return target
 
-        body = {
-            "summary": title,
-            "description": description,
-            "start": {"dateTime": start_iso, "timeZone": self.tz},
-            "end": {"dateTime": end_iso, "timeZone": self.tz},
-        }
+    async def upsert_slot_event(self, service_id: int, date: str, time: str) -> str:
+        """
+        Создаёт или обновляет 1 событие на слот.
+        eventId слота берётся из slot_events; events.list нужен только если
+        сохранённое событие пропало из календаря (404/410).
+        Возвращает eventId ("" если событие слота удалено).
+        """
+        logger.info(f"Upserting slot event for service {service_id} on {date} at {time}")
+        used, body = await self._slot_body(service_id, date, time)
+        event_id = await self.repo.get_slot_event_id(service_id, date, time)
+
+        svc = await self._service()
 
         if used == 0:
             # если никого нет — витринное событие удаляем (чтобы календарь был чистый)
             logger.info(f"No bookings in slot, deleting event if exists")
-            if target and target.get("id"):
-                logger.debug(f"Deleting event {target['id']}")
-                svc.events().delete(calendarId=self.calendar_id, eventId=target["id"]).execute()
+            if event_id:
+                logger.debug(f"Deleting event {event_id}")
+                try:
+                    await self._execute(svc.events().delete(calendarId=self.calendar_id, eventId=event_id))
+                except HttpError as e:
+                    if not _is_gone(e):
+                        raise
+                    logger.debug(f"Event {event_id} already gone")
+                await self.repo.delete_slot_event(service_id, date, time)
             return ""
 
-        if target and target.get("id"):
-            logger.info(f"Updating existing event {target['id']}")
-            updated = (
-                svc.events()
-                .patch(calendarId=self.calendar_id, eventId=target["id"], body=body)
-                .execute()
-            )
-            logger.info(f"Event updated successfully")
-            return str(updated["id"])
+        if event_id:
+            logger.info(f"Updating existing event {event_id}")
+            try:
+                updated = await self._execute(
+                    svc.events().patch(calendarId=self.calendar_id, eventId=event_id, body=body)
+                )
+                logger.info(f"Event updated successfully")
+                return str(updated["id"])
+            except HttpError as e:
+                if not _is_gone(e):
+                    raise
+                logger.warning(f"Stored event {event_id} not found in calendar, falling back to search")
+
+            target = await self._find_slot_event(svc, service_id, date, time)
+            if target and target.get("id"):
+                logger.info(f"Updating found event {target['id']}")
+                updated = await self._execute(
+                    svc.events().patch(calendarId=self.calendar_id, eventId=target["id"], body=body)
+                )
+                await self.repo.set_slot_event_id(service_id, date, time, str(updated["id"]))
+                return str(updated["id"])
 
         logger.info(f"Creating new calendar event")
-        created = svc.events().insert(calendarId=self.calendar_id, body=body).execute()
+        created = await self._execute(svc.events().insert(calendarId=self.calendar_id, body=body))
+        await self.repo.set_slot_event_id(service_id, date, time, str(created["id"]))
         logger.info(f"Event created with id={created['id']}")
         return str(created["id"])
+
+    async def list_changes(self, sync_token: Optional[str]) -> tuple[list[dict], Optional[str]]:
+        """
+        Инкрементальный список изменений календаря по syncToken.
+        Без токена — полный список (первый запуск). Возвращает (events, nextSyncToken).
+        """
+        svc = await self._service()
+        events: list[dict] = []
+        page_token = None
+        while True:
+            params: dict[str, Any] = {"calendarId": self.calendar_id, "maxResults": 250, "showDeleted": True}
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+            try:
+                page = await self._execute(svc.events().list(**params))
+            except HttpError as e:
+                if sync_token and getattr(e.resp, "status", None) == 410:
+                    raise SyncTokenExpired() from e
+                raise
+            events.extend(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                logger.debug(f"Listed {len(events)} changed event(s), incremental={bool(sync_token)}")
+                return events, page.get("nextSyncToken")
+
+    async def delete_event(self, event_id: str) -> None:
+        svc = await self._service()
+        try:
+            await self._execute(svc.events().delete(calendarId=self.calendar_id, eventId=event_id))
+        except HttpError as e:
+            if not _is_gone(e):
+                raise
+
+    async def _execute_batch(self, svc, requests: list[tuple[Any, Any]]) -> dict[Any, tuple[Any, Optional[Exception]]]:
+        """
+        Выполняет запросы пачками через BatchHttpRequest.
+        requests: [(key, request)]; возвращает {key: (response, exception)}.
+        """
+        results: dict[Any, tuple[Any, Optional[Exception]]] = {}
+        for offset in range(0, len(requests), BATCH_LIMIT):
+            chunk = requests[offset:offset + BATCH_LIMIT]
+            keys = {str(i): key for i, (key, _) in enumerate(chunk)}
+
+            def callback(request_id, response, exception, keys=keys):
+                results[keys[request_id]] = (response, exception)
+
+            batch = svc.new_batch_http_request(callback=callback)
+            for i, (_, request) in enumerate(chunk):
+                batch.add(request, request_id=str(i))
+            logger.debug(f"Executing Calendar batch of {len(chunk)} request(s)")
+            await self._run(lambda batch=batch: batch.execute(http=self._thread_http()))
+        return results
+
+    async def upsert_slots(self, slots: Sequence[Slot]) -> dict[Slot, Union[str, Exception]]:
+        """
+        Массовый вариант upsert_slot_event для пересинхронизации многих слотов.
+        patch/insert/delete (и fallback-поиск list) группируются в batch-запросы.
+        Возвращает {slot: eventId или "" при удалении, либо исключение этого слота}.
+        """
+        slots = list(dict.fromkeys(slots))
+        logger.info(f"Upserting {len(slots)} slot event(s) in batch mode")
+        results: dict[Slot, Union[str, Exception]] = {}
+        bodies: dict[Slot, dict] = {}
+        stored: dict[Slot, str] = {}
+        deletes: list[tuple[Slot, Any]] = []
+        writes: list[tuple[Slot, Any]] = []
+
+        svc = await self._service()
+        events = svc.events()
+
+        for slot in slots:
+            used, body = await self._slot_body(*slot)
+            event_id = await self.repo.get_slot_event_id(*slot)
+            if used == 0:
+                results[slot] = ""
+                if event_id:
+                    deletes.append((slot, events.delete(calendarId=self.calendar_id, eventId=event_id)))
+                continue
+            bodies[slot] = body
+            if event_id:
+                stored[slot] = event_id
+                writes.append((slot, events.patch(calendarId=self.calendar_id, eventId=event_id, body=body)))
+            else:
+                writes.append((slot, events.insert(calendarId=self.calendar_id, body=body)))
+
+        # 1) delete/patch/insert по известным eventId
+        missing: list[Slot] = []
+        for slot, (response, exc) in (await self._execute_batch(svc, deletes + writes)).items():
+            if exc is None:
+                if slot in bodies:
+                    results[slot] = str(response["id"])
+            elif isinstance(exc, HttpError) and _is_gone(exc):
+                if slot in stored:
+                    logger.warning(f"Stored event {stored[slot]} for {slot} not found in calendar")
+                    missing.append(slot)
+                elif slot in bodies:
+                    # insert без eventId: 404/410 значит, что нет самого календаря
+                    results[slot] = exc
+                # delete уже удалённого события — успех, results[slot] == ""
+            else:
+                results[slot] = exc
+
+        # 2) fallback: события, пропавшие по сохранённому id, ищем через list и переписываем
+        if missing:
+            lists = []
+            for slot in missing:
+                time_min, time_max = parse_dt(slot[1], slot[2], self.tz)
+                lists.append((slot, events.list(
+                    calendarId=self.calendar_id,
+                    timeMin=time_min,
+                    timeMax=time_max,
+                    singleEvents=True,
+                    orderBy="startTime",
+                    maxResults=20,
+                )))
+            retries = []
+            for slot, (response, exc) in (await self._execute_batch(svc, lists)).items():
+                if exc is not None:
+                    results[slot] = exc
+                    continue
+                target = _match_slot_event(response.get("items", []), *slot, self.repo.services.name(slot[0]))
+                if target and target.get("id"):
+                    retries.append((slot, events.patch(
+                        calendarId=self.calendar_id, eventId=target["id"], body=bodies[slot]
+                    )))
+                else:
+                    retries.append((slot, events.insert(calendarId=self.calendar_id, body=bodies[slot])))
+            for slot, (response, exc) in (await self._execute_batch(svc, retries)).items():
+                results[slot] = exc if exc is not None else str(response["id"])
+
+        # 3) сохраняем сопоставление слот -> eventId одной транзакцией
+        await self.repo.save_slot_events(
+            upserted={
+                slot: result for slot, result in results.items()
+                if isinstance(result, str) and result and stored.get(slot) != result
+            },
+            deleted=[
+                slot for slot, _ in deletes
+                if not isinstance(results.get(slot), Exception)
+            ],
+        )
+
+        failed = sum(1 for r in results.values() if isinstance(r, Exception))
+        logger.info(f"Batch upsert finished: {len(results) - failed} ok, {failed} failed")
+        return results
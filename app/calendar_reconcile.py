@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.calendar_publisher import CalendarPublisher, Slot, SyncTokenExpired
+from app.keyboards import local_today
+from app.repo import Repo, ServiceRegistry
+
+logger = logging.getLogger(__name__)
+
+_USED_RE = re.compile(r"^Used: (\d+)/\d+$", re.MULTILINE)
+_SERVICE_RE = re.compile(r"^Service: (.+)$", re.MULTILINE)
+_SERVICE_ID_RE = re.compile(r"^Service ID: (\d+)$", re.MULTILINE)
+_SLOT_RE = re.compile(r"^Slot: (\d{2}\.\d{2}\.\d{4}) (\d{2}:\d{2})$", re.MULTILINE)
+
+
+def parse_slot_event(ev: dict, services: ServiceRegistry) -> Optional[tuple[Slot, int]]:
+    """
+    Достаёт (слот, used) из description события [RKBOOK]; None для чужих событий.
+    В старых событиях нет строки Service ID — услугу ищем по названию, а
+    событие услуги, которой уже нет под этим названием, пропускаем.
+    """
+    desc = ev.get("description") or ""
+    if not desc.startswith("[RKBOOK]"):
+        return None
+    slot = _SLOT_RE.search(desc)
+    used = _USED_RE.search(desc)
+    if not (slot and used):
+        return None
+    service_id = _SERVICE_ID_RE.search(desc)
+    if service_id:
+        found = services.by_id(int(service_id.group(1)))
+    else:
+        name = _SERVICE_RE.search(desc)
+        found = services.get(name.group(1)) if name else None
+    if found is None:
+        return None
+    return (found.id, slot.group(1), slot.group(2)), int(used.group(1))
+
+
+@dataclass
+class ReconcileReport:
+    full: bool = False
+    changed_events: int = 0
+    duplicates_deleted: int = 0
+    corrected: list[Slot] = field(default_factory=list)
+
+
+class CalendarReconciler:
+    """
+    Сверка календаря с SQLite (источник правды).
+
+    Изменения календаря тянутся инкрементально по syncToken, так что в
+    установившемся режиме это один дешёвый events.list. Затронутые слоты
+    сравниваются с занятостью из БД (один сгруппированный запрос), а
+    расхождения отправляются в calendar_outbox — исправлять их будет
+    обычный воркер синхронизации.
+    """
+
+    def __init__(self, repo: Repo, publisher: CalendarPublisher):
+        self.repo = repo
+        self.publisher = publisher
+        self._lock = asyncio.Lock()
+
+    async def reconcile(self) -> ReconcileReport:
+        async with self._lock:
+            return await self._reconcile()
+
+    async def _reconcile(self) -> ReconcileReport:
+        calendar_id = self.publisher.calendar_id
+        report = ReconcileReport()
+        token = await self.repo.get_calendar_sync_token(calendar_id)
+        report.full = token is None
+        try:
+            events, next_token = await self.publisher.list_changes(token)
+        except SyncTokenExpired:
+            logger.warning("Calendar sync token expired, running full reconciliation")
+            report.full = True
+            events, next_token = await self.publisher.list_changes(None)
+        report.changed_events = len(events)
+
+        known = await self.repo.get_slots_by_event_ids([ev["id"] for ev in events if ev.get("id")])
+        observed: dict[Slot, Optional[int]] = {}  # None — событие слота удалено из календаря
+        for ev in events:
+            event_id = ev.get("id")
+            slot = known.get(event_id)
+            if ev.get("status") == "cancelled":
+                if slot is not None:
+                    observed[slot] = None
+                continue
+            parsed = parse_slot_event(ev, self.repo.services)
+            if parsed is None:
+                continue
+            parsed_slot, used = parsed
+            if slot is None:
+                # событие [RKBOOK], которого нет в slot_events: дубль или след упавшего upsert
+                if await self.repo.get_slot_event_id(*parsed_slot):
+                    logger.info(f"Deleting duplicate calendar event {event_id} for {parsed_slot}")
+                    await self.publisher.delete_event(event_id)
+                    report.duplicates_deleted += 1
+                    continue
+                await self.repo.set_slot_event_id(*parsed_slot, event_id)
+                slot = parsed_slot
+            observed[slot] = used
+
+        occupancy = await self.repo.get_slot_occupancy(list(observed))
+        corrected = [
+            slot for slot, used in observed.items()
+            if (used is None and occupancy[slot] > 0) or (used is not None and used != occupancy[slot])
+        ]
+
+        if report.full:
+            # при полной сверке заодно ищем занятые слоты, для которых события нет вовсе
+            for slot in await self.repo.get_unmapped_busy_slots(local_today()):
+                if slot not in observed:
+                    corrected.append(slot)
+
+        await self.repo.enqueue_calendar_syncs(corrected)
+        await self.repo.set_calendar_sync_token(calendar_id, next_token)
+        report.corrected = corrected
+        logger.info(
+            f"Calendar reconciliation done (full={report.full}): {report.changed_events} changed event(s), "
+            f"{len(corrected)} slot(s) to fix, {report.duplicates_deleted} duplicate(s) deleted"
+        )
+        return report
+
+    async def run_periodic(self, interval: float) -> None:
+        logger.info(f"Calendar reconciliation scheduled every {interval}s")
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Calendar reconciliation failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
@@ -17,6 +17,37 @@ class Config:
     gcal_token_path: str
     tz: str  
 
+    db_read_pool_size: int = 3
+    settings_reload_seconds: float = 0
+    admin_cache_ttl_seconds: float = 60
+
+    gcal_service_account_path: str = ""
+    gcal_max_workers: int = 4
+    gcal_call_timeout: float = 30
+    calendar_reconcile_seconds: float = 900
+
+    fsm_storage: str = "sqlite"
+    fsm_session_ttl_seconds: float = 86400
+    fsm_cache_ttl_seconds: float = 300
+
+    hold_ttl_seconds: float = 300
+    hold_sweep_seconds: float = 30
+    booking_batch_size: int = 0
+    booking_batch_wait_ms: float = 2
+
+    webhook_url: str = ""
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_queue_size: int = 1000
+    webhook_workers: int = 8
+
+    outbound_global_rate: float = 25
+    outbound_chat_rate: float = 1
+    outbound_chat_burst: float = 3
+    admin_digest_seconds: float = 60
+
 def load_config() -> Config:
     load_dotenv()
     
@@ -33,6 +64,46 @@ def load_config() -> Config:
 
     tz = os.getenv("TZ", "Europe/Moscow").strip()
 
+    db_read_pool_size = int(os.getenv("DB_READ_POOL_SIZE", "3"))
+    # 0 = не перечитывать settings периодически (достаточно, если бот один)
+    settings_reload_seconds = float(os.getenv("SETTINGS_RELOAD_SECONDS", "0"))
+    admin_cache_ttl_seconds = float(os.getenv("ADMIN_CACHE_TTL_SECONDS", "60"))
+
+    gcal_service_account_path = os.getenv("GCAL_SERVICE_ACCOUNT_PATH", "").strip()
+    gcal_max_workers = int(os.getenv("GCAL_MAX_WORKERS", "4"))
+    gcal_call_timeout = float(os.getenv("GCAL_CALL_TIMEOUT", "30"))
+    # 0 = сверка календаря только по команде /reconcile
+    calendar_reconcile_seconds = float(os.getenv("CALENDAR_RECONCILE_SECONDS", "900"))
+
+    # sqlite = состояние сценария в базе (переживает рестарт), memory = в памяти процесса
+    fsm_storage = os.getenv("FSM_STORAGE", "sqlite").strip().lower()
+    fsm_session_ttl_seconds = float(os.getenv("FSM_SESSION_TTL_SECONDS", "86400"))
+    # при нескольких процессах бота держите кэш коротким (или 0)
+    fsm_cache_ttl_seconds = float(os.getenv("FSM_CACHE_TTL_SECONDS", "300"))
+
+    # сколько держится место за пользователем между выбором времени и подтверждением
+    hold_ttl_seconds = float(os.getenv("HOLD_TTL_SECONDS", "300"))
+    hold_sweep_seconds = float(os.getenv("HOLD_SWEEP_SECONDS", "30"))
+    # групповой коммит броней: до стольки подтверждений одной транзакцией (0 = выключен)
+    booking_batch_size = int(os.getenv("BOOKING_BATCH_SIZE", "0"))
+    booking_batch_wait_ms = float(os.getenv("BOOKING_BATCH_WAIT_MS", "2"))
+
+    # пустой WEBHOOK_URL = long polling
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip()
+    webhook_path = os.getenv("WEBHOOK_PATH", "/webhook").strip()
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    webhook_host = os.getenv("WEBHOOK_HOST", "0.0.0.0").strip()
+    webhook_port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    webhook_queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    webhook_workers = int(os.getenv("WEBHOOK_WORKERS", "8"))
+
+    # лимиты исходящих сообщений (Telegram: ~30/с на бота, ~1/с в один чат)
+    outbound_global_rate = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+    outbound_chat_rate = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+    outbound_chat_burst = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+    # уведомления админам копятся столько секунд и уходят одной сводкой (0 = сразу)
+    admin_digest_seconds = float(os.getenv("ADMIN_DIGEST_SECONDS", "60"))
+
     if not bot_token:
         logger.error("BOT_TOKEN is missing")
         raise RuntimeError("BOT_TOKEN is missing")
@@ -43,6 +114,9 @@ def load_config() -> Config:
         logger.error("GCAL_CALENDAR_ID is missing")
         raise RuntimeError("GCAL_CALENDAR_ID is missing")
 
+    if webhook_url and not webhook_secret:
+        logger.warning("WEBHOOK_SECRET is not set: webhook requests will not be authenticated")
+
     logger.debug(f"Config loaded: db_path={db_path}, tz={tz}, owner_admin_id={owner_admin_id}")
     logger.info("Configuration loaded successfully")
     
@@ -54,4 +128,29 @@ def load_config() -> Config:
         gcal_credentials_path=gcal_credentials_path,
         gcal_token_path=gcal_token_path,
         tz=tz,
+        db_read_pool_size=db_read_pool_size,
+        settings_reload_seconds=settings_reload_seconds,
+        admin_cache_ttl_seconds=admin_cache_ttl_seconds,
+        gcal_service_account_path=gcal_service_account_path,
+        gcal_max_workers=gcal_max_workers,
+        gcal_call_timeout=gcal_call_timeout,
+        calendar_reconcile_seconds=calendar_reconcile_seconds,
+        fsm_storage=fsm_storage,
+        fsm_session_ttl_seconds=fsm_session_ttl_seconds,
+        fsm_cache_ttl_seconds=fsm_cache_ttl_seconds,
+        hold_ttl_seconds=hold_ttl_seconds,
+        hold_sweep_seconds=hold_sweep_seconds,
+        booking_batch_size=booking_batch_size,
+        booking_batch_wait_ms=booking_batch_wait_ms,
+        webhook_url=webhook_url,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        webhook_host=webhook_host,
+        webhook_port=webhook_port,
+        webhook_queue_size=webhook_queue_size,
+        webhook_workers=webhook_workers,
+        outbound_global_rate=outbound_global_rate,
+        outbound_chat_rate=outbound_chat_rate,
+        outbound_chat_burst=outbound_chat_burst,
+        admin_digest_seconds=admin_digest_seconds,
     )
@@ -1,7 +1,11 @@
 import os
+from datetime import datetime
+from time import perf_counter
 import aiosqlite
 import logging
 
+from app.migrations import Migration, MigrationResult, add_column_if_missing, backfill, run_migrations
+
 logger = logging.getLogger(__name__)
 
 SCHEMA_SQL = """
@@ -16,13 +20,15 @@ CREATE TABLE IF NOT EXISTS bookings (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   created_at TEXT NOT NULL,          -- ISO datetime
   status TEXT NOT NULL,              -- active/cancelled
-  service TEXT NOT NULL,
+  service TEXT NOT NULL,             -- legacy: название услуги, читается только старыми версиями
   date TEXT NOT NULL,                -- dd.MM.yyyy
   time TEXT NOT NULL,                -- HH:mm
   name TEXT NOT NULL,
   phone TEXT NOT NULL,
   tg_user_id TEXT,
-  calendar_event_id TEXT             -- eventId from Google Calendar (for the slot event we manage)
+  calendar_event_id TEXT,            -- legacy: eventId слота, теперь хранится в slot_events
+  slot_at TEXT,                      -- начало слота 'YYYY-MM-DD HH:MM' (сортируемое)
+  service_id INTEGER REFERENCES services(id)
 );
 
 CREATE TABLE IF NOT EXISTS services (
@@ -41,8 +47,46 @@ CREATE TABLE IF NOT EXISTS admins (
   created_at TEXT NOT NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_bookings_slot
-ON bookings(service, date, time, status);
+-- материализованная занятость слотов: поддерживается в транзакциях
+-- create_booking/cancel_booking, пересобирается из bookings (REBUILD_OCCUPANCY_SQL)
+CREATE TABLE IF NOT EXISTS slot_occupancy (
+  service TEXT NOT NULL,
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  used INTEGER NOT NULL DEFAULT 0,
+  slot_at TEXT,                      -- 'YYYY-MM-DD HH:MM'
+  PRIMARY KEY (service, date, time)
+) WITHOUT ROWID;
+
+-- eventId витринного события слота в Google Calendar (аналог листа SlotEvents)
+CREATE TABLE IF NOT EXISTS slot_events (
+  service TEXT NOT NULL,
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  event_id TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (service, date, time)
+);
+
+-- syncToken для инкрементальной сверки с календарём (events.list)
+CREATE TABLE IF NOT EXISTS calendar_sync_state (
+  calendar_id TEXT PRIMARY KEY,
+  sync_token TEXT,
+  updated_at TEXT NOT NULL
+);
+
+-- очередь синхронизации слотов с Google Calendar: строка пишется в той же
+-- транзакции, что и бронь/отмена, фоновый воркер разбирает её по слотам
+CREATE TABLE IF NOT EXISTS calendar_outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  service TEXT NOT NULL,
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  created_at TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL DEFAULT 0,  -- unix time
+  last_error TEXT
+);
 
 CREATE INDEX IF NOT EXISTS idx_bookings_phone
 ON bookings(phone);
@@ -50,23 +94,497 @@ ON bookings(phone);
 CREATE INDEX IF NOT EXISTS idx_admins_user_id
 ON admins(tg_user_id);
 
+CREATE INDEX IF NOT EXISTS idx_calendar_outbox_due
+ON calendar_outbox(next_attempt_at);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_outbox_slot
+ON calendar_outbox(service, date, time);
+
 """
 
+# dd.MM.yyyy + HH:mm -> 'YYYY-MM-DD HH:MM' средствами SQLite (для бэкфилла и триггеров)
+SLOT_AT_SQL = "substr({d},7,4) || '-' || substr({d},4,2) || '-' || substr({d},1,2) || ' ' || {t}"
+
+# индексы по slot_at создаются миграцией 2, после добавления колонки в старые базы
+SLOT_AT_INDEXES_SQL = f"""
+CREATE INDEX IF NOT EXISTS idx_bookings_slot_at
+ON bookings(status, slot_at);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_service_slot_at
+ON bookings(service, status, slot_at);
+
+CREATE INDEX IF NOT EXISTS idx_slot_occupancy_slot_at
+ON slot_occupancy(service, slot_at, used);
+"""
+
+# страховка на время выката: старая версия бота не пишет slot_at. Ставится до
+# бэкфилла, иначе брони, записанные между последней пачкой и триггером, останутся без slot_at
+SLOT_AT_TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS trg_bookings_slot_at AFTER INSERT ON bookings
+WHEN NEW.slot_at IS NULL
+BEGIN
+  UPDATE bookings SET slot_at = {SLOT_AT_SQL.format(d="NEW.date", t="NEW.time")} WHERE id = NEW.id;
+END;
+"""
+
+# и брони (миграция 9), и слоты (миграция 10) ссылаются на services.id
+REBUILD_OCCUPANCY_SQL = (
+    "DELETE FROM slot_occupancy",
+    """
+    INSERT INTO slot_occupancy(service_id, date, time, used, slot_at)
+    SELECT service_id, date, time, COUNT(*), MAX(slot_at)
+    FROM bookings
+    WHERE status='active'
+    GROUP BY service_id, date, time
+    """,
+)
+
 DEFAULT_SETTINGS = {
-    "cap_padel_group": "3",
-    "cap_padel_ind": "1",
-    "cap_fitness": "10",
     "work_start_hour": "10",
     "work_end_hour": "22",
     "slot_minutes": "60",
 }
 
-async def init_db(db_path: str) -> None:
+async def _migrate_slot_events(db: aiosqlite.Connection) -> None:
+    """Перенос eventId, которые раньше копировались в каждую бронь слота."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    cursor = await db.execute(
+        """
+        INSERT OR IGNORE INTO slot_events(service, date, time, event_id, updated_at)
+        SELECT service, date, time, MAX(calendar_event_id), ?
+        FROM bookings
+        WHERE calendar_event_id IS NOT NULL
+        GROUP BY service, date, time
+        """,
+        (now,),
+    )
+    if cursor.rowcount:
+        logger.info(f"Migrated {cursor.rowcount} slot event id(s) into slot_events")
+
+
+async def _migrate_slot_at(db: aiosqlite.Connection) -> None:
+    """Перевод даты/времени слота в сортируемую колонку slot_at."""
+    await add_column_if_missing(db, "bookings", "slot_at", "TEXT")
+    await add_column_if_missing(db, "slot_occupancy", "slot_at", "TEXT")
+    await db.executescript(SLOT_AT_TRIGGER_SQL)
+
+    # частичные индексы по ещё не заполненным строкам, как в _migrate_bookings_service_id:
+    # без них каждая пачка заново сканирует таблицу с начала
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_slot_at_todo ON bookings(id) WHERE slot_at IS NULL")
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_slot_occupancy_slot_at_todo "
+        "ON slot_occupancy(service, date, time) WHERE slot_at IS NULL"
+    )
+    await db.commit()
+    total = await backfill(
+        db,
+        f"""
+        UPDATE bookings SET slot_at = {SLOT_AT_SQL.format(d="date", t="time")}
+        WHERE id IN (SELECT id FROM bookings WHERE slot_at IS NULL LIMIT ?)
+        """,
+    )
+    total += await backfill(
+        db,
+        f"""
+        UPDATE slot_occupancy SET slot_at = {SLOT_AT_SQL.format(d="date", t="time")}
+        WHERE (service, date, time) IN (
+          SELECT service, date, time FROM slot_occupancy WHERE slot_at IS NULL LIMIT ?
+        )
+        """,
+    )
+    if total:
+        logger.info(f"Backfilled slot_at for {total} row(s)")
+    await db.execute("DROP INDEX IF EXISTS idx_bookings_slot_at_todo")
+    await db.execute("DROP INDEX IF EXISTS idx_slot_occupancy_slot_at_todo")
+    await db.commit()
+
+    await db.executescript(SLOT_AT_INDEXES_SQL)
+
+
+async def _build_slot_occupancy(db: aiosqlite.Connection) -> None:
+    """Первый запуск с slot_occupancy на базе, где уже есть брони."""
+    cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM slot_occupancy)")
+    row = await cursor.fetchone()
+    if row[0]:
+        return
+    logger.info("Building slot_occupancy from existing bookings")
+    # на этой версии схемы service_id ещё нет — группируем по названию из брони
+    await db.execute(
+        """
+        INSERT INTO slot_occupancy(service, date, time, used, slot_at)
+        SELECT service, date, time, COUNT(*), MAX(slot_at)
+        FROM bookings
+        WHERE status='active'
+        GROUP BY service, date, time
+        """
+    )
+
+
+# индексы под keyset-пагинацию админского списка: ORDER BY created_at DESC, id DESC
+# без сортировки, в том числе с фильтром по статусу или услуге
+BOOKINGS_BROWSE_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_bookings_created
+ON bookings(created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_status_created
+ON bookings(status, created_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_service_created
+ON bookings(service, created_at, id);
+"""
+
+
+async def _create_browse_indexes(db: aiosqlite.Connection) -> None:
+    await db.executescript(BOOKINGS_BROWSE_INDEXES_SQL)
+
+
+def _phone_digits_sql(column: str) -> str:
+    """Телефон без оформления ('+7 (999) 123-45-67' -> '79991234567') средствами SQLite."""
+    expr = column
+    for ch in (" ", "+", "-", "(", ")", "."):
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+
+# полнотекстовый поиск по имени и цифрам телефона; trigram даёт и поиск по
+# началу имени, и по любому куску номера ("4567" найдёт +7 999 123-45-67)
+BOOKINGS_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS bookings_fts USING fts5(
+  name, phone_digits, tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_insert AFTER INSERT ON bookings
+BEGIN
+  INSERT INTO bookings_fts(rowid, name, phone_digits)
+  VALUES (NEW.id, NEW.name, {_phone_digits_sql("NEW.phone")});
+END;
+
+-- пока идёт бэкфилл, ещё не проиндексированные брони не трогаем: их заберёт бэкфилл
+CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_update AFTER UPDATE OF name, phone ON bookings
+WHEN EXISTS(SELECT 1 FROM bookings_fts WHERE rowid = OLD.id)
+BEGIN
+  DELETE FROM bookings_fts WHERE rowid = OLD.id;
+  INSERT INTO bookings_fts(rowid, name, phone_digits)
+  VALUES (NEW.id, NEW.name, {_phone_digits_sql("NEW.phone")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_delete AFTER DELETE ON bookings
+BEGIN
+  DELETE FROM bookings_fts WHERE rowid = OLD.id;
+END;
+"""
+
+
+async def _create_bookings_fts(db: aiosqlite.Connection) -> None:
+    """Индекс поиска броней: сначала триггеры (новые брони), затем бэкфилл истории по id."""
+    await db.executescript(BOOKINGS_FTS_SQL)
+    cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM bookings")
+    max_id = (await cursor.fetchone())[0]
+    total = await backfill(
+        db,
+        f"""
+        INSERT INTO bookings_fts(rowid, name, phone_digits)
+        SELECT id, name, {_phone_digits_sql("phone")}
+        FROM bookings
+        WHERE id > COALESCE((SELECT rowid FROM bookings_fts WHERE rowid <= ? ORDER BY rowid DESC LIMIT 1), 0)
+          AND id <= ?
+        ORDER BY id
+        LIMIT ?
+        """,
+        (max_id, max_id),
+    )
+    if total:
+        logger.info(f"Indexed {total} booking(s) for search")
+
+
+FSM_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS fsm_state (
+  key TEXT PRIMARY KEY,              -- StorageKey aiogram (bot:chat:user:destiny)
+  state TEXT,
+  data TEXT NOT NULL,                -- JSON
+  updated_at REAL NOT NULL           -- unix time, для удаления брошенных сессий
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_state_updated
+ON fsm_state(updated_at);
+"""
+
+
+async def _create_fsm_state(db: aiosqlite.Connection) -> None:
+    await db.executescript(FSM_STATE_SQL)
+
+
+SLOT_HOLDS_SQL = """
+CREATE TABLE IF NOT EXISTS slot_holds (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  service TEXT NOT NULL,
+  date TEXT NOT NULL,
+  time TEXT NOT NULL,
+  tg_user_id TEXT NOT NULL,
+  expires_at REAL NOT NULL           -- unix time
+);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_expires
+ON slot_holds(expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_slot
+ON slot_holds(service, date, time, expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_user
+ON slot_holds(tg_user_id);
+"""
+
+# held в slot_occupancy после пересборки из bookings (см. REBUILD_OCCUPANCY_SQL)
+REBUILD_HELD_SQL = f"""
+INSERT INTO slot_occupancy(service_id, date, time, used, held, slot_at)
+SELECT service_id, date, time, 0, COUNT(*), {SLOT_AT_SQL.format(d="date", t="time")}
+FROM slot_holds
+GROUP BY service_id, date, time
+ON CONFLICT(service_id, date, time) DO UPDATE SET held=excluded.held
+"""
+
+
+async def _create_slot_holds(db: aiosqlite.Connection) -> None:
+    """Временные холды слотов: таблица и счётчик held в slot_occupancy."""
+    await add_column_if_missing(db, "slot_occupancy", "held", "INTEGER NOT NULL DEFAULT 0")
+    await db.executescript(SLOT_HOLDS_SQL)
+
+
+# услуги до появления реестра: (название, старый ключ вместимости в settings, вместимость по умолчанию)
+DEFAULT_SERVICES = (
+    ("🏓 Падел (групповая)", "cap_padel_group", 3),
+    ("🏓 Падел (индивидуальная)", "cap_padel_ind", 1),
+    ("🏋️ Фитнес", "cap_fitness", 10),
+)
+
+
+async def _seed_services(db: aiosqlite.Connection) -> None:
+    """
+    Переносит захардкоженные услуги в таблицу services (вместимость — из settings, если её меняли).
+    Каждая услуга заводится по названию отдельно: уже существующие строки не трогаем,
+    но и не пропускаем из-за них остальные.
+    """
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    seeded = 0
+    for name, cap_key, default_capacity in DEFAULT_SERVICES:
+        cursor = await db.execute("SELECT value FROM settings WHERE key = ?", (cap_key,))
+        row = await cursor.fetchone()
+        capacity = int(row[0]) if row else default_capacity
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO services(name, capacity, enabled, created_at) VALUES(?, ?, 1, ?)",
+            (name, capacity, now),
+        )
+        seeded += cursor.rowcount
+    if seeded:
+        logger.info(f"Seeded {seeded} service(s) into services table")
+
+
+# страховка на время выката: старая версия бота пишет только название услуги.
+# Ставится до бэкфилла (как триггеры поиска в миграции 5); незнакомое название
+# заводится выключенной услугой, как при бэкфилле, чтобы service_id был у каждой брони
+BOOKINGS_SERVICE_ID_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_bookings_service_id AFTER INSERT ON bookings
+WHEN NEW.service_id IS NULL
+BEGIN
+  INSERT OR IGNORE INTO services(name, capacity, enabled, created_at)
+  VALUES (NEW.service, 1, 0, strftime('%Y-%m-%dT%H:%M:%S', 'now'));
+  UPDATE bookings SET service_id = (SELECT id FROM services WHERE name = NEW.service) WHERE id = NEW.id;
+END;
+"""
+
+# индексы броней по service_id вместо длинного названия услуги
+BOOKINGS_SERVICE_ID_SQL = """
+CREATE INDEX IF NOT EXISTS idx_bookings_service_id_slot
+ON bookings(service_id, date, time, status);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_service_id_slot_at
+ON bookings(service_id, status, slot_at);
+
+CREATE INDEX IF NOT EXISTS idx_bookings_service_id_created
+ON bookings(service_id, created_at, id);
+
+DROP INDEX IF EXISTS idx_bookings_slot;
+DROP INDEX IF EXISTS idx_bookings_service_slot_at;
+DROP INDEX IF EXISTS idx_bookings_service_created;
+"""
+
+
+async def _migrate_bookings_service_id(db: aiosqlite.Connection) -> None:
+    """Брони ссылаются на services.id; колонка service остаётся только для совместимости."""
+    await add_column_if_missing(db, "bookings", "service_id", "INTEGER REFERENCES services(id)")
+    await db.executescript(BOOKINGS_SERVICE_ID_TRIGGER_SQL)
+
+    # услуги, которых уже нет в services (удалены/переименованы), заводим выключенными,
+    # чтобы у каждой брони был service_id
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    cursor = await db.execute(
+        """
+        INSERT INTO services(name, capacity, enabled, created_at)
+        SELECT DISTINCT b.service, 1, 0, ?
+        FROM bookings b
+        WHERE b.service_id IS NULL AND NOT EXISTS (SELECT 1 FROM services s WHERE s.name = b.service)
+        """,
+        (now,),
+    )
+    if cursor.rowcount:
+        logger.info(f"Added {cursor.rowcount} disabled service(s) for orphaned booking names")
+    await db.commit()
+
+    # частичный индекс по ещё не заполненным строкам: без него каждая пачка
+    # заново сканирует таблицу с начала, и бэкфилл становится квадратичным
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_service_id_todo ON bookings(id) WHERE service_id IS NULL")
+    await db.commit()
+    total = await backfill(
+        db,
+        """
+        UPDATE bookings SET service_id = (SELECT id FROM services WHERE name = bookings.service)
+        WHERE id IN (SELECT id FROM bookings WHERE service_id IS NULL LIMIT ?)
+        """,
+    )
+    if total:
+        logger.info(f"Backfilled service_id for {total} booking(s)")
+    # контрольный проход: всё, что осталось без service_id, — по частичному индексу
+    cursor = await db.execute(
+        """
+        UPDATE bookings SET service_id = (SELECT id FROM services WHERE name = bookings.service)
+        WHERE service_id IS NULL
+        """
+    )
+    if cursor.rowcount:
+        logger.info(f"Swept service_id for {cursor.rowcount} late booking(s)")
+    await db.execute("DROP INDEX IF EXISTS idx_bookings_service_id_todo")
+    await db.commit()
+
+    await db.executescript(BOOKINGS_SERVICE_ID_SQL)
+
+
+# таблицы слотов с ключом по services.id: переименование услуги больше не трогает
+# слоты. SQLite не меняет первичный ключ на месте — таблицы пересоздаются
+SLOT_TABLES_BY_ID_SQL = """
+BEGIN;
+
+INSERT OR IGNORE INTO services(name, capacity, enabled, created_at)
+SELECT service, 1, 0, strftime('%Y-%m-%dT%H:%M:%S', 'now')
+FROM (
+  SELECT service FROM slot_occupancy UNION SELECT service FROM slot_holds
+  UNION SELECT service FROM slot_events UNION SELECT service FROM calendar_outbox
+);
+
+CREATE TABLE slot_occupancy_new (
+  service_id INTEGER NOT NULL REFERENCES services(id),
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  used INTEGER NOT NULL DEFAULT 0,
+  slot_at TEXT,                      -- 'YYYY-MM-DD HH:MM'
+  held INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (service_id, date, time)
+) WITHOUT ROWID;
+INSERT INTO slot_occupancy_new(service_id, date, time, used, slot_at, held)
+SELECT s.id, o.date, o.time, o.used, o.slot_at, o.held
+FROM slot_occupancy o JOIN services s ON s.name = o.service;
+DROP TABLE slot_occupancy;
+ALTER TABLE slot_occupancy_new RENAME TO slot_occupancy;
+
+CREATE TABLE slot_holds_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  service_id INTEGER NOT NULL REFERENCES services(id),
+  date TEXT NOT NULL,
+  time TEXT NOT NULL,
+  tg_user_id TEXT NOT NULL,
+  expires_at REAL NOT NULL           -- unix time
+);
+INSERT INTO slot_holds_new(id, service_id, date, time, tg_user_id, expires_at)
+SELECT h.id, s.id, h.date, h.time, h.tg_user_id, h.expires_at
+FROM slot_holds h JOIN services s ON s.name = h.service;
+DROP TABLE slot_holds;
+ALTER TABLE slot_holds_new RENAME TO slot_holds;
+
+CREATE TABLE slot_events_new (
+  service_id INTEGER NOT NULL REFERENCES services(id),
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  event_id TEXT NOT NULL,
+  updated_at TEXT NOT NULL,
+  PRIMARY KEY (service_id, date, time)
+);
+INSERT INTO slot_events_new(service_id, date, time, event_id, updated_at)
+SELECT s.id, e.date, e.time, e.event_id, e.updated_at
+FROM slot_events e JOIN services s ON s.name = e.service;
+DROP TABLE slot_events;
+ALTER TABLE slot_events_new RENAME TO slot_events;
+
+CREATE TABLE calendar_outbox_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  service_id INTEGER NOT NULL REFERENCES services(id),
+  date TEXT NOT NULL,                -- dd.MM.yyyy
+  time TEXT NOT NULL,                -- HH:mm
+  created_at TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL DEFAULT 0,  -- unix time
+  last_error TEXT
+);
+INSERT INTO calendar_outbox_new(id, service_id, date, time, created_at, attempts, next_attempt_at, last_error)
+SELECT o.id, s.id, o.date, o.time, o.created_at, o.attempts, o.next_attempt_at, o.last_error
+FROM calendar_outbox o JOIN services s ON s.name = o.service;
+DROP TABLE calendar_outbox;
+ALTER TABLE calendar_outbox_new RENAME TO calendar_outbox;
+
+CREATE INDEX IF NOT EXISTS idx_slot_occupancy_slot_at
+ON slot_occupancy(service_id, slot_at, used);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_expires
+ON slot_holds(expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_slot
+ON slot_holds(service_id, date, time, expires_at);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_user
+ON slot_holds(tg_user_id);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_outbox_due
+ON calendar_outbox(next_attempt_at);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_outbox_slot
+ON calendar_outbox(service_id, date, time);
+
+COMMIT;
+"""
+
+
+async def _key_slot_tables_by_service_id(db: aiosqlite.Connection) -> None:
+    """Слоты, холды, eventId и outbox ссылаются на services.id вместо названия."""
+    cursor = await db.execute("PRAGMA table_info(slot_holds)")
+    if "service_id" in {row[1] for row in await cursor.fetchall()}:
+        # скрипт атомарный: колонка есть — значит, пересборка уже закоммичена
+        return
+    await db.executescript(SLOT_TABLES_BY_ID_SQL)
+
+
+# Новые индексы/колонки/бэкфиллы добавляются сюда следующим номером, а не
+# в SCHEMA_SQL: CREATE ... IF NOT EXISTS не меняет уже существующие таблицы.
+# Базовая схема (SCHEMA_SQL) — версия 0.
+MIGRATIONS = (
+    Migration(1, "move calendar event ids into slot_events", _migrate_slot_events),
+    Migration(2, "add sortable slot_at column", _migrate_slot_at),
+    Migration(3, "build slot_occupancy from bookings", _build_slot_occupancy),
+    Migration(4, "add created_at indexes for bookings browser", _create_browse_indexes),
+    Migration(5, "add full-text search over booking name and phone", _create_bookings_fts),
+    Migration(6, "add fsm_state table for persistent FSM storage", _create_fsm_state),
+    Migration(7, "add temporary slot holds", _create_slot_holds),
+    Migration(8, "seed services table from hardcoded services", _seed_services),
+    Migration(9, "reference services by id from bookings", _migrate_bookings_service_id),
+    Migration(10, "key slot tables by service id", _key_slot_tables_by_service_id),
+)
+
+
+async def init_db(db_path: str) -> list[MigrationResult]:
+    """Создаёт базовую схему и применяет недостающие миграции; возвращает время шагов."""
     logger.info(f"Initializing database at {db_path}")
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
     async with aiosqlite.connect(db_path) as db:
         logger.debug("Executing database schema")
+        started = perf_counter()
         await db.executescript(SCHEMA_SQL)
 
         # seed defaults if missing
@@ -76,7 +594,10 @@ async def init_db(db_path: str) -> None:
                 (k, v),
             )
             logger.debug(f"Set default setting: {k}={v}")
-
         await db.commit()
+        results = [MigrationResult(0, "base schema", perf_counter() - started)]
+
+        results += await run_migrations(db, MIGRATIONS)
     
-    logger.info("Database initialization completed")
+    logger.info(f"Database initialization completed (schema version {MIGRATIONS[-1].version})")
+    return results
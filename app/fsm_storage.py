@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = 0.0      # monotonic: когда запись читали/писали (для cache_ttl)
+    updated_at: float = 0.0     # unix time последнего изменения (для session_ttl)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в той же SQLite-базе (таблица fsm_state).
+
+    Переживает рестарт: недописанная бронь продолжится с того же шага.
+    Чтения идут через кэш в памяти (запись считается свежей cache_ttl секунд;
+    если бот запущен в нескольких процессах, cache_ttl надо держать малым).
+    Записи только помечают ключ грязным — фоновая задача через flush_delay
+    пишет все накопившиеся ключи одной транзакцией, так что несколько
+    update_data за один шаг сценария превращаются в одну запись на диск.
+    Сессии, не менявшиеся session_ttl секунд, удаляются.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        session_ttl: float = 24 * 3600,
+        cache_ttl: float = 300.0,
+        flush_delay: float = 0.05,
+        sweep_interval: float = 600.0,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.db_path = db_path
+        self.session_ttl = session_ttl
+        self.cache_ttl = cache_ttl
+        self.flush_delay = flush_delay
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+        self._db: Optional[aiosqlite.Connection] = None
+        self._cache: dict[str, _Record] = {}
+        self._dirty: set[str] = set()
+        self._dirty_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def open(self) -> None:
+        self._db = await aiosqlite.connect(self.db_path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA busy_timeout=5000")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"SQLite FSM storage opened (session_ttl={self.session_ttl}s, cache_ttl={self.cache_ttl}s)")
+
+    async def close(self) -> None:
+        # вызывается и из main, и из shutdown dispatcher'а
+        if self._task is not None:
+            # не cancel(): отмена wait_for в момент set() события теряется (py3.11)
+            self._closing = True
+            self._dirty_event.set()
+            await self._task
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            await self._db.close()
+            self._db = None
+            logger.info("SQLite FSM storage closed")
+
+    async def _record(self, key: StorageKey) -> _Record:
+        k = self.key_builder.build(key)
+        record = self._cache.get(k)
+        if record is not None and (k in self._dirty or time.monotonic() - record.loaded_at < self.cache_ttl):
+            if record.updated_at and time.time() - record.updated_at >= self.session_ttl:
+                record.state, record.data = None, {}
+            return record
+
+        stale_loaded_at = record.loaded_at if record is not None else None
+        cursor = await self._db.execute("SELECT state, data, updated_at FROM fsm_state WHERE key = ?", (k,))
+        row = await cursor.fetchone()
+        # пока ждали SELECT, соседний апдейт мог загрузить или изменить этот ключ:
+        # его запись новее прочитанной строки, иначе его изменения потеряются
+        current = self._cache.get(k)
+        if current is not None and (current is not record or current.loaded_at != stale_loaded_at):
+            return current
+        record = _Record(loaded_at=time.monotonic())
+        if row is not None and time.time() - row[2] < self.session_ttl:
+            record.state = row[0]
+            record.data = json.loads(row[1])
+            record.updated_at = row[2]
+        self._cache[k] = record
+        return record
+
+    def _touch(self, key: StorageKey, record: _Record) -> None:
+        record.loaded_at = time.monotonic()
+        record.updated_at = time.time()
+        self._dirty.add(self.key_builder.build(key))
+        self._dirty_event.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = dict(data)
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def flush(self) -> None:
+        """Пишет все изменённые ключи одной транзакцией; пустые сессии удаляются."""
+        if not self._dirty or self._db is None:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for k in keys:
+            record = self._cache[k]
+            if record.state is None and not record.data:
+                deletes.append((k,))
+            else:
+                upserts.append((k, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at))
+        try:
+            if upserts:
+                await self._db.executemany(
+                    """
+                    INSERT INTO fsm_state(key, state, data, updated_at) VALUES(?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                      state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                    """,
+                    upserts,
+                )
+            if deletes:
+                await self._db.executemany("DELETE FROM fsm_state WHERE key = ?", deletes)
+            await self._db.commit()
+        except BaseException:
+            # не теряем изменения (в т.ч. при отмене задачи посреди записи): попробуем записать на следующем проходе
+            self._dirty |= keys
+            raise
+        logger.debug(f"FSM storage flushed {len(upserts)} key(s), cleared {len(deletes)}")
+
+    async def sweep(self) -> int:
+        """Удаляет брошенные сессии из базы и кэша."""
+        deadline = time.time() - self.session_ttl
+        cursor = await self._db.execute("DELETE FROM fsm_state WHERE updated_at < ?", (deadline,))
+        await self._db.commit()
+        now = time.monotonic()
+        for k in [k for k, r in self._cache.items() if k not in self._dirty and now - r.loaded_at >= self.cache_ttl]:
+            del self._cache[k]
+        if cursor.rowcount:
+            logger.info(f"Expired {cursor.rowcount} abandoned FSM session(s)")
+        return cursor.rowcount
+
+    async def _run(self) -> None:
+        next_sweep = time.monotonic()
+        while not self._closing:
+            try:
+                if time.monotonic() >= next_sweep:
+                    await self.sweep()
+                    next_sweep = time.monotonic() + self.sweep_interval
+                try:
+                    await asyncio.wait_for(self._dirty_event.wait(), self.sweep_interval)
+                except asyncio.TimeoutError:
+                    continue
+                if self._closing:
+                    break
+                # ждём flush_delay, чтобы собрать все записи текущего шага сценария
+                await asyncio.sleep(self.flush_delay)
+                self._dirty_event.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"FSM storage flush failed: {e}", exc_info=True)
+                await asyncio.sleep(1.0)
+                if self._dirty:
+                    self._dirty_event.set()
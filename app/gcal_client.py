@@ -3,8 +3,10 @@ from __future__ import annotations
 import json
 import os
 import logging
-from typing import Any
+from typing import Any, Optional
 
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
@@ -13,8 +15,21 @@ logger = logging.getLogger(__name__)
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
-def get_calendar_service(credentials_path: str, token_path: str):
-    logger.info("Getting Google Calendar service")
+
+def load_credentials(credentials_path: str, token_path: str, service_account_path: str = ""):
+    """
+    Загружает учётные данные Calendar API.
+
+    Если задан service_account_path — используется сервисный аккаунт (для
+    headless-деплоя, без браузера). Иначе — OAuth токен пользователя из
+    token_path, а при его отсутствии интерактивная авторизация.
+    """
+    if service_account_path:
+        logger.info(f"Loading service account credentials from {service_account_path}")
+        creds = service_account.Credentials.from_service_account_file(service_account_path, scopes=SCOPES)
+        refresh_credentials(creds, token_path=None)
+        return creds
+
     creds = None
 
     if os.path.exists(token_path):
@@ -26,22 +41,40 @@ def get_calendar_service(credentials_path: str, token_path: str):
     if not creds or not creds.valid:
         # refresh если можно
         if creds and creds.expired and creds.refresh_token:
-            logger.info("Refreshing expired credentials")
-            from google.auth.transport.requests import Request
-            creds.refresh(Request())
-            logger.info("Credentials refreshed successfully")
+            refresh_credentials(creds, token_path)
         else:
             # первый раз: интерактивная авторизация в браузере
             logger.info("Initiating OAuth2 flow for first-time authorization")
             flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
             creds = flow.run_local_server(port=0)
             logger.info("OAuth2 authorization completed")
+            _save_token(creds, token_path)
+
+    return creds
+
 
-        os.makedirs(os.path.dirname(token_path) or ".", exist_ok=True)
-        logger.debug(f"Saving credentials to token file: {token_path}")
-        with open(token_path, "w", encoding="utf-8") as f:
-            f.write(creds.to_json())
-        logger.debug("Credentials saved successfully")
+def refresh_credentials(creds: Any, token_path: Optional[str]) -> None:
+    """Обновляет access token; для пользовательского OAuth сохраняет его в token_path."""
+    logger.info("Refreshing credentials")
+    creds.refresh(Request())
+    logger.info(f"Credentials refreshed successfully, expiry={creds.expiry}")
+    if token_path and isinstance(creds, Credentials):
+        _save_token(creds, token_path)
 
+
+def _save_token(creds: Credentials, token_path: str) -> None:
+    os.makedirs(os.path.dirname(token_path) or ".", exist_ok=True)
+    logger.debug(f"Saving credentials to token file: {token_path}")
+    with open(token_path, "w", encoding="utf-8") as f:
+        f.write(creds.to_json())
+    logger.debug("Credentials saved successfully")
+
+
+def build_service(creds: Any):
     logger.info("Google Calendar service initialized")
     return build("calendar", "v3", credentials=creds, cache_discovery=False)
+
+
+def get_calendar_service(credentials_path: str, token_path: str, service_account_path: str = ""):
+    logger.info("Getting Google Calendar service")
+    return build_service(load_credentials(credentials_path, token_path, service_account_path))
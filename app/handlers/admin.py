@@ -1,24 +1,31 @@
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from datetime import timedelta
 import logging
+from typing import Optional
 
 from app.states import AdminFlow
-from app.keyboards import admin_main_kb, admin_manage_kb, cancel_kb
-from app.config import load_config
-from app.repo import Repo
+from app.keyboards import admin_main_kb, admin_manage_kb, admin_bookings_kb, cancel_kb, local_today
+from app.repo import BookingFilter, Repo, SEARCH_MIN_TERM
+from app.calendar_reconcile import CalendarReconciler
+from app.notifier import AdminNotifier
+from app.outbound import MessageScheduler
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
-# Load config and repo at module level (singleton pattern)
-config = load_config()
-repo = Repo(config.db_path)
+BOOKINGS_PAGE_SIZE = 10
 
+# переключатели фильтров списка броней: значение -> подпись на кнопке
+STATUS_FILTERS = [(None, "все"), ("active", "активные"), ("cancelled", "отменённые")]
+# период по дате слота: сколько дней от сегодня (None — без ограничения)
+PERIOD_FILTERS = [(None, "все даты"), (0, "сегодня"), (6, "7 дней"), (29, "30 дней")]
 
-async def check_admin_access(user_id: int, is_owner_only: bool = False) -> bool:
+
+async def check_admin_access(repo: Repo, user_id: int, is_owner_only: bool = False) -> bool:
     """Check if user has admin access"""
     user_id_str = str(user_id)
     if is_owner_only:
@@ -27,18 +34,19 @@ async def check_admin_access(user_id: int, is_owner_only: bool = False) -> bool:
 
 
 @router.message(Command("admin"))
-async def cmd_admin(message: Message, state: FSMContext):
+async def cmd_admin(message: Message, state: FSMContext, repo: Repo):
     user_id = message.from_user.id
     
     logger.info(f"User {user_id} accessed /admin command")
     
     # Check if admin
-    if not await check_admin_access(user_id):
+    role = await repo.get_admin_role(str(user_id))
+    if role is None:
         logger.warning(f"User {user_id} tried to access admin panel without permissions")
         await message.answer("❌ У вас нет доступа к админ-панели")
         return
     
-    is_owner = await check_admin_access(user_id, is_owner_only=True)
+    is_owner = role == "owner"
     logger.debug(f"User {user_id} is_owner: {is_owner}")
     
     await state.set_state(AdminFlow.main_menu)
@@ -48,37 +56,326 @@ async def cmd_admin(message: Message, state: FSMContext):
     )
 
 
+@router.message(Command("reconcile"))
+async def cmd_reconcile(message: Message, repo: Repo, reconciler: CalendarReconciler):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    logger.info(f"User {user_id} started calendar reconciliation")
+    try:
+        report = await reconciler.reconcile()
+    except Exception as e:
+        logger.error(f"Calendar reconciliation failed: {e}", exc_info=True)
+        await message.answer(f"⚠️ Сверка с календарём не удалась: {e}")
+        return
+
+    await message.answer(
+        "🔄 Сверка с календарём завершена\n\n"
+        f"Режим: {'полный' if report.full else 'инкрементальный'}\n"
+        f"Изменённых событий: {report.changed_events}\n"
+        f"Слотов к исправлению: {len(report.corrected)}\n"
+        f"Удалено дублей: {report.duplicates_deleted}"
+    )
+
+
+@router.message(Command("rebuild_occupancy"))
+async def cmd_rebuild_occupancy(message: Message, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id, is_owner_only=True):
+        await message.answer("❌ Только владелец может пересчитать занятость слотов")
+        return
+
+    logger.info(f"User {user_id} started slot occupancy rebuild")
+    slots = await repo.rebuild_slot_occupancy()
+    await message.answer(f"✅ Занятость слотов пересчитана из записей: {slots} слотов")
+
+
+@router.message(Command("holds"))
+async def cmd_holds(message: Message, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    stats = repo.hold_stats
+    logger.info(f"User {user_id} requested slot hold stats: {stats}")
+    await message.answer(
+        "⏳ Холды слотов (с момента запуска)\n\n"
+        f"Поставлено: {stats.placed}\n"
+        f"Стали бронями: {stats.converted}\n"
+        f"Отменены/заменены: {stats.released}\n"
+        f"Истекли: {stats.expired}\n"
+        f"Конверсия: {stats.conversion_rate:.0%}\n\n"
+        f"Отказов на выборе времени (слот полон): {stats.rejected}\n"
+        f"Предотвращено повторов после SlotFullError: {stats.retries_avoided}"
+    )
+
+
+@router.message(Command("queue"))
+async def cmd_queue(message: Message, repo: Repo, outbound: MessageScheduler, notifier: AdminNotifier):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    stats = outbound.stats
+    by_priority = outbound.depth_by_priority()
+    logger.info(f"User {user_id} requested outbound queue stats: depth={outbound.depth()}, {stats}")
+    text = (
+        "📤 Очередь исходящих сообщений\n\n"
+        f"В очереди: {outbound.depth()} "
+        f"(клиентам: {by_priority['USER']}, админам: {by_priority['ADMIN']})\n"
+        f"Максимум с запуска: {stats.max_depth}\n\n"
+        f"Отправлено: {stats.sent}\n"
+        f"Повторов (RetryAfter/сеть): {stats.retried}\n"
+        f"Не доставлено: {stats.dropped}\n\n"
+        f"Уведомления админам: событий {notifier.stats.events}, "
+        f"сводок {notifier.stats.digests}, сообщений {notifier.stats.messages}"
+    )
+    writer = repo.writer_stats
+    if writer.batches:
+        text += (
+            f"\n\nГрупповой коммит броней: пачек {writer.batches}, броней {writer.bookings}, "
+            f"слот полон {writer.rejected}, в среднем {writer.avg_batch:.1f} на пачку (максимум {writer.max_batch})"
+        )
+    await message.answer(text)
+
+
+@router.message(Command("service_add"))
+async def cmd_service_add(message: Message, command: CommandObject, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    capacity, _, name = (command.args or "").strip().partition(" ")
+    name = name.strip()
+    if not capacity.isdigit() or int(capacity) < 1 or not name:
+        await message.answer("Использование: /service_add <вместимость> <название>")
+        return
+    if repo.services.get(name) is not None:
+        await message.answer(f"❌ Услуга «{name}» уже есть")
+        return
+
+    service_id = await repo.add_service(name, int(capacity))
+    logger.info(f"User {user_id} added service {service_id}: {name} (capacity {capacity})")
+    await message.answer(f"✅ Услуга «{name}» добавлена (id {service_id}, вместимость {capacity})")
+
+
+@router.message(Command("service_cap"))
+async def cmd_service_cap(message: Message, command: CommandObject, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    args = (command.args or "").split()
+    if len(args) != 2 or not all(a.isdigit() for a in args) or int(args[1]) < 1:
+        await message.answer("Использование: /service_cap <id> <вместимость>")
+        return
+    service = repo.services.by_id(int(args[0]))
+    if service is None:
+        await message.answer("❌ Услуга не найдена")
+        return
+
+    await repo.update_service(service.id, capacity=int(args[1]))
+    logger.info(f"User {user_id} changed capacity of service {service.id}: {service.capacity} -> {args[1]}")
+    await message.answer(f"✅ {service.name}: вместимость {service.capacity} → {args[1]}")
+
+
+@router.message(Command("service_toggle"))
+async def cmd_service_toggle(message: Message, command: CommandObject, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    arg = (command.args or "").strip()
+    service = repo.services.by_id(int(arg)) if arg.isdigit() else None
+    if service is None:
+        await message.answer("Использование: /service_toggle <id>")
+        return
+
+    await repo.set_service_enabled(service.id, not service.enabled)
+    logger.info(f"User {user_id} set service {service.id} enabled={not service.enabled}")
+    state_text = "выключена — её больше не видно при записи" if service.enabled else "включена"
+    await message.answer(f"✅ {service.name}: {state_text}")
+
+
+@router.message(Command("upcoming"))
+async def cmd_upcoming(message: Message, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    today = local_today()
+    bookings = await repo.get_bookings_in_range(today, today + timedelta(days=6), limit=30)
+    logger.info(f"User {user_id} requested upcoming bookings: {len(bookings)} found")
+
+    text = "📅 Записи на ближайшие 7 дней:\n\n"
+    for b in bookings:
+        text += f"{b.date} {b.time} — {b.service}\n"
+        text += f"  ID {b.id}: {b.name} ({b.phone})\n"
+    if not bookings:
+        text += "Записей нет"
+    await message.answer(text)
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, repo: Repo):
+    user_id = message.from_user.id
+    if not await check_admin_access(repo, user_id):
+        await message.answer("❌ У вас нет доступа к админ-панели")
+        return
+
+    query = (command.args or "").strip()
+    if len(query) < SEARCH_MIN_TERM:
+        await message.answer(
+            "🔎 Поиск записи по имени или части телефона:\n"
+            "/search Иван\n/search 4567\n/search Иван 999\n\n"
+            f"Минимум {SEARCH_MIN_TERM} символа в слове"
+        )
+        return
+
+    bookings = await repo.search_bookings(query, limit=20)
+    logger.info(f"User {user_id} searched bookings for {query!r}: {len(bookings)} found")
+
+    text = f"🔎 Результаты по запросу «{query}»:\n\n"
+    for b in bookings:
+        status_emoji = "✅" if b.status == "active" else "❌"
+        text += f"{status_emoji} ID {b.id}: {b.name} ({b.phone})\n"
+        text += f"  {b.service} {b.date} {b.time}\n\n"
+    if not bookings:
+        text += "Ничего не найдено"
+    await message.answer(text)
+
+
+def _next_option(options: list, current):
+    values = [o[0] if isinstance(o, tuple) else o for o in options]
+    if current not in values:
+        # например, услугу удалили, пока открыт список
+        return values[0]
+    return values[(values.index(current) + 1) % len(values)]
+
+
+def _service_label(repo: Repo, service_id: Optional[int]) -> str:
+    service = repo.services.by_id(service_id) if service_id is not None else None
+    return service.name if service is not None else "все"
+
+
+def _booking_filter(bk: dict) -> BookingFilter:
+    days = bk["period"]
+    today = local_today()
+    return BookingFilter(
+        service_id=bk["service"],
+        status=bk["status"],
+        date_from=today if days is not None else None,
+        date_to=today + timedelta(days=days) if days is not None else None,
+    )
+
+
+async def show_bookings_page(call: CallbackQuery, state: FSMContext, repo: Repo, direction: str = "") -> None:
+    """
+    Страница списка броней. Ключи первой/последней брони страницы лежат в FSM,
+    следующая/предыдущая страница ищется от них (keyset-пагинация в Repo).
+    """
+    bk = (await state.get_data())["bk"]
+    after = before = None
+    if direction == "next" and bk["last"]:
+        after = tuple(bk["last"])
+    elif direction == "prev" and bk["first"]:
+        before = tuple(bk["first"])
+
+    page = await repo.browse_bookings(_booking_filter(bk), after=after, before=before, limit=BOOKINGS_PAGE_SIZE)
+    if before is not None and not page.has_prev:
+        # вернулись к началу списка
+        page = await repo.browse_bookings(_booking_filter(bk), limit=BOOKINGS_PAGE_SIZE)
+        bk["page"] = 1
+    else:
+        bk["page"] = bk["page"] + 1 if after else bk["page"] - 1 if before else 1
+    bk["first"], bk["last"] = page.first, page.last
+    await state.update_data(bk=bk)
+
+    text = f"📋 Записи, страница {bk['page']}\n\n"
+    for b in page.bookings:
+        status_emoji = "✅" if b.status == "active" else "❌"
+        text += f"{status_emoji} ID {b.id}: {b.name} ({b.phone})\n"
+        text += f"  {b.service} {b.date} {b.time}\n\n"
+    if not page.bookings:
+        text += "Записей не найдено"
+
+    await call.message.edit_text(
+        text,
+        reply_markup=admin_bookings_kb(
+            status_label=dict(STATUS_FILTERS)[bk["status"]],
+            period_label=dict(PERIOD_FILTERS)[bk["period"]],
+            service_label=_service_label(repo, bk["service"]),
+            has_prev=page.has_prev,
+            has_next=page.has_next,
+        ),
+    )
+
+
 @router.callback_query(AdminFlow.main_menu, F.data == "manage_bookings")
-async def manage_bookings_menu(call: CallbackQuery, state: FSMContext):
+async def manage_bookings_menu(call: CallbackQuery, state: FSMContext, repo: Repo):
     user_id = call.from_user.id
     
-    if not await check_admin_access(user_id):
+    if not await check_admin_access(repo, user_id):
         await call.answer("❌ Доступ запрещен", show_alert=True)
         return
     
     logger.info(f"User {user_id} opened bookings management")
     await state.set_state(AdminFlow.manage_bookings)
-    
-    bookings = await repo.get_all_bookings(limit=50)
-    text = f"📋 Всего записей: {len(bookings)}\n\n"
-    
-    for b in bookings[:10]:  # Show first 10
-        status_emoji = "✅" if b.status == "active" else "❌"
-        text += f"{status_emoji} ID {b.id}: {b.name} ({b.phone})\n"
-        text += f"  {b.service} {b.date} {b.time}\n\n"
-    
-    if len(bookings) > 10:
-        text += f"... и еще {len(bookings) - 10} записей"
-    
-    await call.message.edit_text(text, reply_markup=cancel_kb())
+    await state.update_data(bk={"status": None, "period": None, "service": None, "page": 1, "first": None, "last": None})
+
+    await show_bookings_page(call, state, repo)
+    await call.answer()
+
+
+@router.callback_query(AdminFlow.manage_bookings, F.data.startswith("bk:"))
+async def browse_bookings(call: CallbackQuery, state: FSMContext, repo: Repo):
+    user_id = call.from_user.id
+
+    if not await check_admin_access(repo, user_id):
+        await call.answer("❌ Доступ запрещен", show_alert=True)
+        return
+
+    action = call.data.split(":", 1)[1]
+    logger.debug(f"User {user_id} bookings browser action: {action}")
+
+    if action in ("next", "prev"):
+        await show_bookings_page(call, state, repo, direction=action)
+        await call.answer()
+        return
+
+    # смена фильтра — список начинается заново с первой страницы
+    bk = (await state.get_data())["bk"]
+    if action == "status":
+        bk["status"] = _next_option(STATUS_FILTERS, bk["status"])
+    elif action == "period":
+        bk["period"] = _next_option(PERIOD_FILTERS, bk["period"])
+    elif action == "service":
+        # все услуги реестра, включая выключенные: по ним тоже есть история
+        service_ids = [s.id for s in sorted(repo.services, key=lambda s: s.name)]
+        bk["service"] = _next_option([None, *service_ids], bk["service"])
+    else:
+        logger.warning(f"Unknown bookings browser action: {action}")
+        await call.answer()
+        return
+    await state.update_data(bk=bk)
+
+    await show_bookings_page(call, state, repo)
     await call.answer()
 
 
 @router.callback_query(AdminFlow.main_menu, F.data == "manage_services")
-async def manage_services_menu(call: CallbackQuery, state: FSMContext):
+async def manage_services_menu(call: CallbackQuery, state: FSMContext, repo: Repo):
     user_id = call.from_user.id
     
-    if not await check_admin_access(user_id):
+    if not await check_admin_access(repo, user_id):
         await call.answer("❌ Доступ запрещен", show_alert=True)
         return
     
@@ -90,20 +387,27 @@ async def manage_services_menu(call: CallbackQuery, state: FSMContext):
     
     for service_id, name, capacity, enabled in services:
         status = "✅" if enabled else "❌"
-        text += f"{status} {name} (вместимость: {capacity})\n"
+        text += f"{status} [{service_id}] {name} (вместимость: {capacity})\n"
     
     if not services:
         text += "Услуги не добавлены"
+
+    text += (
+        "\n\nИзменения применяются сразу, без перезапуска:\n"
+        "/service_add <вместимость> <название>\n"
+        "/service_cap <id> <вместимость>\n"
+        "/service_toggle <id> — включить/выключить"
+    )
     
     await call.message.edit_text(text, reply_markup=cancel_kb())
     await call.answer()
 
 
 @router.callback_query(AdminFlow.main_menu, F.data == "manage_admins")
-async def manage_admins_menu(call: CallbackQuery, state: FSMContext):
+async def manage_admins_menu(call: CallbackQuery, state: FSMContext, repo: Repo):
     user_id = call.from_user.id
     
-    if not await check_admin_access(user_id, is_owner_only=True):
+    if not await check_admin_access(repo, user_id, is_owner_only=True):
         logger.warning(f"User {user_id} tried to access admin management without owner permissions")
         await call.answer("❌ Только владелец может управлять админами", show_alert=True)
         return
@@ -1,57 +1,85 @@
-from datetime import date, timedelta
+from datetime import timedelta
+from typing import Optional, Union
 import logging
 
-from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.fsm.context import FSMContext
 
 from app.states import BookingFlow
-from app.keyboards import services_kb, date_kb, time_kb, confirm_kb, week_picker_kb
+from app.keyboards import services_kb, date_kb, time_kb, confirm_kb, week_picker_kb, week_page_range, local_today
 from app.texts import (
-    ASK_SERVICE, ASK_DATE, ASK_TIME, ASK_NAME, ASK_PHONE,
+    ASK_SERVICE, ASK_DATE, ASK_TIME, ASK_NAME, ASK_PHONE, SERVICE_GONE,
     CONFIRM_TEMPLATE, BOOKED_USER, CANCELLED
 )
-from app.config import load_config
+from app.config import Config
+from app.notifier import AdminNotifier
+from app.outbound import MessageScheduler, Priority
 
-from app.repo import Repo, SlotFullError
-from app.calendar_publisher import CalendarPublisher
+from app.repo import Repo, Service, SlotFullError
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
-# Для демо можно держать singleton'ы на процесс (как у тебя было)
-config = load_config()
-repo = Repo(config.db_path)
-publisher = CalendarPublisher(
-    repo=repo,
-    calendar_id=config.gcal_calendar_id,
-    credentials_path=config.gcal_credentials_path,
-    token_path=config.gcal_token_path,
-    tz=config.tz,
-)
+# repo/config приходят из dispatcher'а (dp["repo"] и т.д., см. main.py):
+# пул соединений Repo открывается один раз на старте.
 
-SERVICE_LABELS = {
-    "paddle_group": "🏓 Падел (групповая)",
-    "paddle_ind": "🏓 Падел (индивидуальная)",
-    "fitness": "🏋️ Фитнес",
-}
+WEEKS_AHEAD = 3
 
 
-async def show_available_times(message, state: FSMContext):
+async def selected_service(event: Union[Message, CallbackQuery], state: FSMContext, repo: Repo) -> Optional[Service]:
+    """
+    Услуга из FSM по service_id. Если её выключили или удалили, пока
+    пользователь шёл по шагам (или в состоянии осталось название из старой
+    версии бота), снимаем холд и заново предлагаем выбрать услугу.
+    """
+    data = await state.get_data()
+    if "service_id" in data:
+        service = repo.services.by_id(data["service_id"])
+    else:
+        service = repo.services.get(data.get("service", ""))
+    if service is not None and service.enabled:
+        return service
+
+    logger.info(f"Stale service in FSM for user {event.from_user.id}: {data.get('service_id', data.get('service'))}")
+    if data.get("hold_id") is not None:
+        await repo.release_hold(data["hold_id"])
+    await state.clear()
+    await state.set_state(BookingFlow.service)
+    markup = services_kb(repo.services.enabled)
+    if isinstance(event, CallbackQuery):
+        await event.message.edit_text(SERVICE_GONE, reply_markup=markup)
+        await event.answer()
+    else:
+        await event.answer(SERVICE_GONE, reply_markup=markup)
+    return None
+
+
+async def week_picker(repo: Repo, service: Service, page: int = 0) -> InlineKeyboardMarkup:
+    """Недельный календарь с бейджами занятости: одна выборка на всю страницу."""
+    date_from, date_to = week_page_range(page, WEEKS_AHEAD)
+    availability = await repo.get_availability_range(service.id, date_from, date_to)
+    free_slots = {
+        day: sum(1 for free in slots.values() if free > 0)
+        for day, slots in availability.items()
+    }
+    return week_picker_kb(page=page, weeks_ahead=WEEKS_AHEAD, free_slots=free_slots)
+
+
+async def show_available_times(message, state: FSMContext, repo: Repo, service: Service):
     data = await state.get_data()
-    service = data["service"]
     date_str = data["date"]
-    logger.debug(f"Showing available times for {service} on {date_str}")
+    logger.debug(f"Showing available times for {service.name} on {date_str}")
 
-    available = await repo.get_available_times(service, date_str)
-    logger.info(f"Found {len(available)} available time slots for {service} on {date_str}: {available}")
+    available = await repo.get_available_times(service.id, date_str)
+    logger.info(f"Found {len(available)} available time slots for {service.name} on {date_str}: {available}")
 
     if not available:
-        logger.warning(f"No available times for {service} on {date_str}")
+        logger.warning(f"No available times for {service.name} on {date_str}")
         await message.edit_text(
             "😕 На выбранную дату мест уже нет. Выберите другую дату:",
-            reply_markup=week_picker_kb(page=0, weeks_ahead=3)
+            reply_markup=await week_picker(repo, service)
         )
         return
 
@@ -61,24 +89,26 @@ async def show_available_times(message, state: FSMContext):
 
 
 @router.message(F.text == "📅 Записаться на тренировку")
-async def start_booking(message: Message, state: FSMContext):
+async def start_booking(message: Message, state: FSMContext, repo: Repo):
     logger.info(f"User {message.from_user.id} started booking flow")
     await state.clear()
     await state.set_state(BookingFlow.service)
-    await message.answer(ASK_SERVICE, reply_markup=services_kb())
+    await message.answer(ASK_SERVICE, reply_markup=services_kb(repo.services.enabled))
 
 
 @router.callback_query(BookingFlow.service, F.data.startswith("service:"))
-async def pick_service(call: CallbackQuery, state: FSMContext):
+async def pick_service(call: CallbackQuery, state: FSMContext, repo: Repo):
     key = call.data.split(":", 1)[1]
-    service = SERVICE_LABELS.get(key)
+    service = repo.services.by_id(int(key)) if key.isdigit() else None
     logger.debug(f"User {call.from_user.id} selected service: {service}")
-    if not service:
+    if service is None or not service.enabled:
+        # кнопка из старой клавиатуры или услугу успели выключить
         logger.warning(f"Unknown service key: {key}")
+        await call.message.edit_text(ASK_SERVICE, reply_markup=services_kb(repo.services.enabled))
         await call.answer("Не понял услугу. Выберите из списка.")
         return
 
-    await state.update_data(service=service)
+    await state.update_data(service_id=service.id)
     await state.set_state(BookingFlow.date)
 
     await call.message.edit_text(ASK_DATE, reply_markup=date_kb())
@@ -86,25 +116,28 @@ async def pick_service(call: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(BookingFlow.date, F.data.startswith("date:"))
-async def pick_date(call: CallbackQuery, state: FSMContext):
+async def pick_date(call: CallbackQuery, state: FSMContext, repo: Repo):
     key = call.data.split(":", 1)[1]
     logger.debug(f"User {call.from_user.id} selected date option: {key}")
+    service = await selected_service(call, state, repo)
+    if service is None:
+        return
 
     if key == "today":
-        d = date.today()
+        d = local_today()
         date_str = d.strftime("%d.%m.%Y")
         logger.debug(f"Selected date: {date_str} (today)")
         await state.update_data(date=date_str)
-        await show_available_times(call.message, state)
+        await show_available_times(call.message, state, repo, service)
         await call.answer()
         return
 
     if key == "tomorrow":
-        d = date.today() + timedelta(days=1)
+        d = local_today() + timedelta(days=1)
         date_str = d.strftime("%d.%m.%Y")
         logger.debug(f"Selected date: {date_str} (tomorrow)")
         await state.update_data(date=date_str)
-        await show_available_times(call.message, state)
+        await show_available_times(call.message, state, repo, service)
         await call.answer()
         return
 
@@ -112,7 +145,7 @@ async def pick_date(call: CallbackQuery, state: FSMContext):
         logger.debug("User requested calendar picker")
         await call.message.edit_text(
             "Выберите дату (можно пролистать недели):",
-            reply_markup=week_picker_kb(page=0, weeks_ahead=3)
+            reply_markup=await week_picker(repo, service)
         )
         await call.answer()
         return
@@ -128,9 +161,12 @@ async def pick_date(call: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(BookingFlow.time, F.data.startswith("time:"))
-async def pick_time(call: CallbackQuery, state: FSMContext):
+async def pick_time(call: CallbackQuery, state: FSMContext, repo: Repo, config: Config):
     t = call.data.split(":", 1)[1]
     logger.debug(f"User {call.from_user.id} selected time: {t}")
+    service = await selected_service(call, state, repo)
+    if service is None:
+        return
 
     # если у тебя в time_kb есть кнопка "назад к дате", делай ей отдельный callback:
     # if t == "back_date": ... (иначе это не будет ловиться)
@@ -139,12 +175,28 @@ async def pick_time(call: CallbackQuery, state: FSMContext):
         await state.set_state(BookingFlow.date)
         await call.message.edit_text(
             "Выберите дату (можно пролистать недели):",
-            reply_markup=week_picker_kb(page=0, weeks_ahead=3),
+            reply_markup=await week_picker(repo, service),
+        )
+        await call.answer()
+        return
+
+    # держим место, пока пользователь вводит имя и телефон
+    data = await state.get_data()
+    try:
+        hold_id = await repo.hold_slot(
+            service.id, data["date"], t, str(call.from_user.id), config.hold_ttl_seconds
+        )
+    except SlotFullError:
+        logger.info(f"Slot {service.name} {data['date']} {t} is already full for user {call.from_user.id}")
+        available = await repo.get_available_times(service.id, data["date"])
+        await call.message.edit_text(
+            "⚠️ Это время только что заняли. Выберите другое:",
+            reply_markup=time_kb(available)
         )
         await call.answer()
         return
 
-    await state.update_data(time=t)
+    await state.update_data(time=t, hold_id=hold_id)
     await state.set_state(BookingFlow.name)
 
     await call.message.edit_text(ASK_NAME)
@@ -165,7 +217,7 @@ async def get_name(message: Message, state: FSMContext):
 
 
 @router.message(BookingFlow.phone)
-async def get_phone(message: Message, state: FSMContext):
+async def get_phone(message: Message, state: FSMContext, repo: Repo):
     phone = (message.text or "").strip()
     logger.debug(f"User {message.from_user.id} entered phone: {phone}")
 
@@ -175,6 +227,10 @@ async def get_phone(message: Message, state: FSMContext):
         await message.answer("Похоже, номер слишком короткий. Введите телефон ещё раз:")
         return
 
+    service = await selected_service(message, state, repo)
+    if service is None:
+        return
+
     await state.update_data(phone=phone)
     data = await state.get_data()
     logger.debug(f"User {message.from_user.id} ready for confirmation: {data}")
@@ -182,7 +238,7 @@ async def get_phone(message: Message, state: FSMContext):
     await state.set_state(BookingFlow.confirm)
     await message.answer(
         CONFIRM_TEMPLATE.format(
-            service=data["service"],
+            service=service.name,
             date=data["date"],
             time=data["time"],
             name=data["name"],
@@ -193,42 +249,57 @@ async def get_phone(message: Message, state: FSMContext):
 
 
 @router.callback_query(BookingFlow.confirm, F.data.startswith("confirm:"))
-async def confirm(call: CallbackQuery, state: FSMContext, bot: Bot):
+async def confirm(
+    call: CallbackQuery,
+    state: FSMContext,
+    repo: Repo,
+    notifier: AdminNotifier,
+    outbound: MessageScheduler,
+):
     choice = call.data.split(":", 1)[1]
     logger.debug(f"User {call.from_user.id} confirmed booking: {choice}")
     
     if choice == "no":
         logger.info(f"User {call.from_user.id} cancelled booking")
+        hold_id = (await state.get_data()).get("hold_id")
+        if hold_id is not None:
+            await repo.release_hold(hold_id)
         await state.clear()
-        await call.message.edit_text(CANCELLED)
+        outbound.edit(
+            call.message.chat.id, call.message.message_id, CANCELLED,
+            priority=Priority.USER, label=f"booking cancelled by user {call.from_user.id}",
+        )
         await call.answer()
         return
 
-    data = await state.get_data()
+    service = await selected_service(call, state, repo)
+    if service is None:
+        return
 
-    service = data["service"]
+    data = await state.get_data()
     date_str = data["date"]
     time_str = data["time"]
     name = data["name"]
     phone = data["phone"]
     user_id = str(call.from_user.id)
 
-    logger.info(f"Creating booking for user {user_id}: {service} on {date_str} at {time_str}")
+    logger.info(f"Creating booking for user {user_id}: {service.name} on {date_str} at {time_str}")
 
     # 1) создаём бронь в SQLite (источник правды) атомарно
     try:
         booking_id = await repo.create_booking(
-            service=service,
+            service_id=service.id,
             date=date_str,
             time=time_str,
             name=name,
             phone=phone,
             tg_user_id=user_id,
+            hold_id=data.get("hold_id"),
         )
     except SlotFullError:
-        # слот заняли прямо сейчас
-        logger.warning(f"Slot full for {service} on {date_str} at {time_str}")
-        available = await repo.get_available_times(service, date_str)
+        # холд истёк, и слот за это время заняли
+        logger.warning(f"Slot full for {service.name} on {date_str} at {time_str}")
+        available = await repo.get_available_times(service.id, date_str)
         await state.set_state(BookingFlow.time)
         await call.message.edit_text(
             "⚠️ Упс! Это время только что заняли. Выберите другое:",
@@ -237,63 +308,61 @@ async def confirm(call: CallbackQuery, state: FSMContext, bot: Bot):
         await call.answer()
         return
 
-    # 2) обновляем витрину Google Calendar (не должно ломать запись)
-    try:
-        logger.info(f"Updating Google Calendar for slot {service} on {date_str} at {time_str}")
-        event_id = await publisher.upsert_slot_event(service, date_str, time_str)
-        if event_id:
-            await repo.attach_event_id_for_slot(service, date_str, time_str, event_id)
-    except Exception as e:
-        # бронь уже создана — календарь вторичен
-        logger.error(f"Calendar update failed for slot {service} {date_str} {time_str}: {e}", exc_info=True)
-        try:
-            await bot.send_message(
-                chat_id=config.owner_admin_id,
-                text=f"⚠️ Calendar update failed for slot {service} {date_str} {time_str}: {e}"
-            )
-        except Exception as notify_error:
-            logger.error(f"Failed to notify admin about calendar update error: {notify_error}")
-
-    # 3) клиенту
+    # 2) витрину Google Calendar обновит фоновый воркер calendar_outbox
+    #    (задача записана в той же транзакции, что и бронь)
+
+    # 3) клиенту — через общую очередь, впереди уведомлений админам
     logger.info(f"Booking {booking_id} confirmed for user {user_id}")
-    await call.message.edit_text(BOOKED_USER)
+    outbound.edit(
+        call.message.chat.id, call.message.message_id, BOOKED_USER,
+        priority=Priority.USER, label=f"booking {booking_id}",
+    )
     await call.answer()
 
-    # 4) админу
+    # 4) админам (сводкой, если за окно набралось несколько событий)
     admin_text = (
         "📩 Новая запись (DEMO)\n\n"
         f"🆔 ID записи: {booking_id}\n"
-        f"🏷 Услуга: {service}\n"
+        f"🏷 Услуга: {service.name}\n"
         f"📅 Дата: {date_str}\n"
         f"⏰ Время: {time_str}\n"
         f"👤 Имя: {name}\n"
         f"📞 Телефон: {phone}\n"
         f"👤 TG user_id: {user_id}"
     )
-    try:
-        await bot.send_message(chat_id=config.owner_admin_id, text=admin_text)
-        logger.info(f"Admin notified about booking {booking_id}")
-    except Exception as e:
-        logger.error(f"Failed to notify admin about booking {booking_id}: {e}")
+    notifier.booking(admin_text, f"#{booking_id} {service.name} {date_str} {time_str} — {name}, {phone}")
+    logger.info(f"Admin notification queued for booking {booking_id}")
 
     await state.clear()
 
 
 @router.callback_query(BookingFlow.date, F.data.startswith("datepick:"))
-async def pick_date_from_calendar(call: CallbackQuery, state: FSMContext):
+async def pick_date_from_calendar(call: CallbackQuery, state: FSMContext, repo: Repo):
     iso = call.data.split(":", 1)[1]  # YYYY-MM-DD
     y, m, d = iso.split("-")
     date_str = f"{d}.{m}.{y}"
     logger.debug(f"User {call.from_user.id} selected date from calendar: {date_str}")
+    service = await selected_service(call, state, repo)
+    if service is None:
+        return
 
     await state.update_data(date=date_str)
-    await show_available_times(call.message, state)
+    await show_available_times(call.message, state, repo, service)
     await call.answer()
 
 
 @router.callback_query(BookingFlow.date, F.data.startswith("week:"))
-async def switch_week(call: CallbackQuery, state: FSMContext):
+async def switch_week(call: CallbackQuery, state: FSMContext, repo: Repo):
     page = int(call.data.split(":", 1)[1])
     logger.debug(f"User {call.from_user.id} switched to week page {page}")
-    await call.message.edit_reply_markup(reply_markup=week_picker_kb(page=page, weeks_ahead=3))
+    service = await selected_service(call, state, repo)
+    if service is None:
+        return
+    await call.message.edit_reply_markup(reply_markup=await week_picker(repo, service, page))
     await call.answer()
+
+
+@router.callback_query(BookingFlow.date, F.data.startswith("dayfull:"))
+async def pick_full_day(call: CallbackQuery):
+    logger.debug(f"User {call.from_user.id} clicked fully booked day {call.data}")
+    await call.answer("😕 На эту дату мест нет. Выберите другой день.")
@@ -3,30 +3,59 @@ from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from app.repo import Service
 
 RU_DOW = {
     "Mon": "Пн", "Tue": "Вт", "Wed": "Ср", "Thu": "Чт",
     "Fri": "Пт", "Sat": "Сб", "Sun": "Вс",
 }
 
-def start_kb() -> ReplyKeyboardMarkup:
+# Клавиатуры без параметров собираются один раз при импорте: InlineKeyboardBuilder
+# и валидация pydantic на каждом апдейте стоят дороже самого хэндлера.
+# Разметка общая для всех вызовов — её нельзя менять на месте.
+
+# часовой пояс, в котором считается "сегодня" (config.tz, см. set_timezone)
+_tz: Optional[ZoneInfo] = None
+
+WEEK_CACHE_SIZE = 256
+_week_cache: dict[tuple, InlineKeyboardMarkup] = {}
+_week_cache_day: Optional[date] = None
+
+
+def set_timezone(tz: str) -> None:
+    global _tz
+    _tz = ZoneInfo(tz)
+    _week_cache.clear()
+
+
+def local_today() -> date:
+    """Сегодняшняя дата в часовом поясе бота (без set_timezone — в поясе сервера)."""
+    return datetime.now(_tz).date()
+
+
+def _build_start_kb() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="📅 Записаться на тренировку")]],
         resize_keyboard=True
     )
 
 
-def services_kb() -> InlineKeyboardMarkup:
+@lru_cache(maxsize=8)
+def services_kb(services: tuple[Service, ...]) -> InlineKeyboardMarkup:
+    """Кнопки включённых услуг из реестра; новый снимок реестра — новая разметка."""
     kb = InlineKeyboardBuilder()
-    kb.button(text="🏓 Падел (групповая)", callback_data="service:paddle_group")
-    kb.button(text="🏓 Падел (индивидуальная)", callback_data="service:paddle_ind")
-    kb.button(text="🏋️ Фитнес", callback_data="service:fitness")
+    for service in services:
+        kb.button(text=service.name, callback_data=f"service:{service.id}")
     kb.adjust(1)
     return kb.as_markup()
 
 
-def date_kb() -> InlineKeyboardMarkup:
+def _build_date_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="Сегодня", callback_data="date:today")
     kb.button(text="Завтра", callback_data="date:tomorrow")
@@ -35,6 +64,11 @@ def date_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 def time_kb(available_times: list[str]) -> InlineKeyboardMarkup:
+    return _time_kb(tuple(available_times))
+
+
+@lru_cache(maxsize=128)
+def _time_kb(available_times: tuple[str, ...]) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
 
     for t in available_times:
@@ -51,31 +85,49 @@ def time_kb(available_times: list[str]) -> InlineKeyboardMarkup:
 
     return kb.as_markup()
 
-def confirm_kb() -> InlineKeyboardMarkup:
+def _build_confirm_kb() -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     kb.button(text="✅ Подтвердить", callback_data="confirm:yes")
     kb.button(text="❌ Отменить", callback_data="confirm:no")
     kb.adjust(2)
     return kb.as_markup()
 
+
+_START_KB = _build_start_kb()
+_DATE_KB = _build_date_kb()
+_CONFIRM_KB = _build_confirm_kb()
+
+
+def start_kb() -> ReplyKeyboardMarkup:
+    return _START_KB
+
+
+def date_kb() -> InlineKeyboardMarkup:
+    return _DATE_KB
+
+
+def confirm_kb() -> InlineKeyboardMarkup:
+    return _CONFIRM_KB
+
+
 def _fmt_day_button(d: date) -> str:
     dow = RU_DOW.get(d.strftime("%a"), d.strftime("%a"))
     return f"{dow} {d.strftime('%d.%m')}"
 
 
-def week_picker_kb(page: int = 0, weeks_ahead: int = 3) -> InlineKeyboardMarkup:
+def week_page_range(page: int = 0, weeks_ahead: int = 3, today: Optional[date] = None) -> tuple[date, date]:
     """
-    Календарь по неделям:
+    Границы страницы недельного календаря:
     - page=0: текущая неделя (сегодня..вс)
     - page=1..weeks_ahead: полные недели (пн..вс)
-    Всего страниц: 0..weeks_ahead
     """
     if page < 0:
         page = 0
     if page > weeks_ahead:
         page = weeks_ahead
 
-    today = date.today()
+    if today is None:
+        today = local_today()
 
     # Находим понедельник текущей недели
     this_monday = today - timedelta(days=today.weekday())  # weekday: Mon=0..Sun=6
@@ -87,13 +139,74 @@ def week_picker_kb(page: int = 0, weeks_ahead: int = 3) -> InlineKeyboardMarkup:
     else:
         start = this_monday + timedelta(days=7 * page)
         end = start + timedelta(days=6)
+    return start, end
+
+
+def week_picker_kb(
+    page: int = 0,
+    weeks_ahead: int = 3,
+    free_slots: Optional[dict[str, int]] = None,
+) -> InlineKeyboardMarkup:
+    """
+    Календарь по неделям:
+    - page=0: текущая неделя (сегодня..вс)
+    - page=1..weeks_ahead: полные недели (пн..вс)
+    Всего страниц: 0..weeks_ahead
+
+    free_slots: {dd.MM.yyyy: число свободных слотов} — если передан, у дня
+    показывается бейдж, а полностью занятые дни помечаются и не ведут в выбор времени.
+
+    Готовая разметка кэшируется по (страница, сегодняшняя дата, бейджи): пока
+    занятость не меняется, все пользователи получают один и тот же объект.
+    Кэш сбрасывается при смене даты.
+    """
+    global _week_cache_day
+    if page < 0:
+        page = 0
+    if page > weeks_ahead:
+        page = weeks_ahead
+
+    today = local_today()
+    if today != _week_cache_day:
+        # полночь: страницы сдвинулись, старые разметки больше не нужны
+        _week_cache.clear()
+        _week_cache_day = today
+
+    start, end = week_page_range(page, weeks_ahead, today)
+    badges = None
+    if free_slots is not None:
+        days = ((start + timedelta(days=i)).strftime("%d.%m.%Y") for i in range((end - start).days + 1))
+        badges = tuple(free_slots.get(day, 0) for day in days)
 
+    key = (page, weeks_ahead, badges)
+    markup = _week_cache.get(key)
+    if markup is None:
+        if len(_week_cache) >= WEEK_CACHE_SIZE:
+            del _week_cache[next(iter(_week_cache))]
+        markup = _week_cache[key] = _build_week_picker_kb(page, weeks_ahead, start, end, badges)
+    return markup
+
+
+def _build_week_picker_kb(
+    page: int,
+    weeks_ahead: int,
+    start: date,
+    end: date,
+    badges: Optional[tuple[int, ...]],
+) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
 
     # дни недели
     d = start
     while d <= end:
-        kb.button(text=_fmt_day_button(d), callback_data=f"datepick:{d.isoformat()}")
+        if badges is None:
+            kb.button(text=_fmt_day_button(d), callback_data=f"datepick:{d.isoformat()}")
+        else:
+            free = badges[(d - start).days]
+            if free > 0:
+                kb.button(text=f"{_fmt_day_button(d)} · {free}", callback_data=f"datepick:{d.isoformat()}")
+            else:
+                kb.button(text=f"{_fmt_day_button(d)} ✖", callback_data=f"dayfull:{d.isoformat()}")
         d += timedelta(days=1)
 
     # на первой странице может быть 1..7 дней; на остальных всегда 7
@@ -130,6 +243,7 @@ def week_picker_kb(page: int = 0, weeks_ahead: int = 3) -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+@lru_cache(maxsize=None)
 def admin_main_kb(is_owner: bool = False) -> InlineKeyboardMarkup:
     """Admin main menu keyboard"""
     kb = InlineKeyboardBuilder()
@@ -141,6 +255,7 @@ def admin_main_kb(is_owner: bool = False) -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+@lru_cache(maxsize=None)
 def admin_manage_kb() -> InlineKeyboardMarkup:
     """Admin management keyboard"""
     kb = InlineKeyboardBuilder()
@@ -152,9 +267,40 @@ def admin_manage_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+@lru_cache(maxsize=None)
 def cancel_kb() -> InlineKeyboardMarkup:
     """Cancel keyboard"""
     kb = InlineKeyboardBuilder()
     kb.button(text="⬅️ Назад", callback_data="cancel")
     kb.adjust(1)
     return kb.as_markup()
+
+
+def admin_bookings_kb(
+    status_label: str,
+    period_label: str,
+    service_label: str,
+    has_prev: bool,
+    has_next: bool,
+) -> InlineKeyboardMarkup:
+    """Список броней в админке: переключатели фильтров и листание страниц"""
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"Статус: {status_label}", callback_data="bk:status")
+    kb.button(text=f"Период: {period_label}", callback_data="bk:period")
+    kb.button(text=f"Услуга: {service_label}", callback_data="bk:service")
+    sizes = [2, 1]
+
+    nav = 0
+    if has_prev:
+        kb.button(text="⬅️ Новее", callback_data="bk:prev")
+        nav += 1
+    if has_next:
+        kb.button(text="Старее ➡️", callback_data="bk:next")
+        nav += 1
+    if nav:
+        sizes.append(nav)
+
+    kb.button(text="⬅️ Назад", callback_data="cancel")
+    sizes.append(1)
+    kb.adjust(*sizes)
+    return kb.as_markup()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Awaitable, Callable, Sequence
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Шаг миграции схемы. Применяется один раз: номер последнего применённого
+    шага хранится в PRAGMA user_version.
+
+    Шаги должны быть идемпотентными — бэкфилл коммитит пачками, и если процесс
+    упадёт посередине, шаг целиком повторится при следующем запуске.
+    """
+    version: int
+    name: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+@dataclass
+class MigrationResult:
+    version: int
+    name: str
+    seconds: float
+
+
+async def get_user_version(db: aiosqlite.Connection) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def add_column_if_missing(db: aiosqlite.Connection, table: str, column: str, decl: str) -> bool:
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if column in columns:
+        return False
+    logger.info(f"Adding column {table}.{column}")
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    await db.commit()
+    return True
+
+
+async def backfill(
+    db: aiosqlite.Connection,
+    sql: str,
+    params: Sequence = (),
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """
+    Выполняет UPDATE/INSERT пачками, пока он что-то меняет.
+
+    sql должен сам ограничивать пачку последним параметром `LIMIT ?` и
+    выбирать только ещё не обработанные строки (`WHERE col IS NULL` и т.п.).
+    Каждая пачка — отдельная короткая транзакция, между ними управление
+    отдаётся event loop'у, так что запись броней во время миграции не стоит.
+    Возвращает число изменённых строк.
+    """
+    total = 0
+    while True:
+        cursor = await db.execute(sql, (*params, batch_size))
+        await db.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def run_migrations(db: aiosqlite.Connection, migrations: Sequence[Migration]) -> list[MigrationResult]:
+    """Применяет по порядку шаги с version больше текущего user_version."""
+    current = await get_user_version(db)
+    latest = max((m.version for m in migrations), default=0)
+    if current > latest:
+        logger.warning(f"Database schema version {current} is newer than this code knows ({latest})")
+        return []
+
+    results = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current:
+            continue
+        logger.info(f"Applying migration {migration.version}: {migration.name}")
+        started = perf_counter()
+        await migration.apply(db)
+        # PRAGMA user_version транзакционна: номер фиксируется вместе с остатком шага
+        await db.execute(f"PRAGMA user_version = {migration.version}")
+        await db.commit()
+        elapsed = perf_counter() - started
+        logger.info(f"Migration {migration.version} applied in {elapsed:.3f}s")
+        results.append(MigrationResult(migration.version, migration.name, elapsed))
+        current = migration.version
+    return results
+
+
+def copy_database(src_path: str, dst_path: str) -> None:
+    """Консистентная копия живой базы через sqlite backup API (WAL учитывается)."""
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+async def dry_run(db_path: str) -> list[MigrationResult]:
+    """
+    Прогоняет init_db на копии базы и возвращает время каждого шага.
+    Исходный файл не меняется.
+    """
+    from app.db import init_db  # app.db сам импортирует этот модуль
+
+    with tempfile.TemporaryDirectory(prefix="migrations-") as tmp:
+        copy_path = os.path.join(tmp, os.path.basename(db_path))
+        logger.info(f"Copying {db_path} to {copy_path} for dry run")
+        await asyncio.to_thread(copy_database, db_path, copy_path)
+        return await init_db(copy_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Миграции схемы bookings.sqlite3")
+    parser.add_argument("db_path", nargs="?", default=os.getenv("DB_PATH", "./bookings.sqlite3"))
+    parser.add_argument("--dry-run", action="store_true", help="прогнать миграции на копии базы и показать время шагов")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    if args.dry_run:
+        results = asyncio.run(dry_run(args.db_path))
+    else:
+        from app.db import init_db
+        results = asyncio.run(init_db(args.db_path))
+
+    for r in results:
+        print(f"{r.version:>4}  {r.seconds:8.3f}s  {r.name}")
+
+
+if __name__ == "__main__":
+    main()
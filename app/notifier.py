@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+from app.outbound import MessageScheduler, Priority
+from app.repo import Repo
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_TEXT_LIMIT = 4096
+ERROR_TEXT_LIMIT = 300
+ERROR_SUBJECTS_SHOWN = 3
+
+
+@dataclass
+class _ErrorGroup:
+    title: str
+    error: str
+    count: int = 0
+    subjects: list[str] = field(default_factory=list)   # первые несколько, для примера
+
+
+@dataclass
+class NotifierStats:
+    events: int = 0
+    digests: int = 0
+    messages: int = 0
+
+
+class AdminNotifier:
+    """
+    Уведомления всем админам из таблицы admins.
+
+    Первое событие после затишья уходит сразу и открывает окно digest_seconds:
+    всё, что придёт за окно, копится, и по его концу каждый админ получает
+    одно сообщение на всё накопленное. Одинаковые ошибки
+    (тот же заголовок и текст) схлопываются в одну строку со счётчиком, так
+    что сбой календаря на сотне броней — это одна строка, а не сто сообщений.
+    Одиночное событие отправляется в полном виде, как раньше.
+    """
+
+    def __init__(
+        self,
+        repo: Repo,
+        outbound: MessageScheduler,
+        digest_seconds: float = 60.0,
+        max_lines: int = 20,
+    ):
+        self.repo = repo
+        self.outbound = outbound
+        self.digest_seconds = digest_seconds
+        self.max_lines = max_lines
+        self.stats = NotifierStats()
+
+        self._bookings: list[tuple[str, str]] = []   # (полный текст, строка для сводки)
+        self._errors: dict[tuple[str, str], _ErrorGroup] = {}
+        self._event = asyncio.Event()
+
+    def booking(self, text: str, summary: str) -> None:
+        self._bookings.append((text, summary))
+        self._added()
+
+    def error(self, title: str, error: str, subject: str = "") -> None:
+        error = error[:ERROR_TEXT_LIMIT]
+        group = self._errors.get((title, error))
+        if group is None:
+            group = self._errors[(title, error)] = _ErrorGroup(title, error)
+        group.count += 1
+        if subject and len(group.subjects) < ERROR_SUBJECTS_SHOWN:
+            group.subjects.append(subject)
+        self._added()
+
+    def _added(self) -> None:
+        self.stats.events += 1
+        self._event.set()
+
+    async def run(self) -> None:
+        logger.info(f"Admin notifier started (digest window {self.digest_seconds}s)")
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Admin notification digest failed: {e}", exc_info=True)
+            # окно после отправки: события за него уйдут одной сводкой на следующем
+            # круге, а если окно прошло тихо, следующее событие снова уйдёт сразу
+            await asyncio.sleep(self.digest_seconds)
+
+    async def flush(self) -> None:
+        if not self._bookings and not self._errors:
+            return
+        admin_ids = await self.repo.get_admin_ids()
+        # буферы забираем после await: отмена задачи на чтении админов не теряет события
+        bookings, self._bookings = self._bookings, []
+        errors, self._errors = list(self._errors.values()), {}
+        if not admin_ids:
+            logger.warning(f"No admins to notify, dropping {len(bookings)} booking(s) and {len(errors)} error(s)")
+            return
+
+        text = self._compose(bookings, errors)
+        for admin_id in admin_ids:
+            self.outbound.send(admin_id, text, priority=Priority.ADMIN)
+        self.stats.digests += 1
+        self.stats.messages += len(admin_ids)
+        logger.info(
+            f"Admin notification sent to {len(admin_ids)} admin(s): "
+            f"{len(bookings)} booking(s), {sum(g.count for g in errors)} error(s) in {len(errors)} group(s)"
+        )
+
+    def _compose(self, bookings: list[tuple[str, str]], errors: list[_ErrorGroup]) -> str:
+        if len(bookings) == 1 and not errors:
+            return bookings[0][0]
+        if not bookings and len(errors) == 1 and errors[0].count == 1:
+            group = errors[0]
+            subject = f" ({group.subjects[0]})" if group.subjects else ""
+            return f"⚠️ {group.title}{subject}: {group.error}"
+
+        total = len(bookings) + sum(g.count for g in errors)
+        lines = [f"🔔 Сводка уведомлений: {total}"]
+        if bookings:
+            lines += ["", f"📩 Новые записи: {len(bookings)}"]
+            lines += [f"• {summary}" for _, summary in bookings[:self.max_lines]]
+            if len(bookings) > self.max_lines:
+                lines.append(f"… и ещё {len(bookings) - self.max_lines}")
+        if errors:
+            lines += ["", "⚠️ Ошибки:"]
+            for group in sorted(errors, key=lambda g: -g.count):
+                lines.append(f"• {group.title} ×{group.count}: {group.error}")
+                if group.subjects:
+                    more = group.count - len(group.subjects)
+                    lines.append("  " + ", ".join(group.subjects) + (f" и ещё {more}" if more > 0 else ""))
+        text = "\n".join(lines)
+        if len(text) > TELEGRAM_TEXT_LIMIT:
+            text = text[:TELEGRAM_TEXT_LIMIT - 1] + "…"
+        return text
+
+    async def close(self) -> None:
+        """Отправляет то, что накопилось в незакрытом окне."""
+        await self.flush()
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from dataclasses import dataclass, field
+from enum import IntEnum
+from time import monotonic
+from typing import Any, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+
+class Priority(IntEnum):
+    """Меньше — раньше: ответы пользователям обгоняют служебные сообщения админам."""
+    USER = 0
+    ADMIN = 1
+
+
+@dataclass
+class TokenBucket:
+    rate: float                  # токенов в секунду
+    capacity: float              # размер всплеска
+    tokens: float = -1.0
+    updated: float = 0.0
+    blocked_until: float = 0.0   # после RetryAfter от Telegram
+
+    def _refill(self, now: float) -> None:
+        if self.tokens < 0:
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд можно отправить (0 — можно сейчас)."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+@dataclass(order=True)
+class _Outgoing:
+    priority: int
+    seq: int
+    chat_id: ChatId = field(compare=False)
+    text: str = field(compare=False)
+    kwargs: dict[str, Any] = field(compare=False, default_factory=dict)
+    attempts: int = field(compare=False, default=0)
+    # задан — правка уже отправленного сообщения (edit_message_text) вместо нового
+    message_id: Optional[int] = field(compare=False, default=None)
+    label: str = field(compare=False, default="")   # для логов: к чему относится сообщение (бронь и т.п.)
+
+    def describe(self) -> str:
+        if self.message_id is not None:
+            what = f"edit of message {self.message_id} in chat {self.chat_id}"
+        else:
+            what = f"message to {self.chat_id}"
+        return f"{what} ({self.label})" if self.label else what
+
+
+@dataclass
+class OutboundStats:
+    sent: int = 0
+    retried: int = 0             # RetryAfter / сетевые ошибки, сообщение вернулось в очередь
+    dropped: int = 0
+    max_depth: int = 0
+
+
+class MessageScheduler:
+    """
+    Единая очередь исходящих сообщений бота.
+
+    send() только ставит сообщение в очередь и сразу возвращается, так что
+    обработчик не ждёт Telegram. Отправка идёт в фоне с ограничением темпа:
+    общий token bucket на бота и по одному на чат (лимиты Telegram ~30 сообщений
+    в секунду всего и ~1 в секунду в один чат). На TelegramRetryAfter чат
+    ставится на паузу на retry_after, а сообщение возвращается в очередь со
+    своим приоритетом. Если за global_retry_window секунд RetryAfter пришёл от
+    global_retry_chats разных чатов, ограничен весь бот — пауза общая.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_attempts: int = 5,
+        concurrency: int = 8,
+        depth_warning: int = 500,
+        global_retry_chats: int = 3,
+        global_retry_window: float = 1.0,
+    ):
+        self.bot = bot
+        self.global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.depth_warning = depth_warning
+        self.global_retry_chats = global_retry_chats
+        self.global_retry_window = global_retry_window
+        self.stats = OutboundStats()
+
+        self._heap: list[_Outgoing] = []
+        self._deferred: list[tuple[float, _Outgoing]] = []   # (когда можно, сообщение) — ждут свой чат
+        self._buckets: dict[ChatId, TokenBucket] = {}
+        self._retry_after_at: dict[ChatId, float] = {}   # чат -> когда пришёл его последний RetryAfter
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: set[asyncio.Task] = set()
+        self._depth_warned = False
+
+    def send(
+        self, chat_id: ChatId, text: str, priority: Priority = Priority.ADMIN, label: str = "", **kwargs: Any
+    ) -> None:
+        """Ставит сообщение в очередь (kwargs уходят в bot.send_message)."""
+        self._push(_Outgoing(int(priority), next(self._seq), chat_id, text, kwargs, label=label))
+
+    def edit(
+        self,
+        chat_id: ChatId,
+        message_id: int,
+        text: str,
+        priority: Priority = Priority.USER,
+        label: str = "",
+        **kwargs: Any,
+    ) -> None:
+        """Ставит в очередь правку сообщения (kwargs уходят в bot.edit_message_text)."""
+        self._push(
+            _Outgoing(int(priority), next(self._seq), chat_id, text, kwargs, message_id=message_id, label=label)
+        )
+
+    def _push(self, msg: _Outgoing) -> None:
+        heapq.heappush(self._heap, msg)
+        depth = self.depth()
+        self.stats.max_depth = max(self.stats.max_depth, depth)
+        if depth >= self.depth_warning and not self._depth_warned:
+            self._depth_warned = True
+            logger.warning(f"Outbound message queue depth is {depth}")
+        self._wakeup.set()
+
+    def depth(self) -> int:
+        return len(self._heap) + len(self._deferred) + len(self._inflight)
+
+    def depth_by_priority(self) -> dict[str, int]:
+        counts = {p.name: 0 for p in Priority}
+        for msg in itertools.chain(self._heap, (m for _, m in self._deferred)):
+            counts[Priority(msg.priority).name] += 1
+        return counts
+
+    def _bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst)
+        return bucket
+
+    async def run(self) -> None:
+        logger.info("Outbound message scheduler started")
+        while True:
+            timeout = self._dispatch_ready()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch_ready(self) -> Optional[float]:
+        """Отправляет всё, что разрешают бакеты; возвращает, сколько ждать до следующей попытки."""
+        now = monotonic()
+        if self._deferred:
+            ready = [m for at, m in self._deferred if at <= now]
+            self._deferred = [(at, m) for at, m in self._deferred if at > now]
+            for msg in ready:
+                heapq.heappush(self._heap, msg)
+
+        while self._heap:
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                return self._next_timeout(global_delay)
+            msg = heapq.heappop(self._heap)
+            chat_delay = self._bucket(msg.chat_id).delay(now)
+            if chat_delay > 0:
+                # чат упёрся в свой лимит — не держим из-за него остальные чаты
+                self._deferred.append((now + chat_delay, msg))
+                continue
+            self._bucket(msg.chat_id).consume()
+            self.global_bucket.consume()
+            task = asyncio.create_task(self._deliver(msg))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+        if not self.depth():
+            self._depth_warned = False
+        if len(self._buckets) > 10_000:
+            self._buckets = {k: b for k, b in self._buckets.items() if not b.idle(now)}
+        return self._next_timeout(None)
+
+    def _next_timeout(self, delay: Optional[float]) -> Optional[float]:
+        if self._deferred:
+            deferred_delay = max(0.0, min(at for at, _ in self._deferred) - monotonic())
+            delay = deferred_delay if delay is None else min(delay, deferred_delay)
+        return delay
+
+    async def _deliver(self, msg: _Outgoing) -> None:
+        async with self._semaphore:
+            try:
+                if msg.message_id is not None:
+                    await self.bot.edit_message_text(
+                        chat_id=msg.chat_id, message_id=msg.message_id, text=msg.text, **msg.kwargs
+                    )
+                else:
+                    await self.bot.send_message(chat_id=msg.chat_id, text=msg.text, **msg.kwargs)
+            except TelegramRetryAfter as e:
+                logger.warning(f"Telegram asked to retry after {e.retry_after}s ({msg.describe()})")
+                self._retry_after(msg.chat_id, monotonic() + e.retry_after)
+                self._retry(msg, str(e), count_attempt=False)
+            except TelegramNetworkError as e:
+                self._retry(msg, str(e))
+            except TelegramAPIError as e:
+                # бот заблокирован, чат не найден и т.п. — повтор не поможет
+                self.stats.dropped += 1
+                logger.error(f"Failed to deliver {msg.describe()}: {e}")
+            except Exception as e:
+                self.stats.dropped += 1
+                logger.error(f"Failed to deliver {msg.describe()}: {e}", exc_info=True)
+            else:
+                self.stats.sent += 1
+
+    def _retry_after(self, chat_id: ChatId, until: float) -> None:
+        """Пауза чату; общая пауза — только если RetryAfter разом пришёл от нескольких чатов."""
+        now = monotonic()
+        self._bucket(chat_id).blocked_until = until
+        self._retry_after_at[chat_id] = now
+        self._retry_after_at = {
+            chat: at for chat, at in self._retry_after_at.items() if now - at <= self.global_retry_window
+        }
+        if len(self._retry_after_at) >= self.global_retry_chats:
+            # один чат упирается в свой лимит, а несколько сразу — это лимит бота
+            logger.warning(f"RetryAfter from {len(self._retry_after_at)} chats at once, pausing all sends")
+            self.global_bucket.blocked_until = max(self.global_bucket.blocked_until, until)
+
+    def _retry(self, msg: _Outgoing, error: str, count_attempt: bool = True) -> None:
+        if count_attempt:
+            msg.attempts += 1
+        if msg.attempts >= self.max_attempts:
+            self.stats.dropped += 1
+            logger.error(f"Dropping {msg.describe()} after {msg.attempts} attempt(s): {error}")
+            return
+        self.stats.retried += 1
+        if count_attempt:
+            # сетевая ошибка: короткая пауза для чата, с ростом по числу попыток
+            self._bucket(msg.chat_id).blocked_until = monotonic() + min(30.0, 2 ** msg.attempts)
+        self._push(msg)
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout)."""
+        deadline = monotonic() + timeout
+        while self.depth() and monotonic() < deadline:
+            self._wakeup.set()
+            await asyncio.sleep(0.05)
+        if self.depth():
+            logger.warning(f"Outbound queue closed with {self.depth()} unsent message(s)")
+        logger.info(
+            f"Outbound scheduler stopped: sent={self.stats.sent}, retried={self.stats.retried}, "
+            f"dropped={self.stats.dropped}, max_depth={self.stats.max_depth}"
+        )
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import re
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional, Sequence
+from datetime import date as dt_date, datetime, timedelta
+from pathlib import Path
+from time import monotonic, time as time_now
+from typing import AsyncIterator, Optional, Sequence
 import logging
 
 import aiosqlite
 
+from app.db import REBUILD_HELD_SQL, REBUILD_OCCUPANCY_SQL
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,39 +32,338 @@ class Booking:
     phone: str
     tg_user_id: Optional[str]
     calendar_event_id: Optional[str]
+    created_at: str = ""
+    service_id: int = 0
+
+
+@dataclass
+class HoldStats:
+    """Счётчики временных холдов слотов с момента старта процесса."""
+    placed: int = 0
+    converted: int = 0
+    released: int = 0
+    expired: int = 0
+    rejected: int = 0           # слот заняли бронями ещё до выбора времени
+    retries_avoided: int = 0    # отказ на выборе времени из-за чужих холдов вместо SlotFullError на подтверждении
+
+    @property
+    def conversion_rate(self) -> float:
+        finished = self.converted + self.released + self.expired
+        return self.converted / finished if finished else 0.0
+
+
+@dataclass
+class WriterStats:
+    """Счётчики группового коммита броней (Repo.run_booking_writer)."""
+    batches: int = 0
+    bookings: int = 0
+    rejected: int = 0
+    max_batch: int = 0
+
+    @property
+    def avg_batch(self) -> float:
+        return (self.bookings + self.rejected) / self.batches if self.batches else 0.0
+
+
+@dataclass
+class _BookingRequest:
+    found: Service
+    date: str
+    time: str
+    name: str
+    phone: str
+    tg_user_id: Optional[str]
+    hold_id: Optional[int]
+    future: Optional[asyncio.Future[int]] = None
+
+    @property
+    def slot(self) -> tuple[int, str, str]:
+        return self.found.id, self.date, self.time
+
+
+# ключ keyset-пагинации: (created_at, id) брони
+BookingCursor = tuple[str, int]
+
+
+@dataclass(frozen=True)
+class BookingFilter:
+    """Фильтры админского списка броней; None — без ограничения."""
+    service_id: Optional[int] = None
+    status: Optional[str] = None
+    date_from: Optional[dt_date] = None
+    date_to: Optional[dt_date] = None
+
+
+@dataclass
+class BookingPage:
+    bookings: list[Booking]
+    has_prev: bool
+    has_next: bool
+
+    @property
+    def first(self) -> Optional[BookingCursor]:
+        return (self.bookings[0].created_at, self.bookings[0].id) if self.bookings else None
+
+    @property
+    def last(self) -> Optional[BookingCursor]:
+        return (self.bookings[-1].created_at, self.bookings[-1].id) if self.bookings else None
+
+
+@dataclass(frozen=True)
+class OutboxSlot:
+    """Слот с накопившимися задачами синхронизации календаря (все строки id <= max_id)."""
+    service_id: int
+    date: str
+    time: str
+    max_id: int
+    attempts: int
 
 
-SERVICE_KEYS = {
-    "🏓 Падел (групповая)": "cap_padel_group",
-    "🏓 Падел (индивидуальная)": "cap_padel_ind",
-    "🏋️ Фитнес": "cap_fitness",
-}
+@dataclass(frozen=True)
+class Service:
+    id: int
+    name: str
+    capacity: int
+    enabled: bool = True
+
+
+class ServiceRegistry:
+    """
+    Снимок таблицы services в памяти: подписи, вместимость и клавиатура услуг
+    берутся отсюда без запросов к базе. Снимок неизменяемый — Repo заменяет
+    его целиком после правки услуг (см. Repo.reload_services).
+    """
+
+    def __init__(self, services: tuple[Service, ...] = ()):
+        self._by_id = {s.id: s for s in services}
+        self._by_name = {s.name: s for s in services}
+        # порядок кнопок — порядок добавления услуг
+        self.enabled = tuple(s for s in sorted(services, key=lambda s: s.id) if s.enabled)
+
+    def get(self, name: str) -> Optional[Service]:
+        return self._by_name.get(name)
+
+    def by_id(self, service_id: int) -> Optional[Service]:
+        return self._by_id.get(service_id)
+
+    def name(self, service_id: int) -> str:
+        """Подпись услуги для текстов; удалённая услуга показывается номером."""
+        found = self._by_id.get(service_id)
+        return found.name if found is not None else f"#{service_id}"
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+# название услуги берётся из services по service_id: переименование услуги видно и в истории
+BOOKING_COLUMNS = (
+    "id, status, (SELECT name FROM services WHERE services.id = bookings.service_id) AS service, service_id, "
+    "date, time, name, phone, tg_user_id, calendar_event_id, created_at"
+)
+
+
+def slot_at(date: str, time: str) -> str:
+    """dd.MM.yyyy + HH:mm -> 'YYYY-MM-DD HH:MM' (сортируемое начало слота)."""
+    return datetime.strptime(f"{date} {time}", "%d.%m.%Y %H:%M").strftime("%Y-%m-%d %H:%M")
+
+
+# trigram-индекс не ищет по кускам короче трёх символов
+SEARCH_MIN_TERM = 3
+
+
+def search_match_query(query: str) -> str:
+    """
+    Строка поиска админа -> выражение FTS5 MATCH по bookings_fts.
+
+    Запрос из одних цифр и оформления телефона ищется как кусок номера
+    ("999 12" -> phone_digits "99912"), иначе каждое слово — по имени, а
+    слова-цифры — по телефону. Пустая строка — искать нечего.
+    """
+    if re.fullmatch(r"[\d\s+()\-.]+", query):
+        terms = [("phone_digits", re.sub(r"\D", "", query))]
+    else:
+        terms = [
+            ("phone_digits", word) if word.isdigit() else ("name", word)
+            for word in query.split()
+        ]
+    return " AND ".join(
+        f'{column} : "{term.replace(chr(34), chr(34) * 2)}"'
+        for column, term in terms
+        if len(term) >= SEARCH_MIN_TERM
+    )
+
+
+def _booking_from_row(r: aiosqlite.Row) -> Booking:
+    return Booking(
+        id=int(r["id"]),
+        status=str(r["status"]),
+        service=str(r["service"]),
+        service_id=int(r["service_id"]),
+        date=str(r["date"]),
+        time=str(r["time"]),
+        name=str(r["name"]),
+        phone=str(r["phone"]),
+        tg_user_id=str(r["tg_user_id"]) if r["tg_user_id"] is not None else None,
+        calendar_event_id=str(r["calendar_event_id"]) if r["calendar_event_id"] is not None else None,
+        created_at=str(r["created_at"]),
+    )
 
 
 class Repo:
-    def __init__(self, db_path: str):
+    """
+    Репозиторий поверх SQLite.
+
+    Соединения долгоживущие: одно соединение-писатель (все записи сериализуются
+    через него под asyncio.Lock) и небольшой пул read-only соединений для чтения.
+    WAL позволяет читателям работать параллельно с писателем.
+    Пул открывается через open() на старте и закрывается через close().
+    """
+
+    def __init__(self, db_path: str, read_pool_size: int = 3, roles_ttl: float = 60.0):
         self.db_path = db_path
-        logger.debug(f"Repo initialized with db_path={db_path}")
+        self.read_pool_size = max(1, read_pool_size)
+        self.roles_ttl = roles_ttl
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue[aiosqlite.Connection]] = None
+        # process-local копия таблицы settings (см. reload_settings/set_setting)
+        self._settings: Optional[dict[str, str]] = None
+        # tg_user_id -> is_owner для всех строк admins; перечитывается раз в roles_ttl
+        self._roles: Optional[dict[str, bool]] = None
+        self._roles_loaded_at = 0.0
+        self.services = ServiceRegistry()
+        # будит воркер calendar_outbox после коммита брони/отмены
+        self.outbox_event = asyncio.Event()
+        self.hold_stats = HoldStats()
+        self.writer_stats = WriterStats()
+        # очередь группового коммита броней, пока работает run_booking_writer
+        self._booking_queue: Optional[asyncio.Queue[_BookingRequest]] = None
+        logger.debug(f"Repo initialized with db_path={db_path}, read_pool_size={self.read_pool_size}")
+
+    # Connection pool
+    async def _connect(self, readonly: bool = False) -> aiosqlite.Connection:
+        if readonly:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            db = await aiosqlite.connect(uri, uri=True)
+        else:
+            db = await aiosqlite.connect(self.db_path)
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA busy_timeout=5000")
+        if not readonly:
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    async def open(self) -> None:
+        if self._writer is not None:
+            return
+        logger.info(f"Opening connection pool: 1 writer + {self.read_pool_size} readers")
+        self._writer = await self._connect()
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.read_pool_size):
+            reader = await self._connect(readonly=True)
+            self._readers.append(reader)
+            self._idle_readers.put_nowait(reader)
+        logger.info("Connection pool opened")
+        await self.reload_settings()
+        await self.reload_services()
+        await self.reload_roles()
+
+    async def close(self) -> None:
+        if self._writer is None:
+            return
+        logger.info("Closing connection pool")
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        self._idle_readers = None
+        async with self._write_lock:
+            await self._writer.close()
+            self._writer = None
+        logger.info("Connection pool closed")
+
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._idle_readers is None:
+            raise RuntimeError("Repo is not opened, call Repo.open() first")
+        db = await self._idle_readers.get()
+        try:
+            yield db
+        finally:
+            self._idle_readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            raise RuntimeError("Repo is not opened, call Repo.open() first")
+        async with self._write_lock:
+            db = self._writer
+            try:
+                yield db
+            except BaseException:
+                if db.in_transaction:
+                    await db.rollback()
+                    logger.debug("Write transaction rolled back")
+                raise
+            else:
+                if db.in_transaction:
+                    await db.commit()
+
+    # Settings cache
+    async def reload_settings(self) -> None:
+        """Перечитывает всю таблицу settings одним запросом в кэш."""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT key, value FROM settings")
+            rows = await cursor.fetchall()
+        self._settings = {str(r["key"]): str(r["value"]) for r in rows}
+        logger.debug(f"Settings cache loaded: {len(self._settings)} keys")
+
+    async def run_settings_reloader(self, interval: float) -> None:
+        """Фоновая задача: периодически подтягивает изменения settings из других процессов."""
+        logger.info(f"Settings reloader started, interval={interval}s")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_settings()
+                await self.reload_services()
+            except Exception as e:
+                logger.error(f"Failed to reload settings: {e}", exc_info=True)
 
     async def _get_setting(self, key: str) -> str:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("SELECT value FROM settings WHERE key = ?", (key,))
-            row = await cursor.fetchone()
-            if not row:
-                logger.error(f"Missing setting: {key}")
-                raise RuntimeError(f"Missing setting: {key}")
-            logger.debug(f"Retrieved setting {key}={row['value']}")
-            return str(row["value"])
-
-    async def get_capacity(self, service: str) -> int:
-        k = SERVICE_KEYS.get(service)
-        if not k:
-            logger.error(f"Unknown service: {service}")
-            raise RuntimeError(f"Unknown service: {service}")
-        capacity = int(await self._get_setting(k))
-        logger.debug(f"Service '{service}' capacity: {capacity}")
-        return capacity
+        if self._settings is None:
+            await self.reload_settings()
+        value = self._settings.get(key)
+        if value is None:
+            logger.error(f"Missing setting: {key}")
+            raise RuntimeError(f"Missing setting: {key}")
+        return value
+
+    async def set_setting(self, key: str, value: str) -> None:
+        logger.info(f"Setting {key}={value}")
+        async with self._write() as db:
+            await db.execute(
+                """
+                INSERT INTO settings(key, value) VALUES(?, ?)
+                ON CONFLICT(key) DO UPDATE SET value=excluded.value
+                """,
+                (key, str(value)),
+            )
+        # write-through: кэш обновляем только после успешного коммита
+        if self._settings is not None:
+            self._settings[key] = str(value)
+
+    def _service(self, service_id: int) -> Service:
+        found = self.services.by_id(service_id)
+        if found is None:
+            logger.error(f"Unknown service_id: {service_id}")
+            raise RuntimeError(f"Unknown service_id: {service_id}")
+        return found
+
+    async def get_capacity(self, service_id: int) -> int:
+        return self._service(service_id).capacity
 
     async def get_slot_params(self) -> tuple[int, int, int]:
         start = int(await self._get_setting("work_start_hour"))
@@ -66,22 +372,18 @@ class Repo:
         logger.debug(f"Slot params: {start}:00-{end}:00, slot_minutes={slot_minutes}")
         return start, end, slot_minutes
 
-    async def count_active(self, service: str, date: str, time: str) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
+    async def count_active(self, service_id: int, date: str, time: str) -> int:
+        async with self._read() as db:
             cursor = await db.execute(
-                "SELECT COUNT(*) FROM bookings WHERE status='active' AND service=? AND date=? AND time=?",
-                (service, date, time),
+                "SELECT used FROM slot_occupancy WHERE service_id=? AND date=? AND time=?",
+                (service_id, date, time),
             )
             row = await cursor.fetchone()
             count = int(row[0]) if row else 0
-            logger.debug(f"Active bookings for {service} on {date} at {time}: {count}")
+            logger.debug(f"Active bookings for {service_id} on {date} at {time}: {count}")
             return count
 
-    async def get_available_times(self, service: str, date: str) -> list[str]:
-        logger.info(f"Getting available times for {service} on {date}")
-        cap = await self.get_capacity(service)
-        logger.debug(f"Slot capacity: {cap}")
-        
+    async def _all_times(self) -> list[str]:
         start_hour, end_hour, slot_minutes = await self.get_slot_params()
         logger.debug(f"Working hours: {start_hour}:00 - {end_hour}:00, slot duration: {slot_minutes} minutes")
 
@@ -90,180 +392,687 @@ class Repo:
             logger.error(f"Only 60-minute slots supported, got {slot_minutes}")
             raise RuntimeError("Only 60-minute slots supported in this MVP")
 
-        all_times = [f"{h:02d}:00" for h in range(start_hour, end_hour + 1)]
+        return [f"{h:02d}:00" for h in range(start_hour, end_hour + 1)]
+
+    async def get_available_times(self, service_id: int, date: str) -> list[str]:
+        logger.info(f"Getting available times for {service_id} on {date}")
+        cap = await self.get_capacity(service_id)
+        logger.debug(f"Slot capacity: {cap}")
+
+        all_times = await self._all_times()
         logger.debug(f"All time slots: {all_times}")
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+
+        async with self._read() as db:
+            # места под холдами (слот выбран, бронь ещё не подтверждена) тоже заняты
             cursor = await db.execute(
-                """
-                SELECT time, COUNT(*) as cnt
-                FROM bookings
-                WHERE status='active' AND service=? AND date=?
-                GROUP BY time
-                """,
-                (service, date),
+                "SELECT time, used + held AS taken FROM slot_occupancy WHERE service_id=? AND date=?",
+                (service_id, date),
             )
             rows = await cursor.fetchall()
-            busy = {str(r["time"]): int(r["cnt"]) for r in rows}
+            busy = {str(r["time"]): int(r["taken"]) for r in rows}
             logger.debug(f"Current bookings: {busy}")
 
         available = [t for t in all_times if busy.get(t, 0) < cap]
-        logger.info(f"Available times for {service} on {date}: {available} ({len(available)} slots)")
+        logger.info(f"Available times for {service_id} on {date}: {available} ({len(available)} slots)")
         return available
 
+    async def get_availability_range(self, service_id: int, date_from: dt_date, date_to: dt_date) -> dict[str, dict[str, int]]:
+        """
+        Свободные места по дням и слотам за диапазон дат (включительно) одним запросом.
+        Возвращает {dd.MM.yyyy: {HH:mm: free}}.
+        """
+        cap = await self.get_capacity(service_id)
+        all_times = await self._all_times()
+        days = [
+            (date_from + timedelta(days=i)).strftime("%d.%m.%Y")
+            for i in range((date_to - date_from).days + 1)
+        ]
+        if not days:
+            return {}
+
+        # range scan по idx_slot_occupancy_slot_at (service_id, slot_at, used)
+        async with self._read() as db:
+            cursor = await db.execute(
+                """
+                SELECT slot_at, used + held AS taken
+                FROM slot_occupancy
+                WHERE service_id=? AND slot_at >= ? AND slot_at < ?
+                """,
+                (service_id, date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()),
+            )
+            rows = await cursor.fetchall()
+        busy = {}
+        for r in rows:
+            start = datetime.strptime(str(r["slot_at"]), "%Y-%m-%d %H:%M")
+            busy[(start.strftime("%d.%m.%Y"), start.strftime("%H:%M"))] = int(r["taken"])
+
+        availability = {
+            day: {t: max(0, cap - busy.get((day, t), 0)) for t in all_times}
+            for day in days
+        }
+        logger.debug(f"Availability for {service_id} {days[0]}..{days[-1]}: {len(busy)} busy slot(s)")
+        return availability
+
+    async def _reap_expired_holds(self, db: aiosqlite.Connection, now: float, slot: Optional[tuple] = None) -> int:
+        """
+        Снимает истёкшие холды (все или одного слота) и возвращает их места в
+        slot_occupancy. hold_stats.expired вызывающий увеличивает сам, после
+        коммита: откат транзакции возвращает холды на место.
+        """
+        where, params = "expires_at <= ?", [now]
+        if slot is not None:
+            where += " AND service_id=? AND date=? AND time=?"
+            params.extend(slot)
+        cursor = await db.execute(
+            f"SELECT service_id, date, time, COUNT(*) AS n FROM slot_holds WHERE {where} GROUP BY service_id, date, time",
+            params,
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return 0
+        await db.executemany(
+            "UPDATE slot_occupancy SET held=MAX(held-?, 0) WHERE service_id=? AND date=? AND time=?",
+            [(r["n"], r["service_id"], r["date"], r["time"]) for r in rows],
+        )
+        await db.execute(f"DELETE FROM slot_holds WHERE {where}", params)
+        return sum(int(r["n"]) for r in rows)
+
+    async def _release_user_holds(self, db: aiosqlite.Connection, tg_user_id: str) -> int:
+        cursor = await db.execute(
+            "SELECT service_id, date, time FROM slot_holds WHERE tg_user_id=?",
+            (tg_user_id,),
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return 0
+        await db.executemany(
+            "UPDATE slot_occupancy SET held=MAX(held-1, 0) WHERE service_id=? AND date=? AND time=?",
+            [(r["service_id"], r["date"], r["time"]) for r in rows],
+        )
+        await db.execute("DELETE FROM slot_holds WHERE tg_user_id=?", (tg_user_id,))
+        return len(rows)
+
+    async def hold_slot(
+        self,
+        service_id: int,
+        date: str,
+        time: str,
+        tg_user_id: str,
+        ttl: float,
+    ) -> int:
+        """
+        Временно занимает место в слоте за пользователем (пока он вводит имя и телефон).
+        Прежний холд пользователя снимается. SlotFullError — мест уже нет.
+        """
+        cap = await self.get_capacity(service_id)
+        now = time_now()
+        async with self._write() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            released = await self._release_user_holds(db, tg_user_id)
+            expired = await self._reap_expired_holds(db, now, (service_id, date, time))
+            await db.execute(
+                "INSERT OR IGNORE INTO slot_occupancy(service_id, date, time, used, slot_at) VALUES(?, ?, ?, 0, ?)",
+                (service_id, date, time, slot_at(date, time)),
+            )
+            cursor = await db.execute(
+                "UPDATE slot_occupancy SET held=held+1 WHERE service_id=? AND date=? AND time=? AND used + held < ?",
+                (service_id, date, time, cap),
+            )
+            if cursor.rowcount == 0:
+                cursor = await db.execute(
+                    "SELECT used FROM slot_occupancy WHERE service_id=? AND date=? AND time=?",
+                    (service_id, date, time),
+                )
+                row = await cursor.fetchone()
+                if int(row["used"]) < cap:
+                    # место есть только за счёт чужих холдов: без них пользователь ввёл бы
+                    # имя и телефон, и одно из подтверждений упало бы в SlotFullError
+                    self.hold_stats.retries_avoided += 1
+                else:
+                    self.hold_stats.rejected += 1
+                logger.info(f"Cannot hold {service_id} on {date} at {time}: slot is full (capacity: {cap})")
+                raise SlotFullError()
+            cursor = await db.execute(
+                "INSERT INTO slot_holds(service_id, date, time, tg_user_id, expires_at) VALUES(?, ?, ?, ?, ?)",
+                (service_id, date, time, tg_user_id, now + ttl),
+            )
+            hold_id = int(cursor.lastrowid)
+        self.hold_stats.placed += 1
+        self.hold_stats.released += released
+        self.hold_stats.expired += expired
+        logger.info(f"Hold {hold_id} placed on {service_id} {date} {time} for user {tg_user_id} ({ttl:.0f}s)")
+        return hold_id
+
+    async def release_hold(self, hold_id: int) -> None:
+        async with self._write() as db:
+            cursor = await db.execute(
+                "DELETE FROM slot_holds WHERE id=? RETURNING service_id, date, time",
+                (hold_id,),
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+            if row is None:
+                return
+            await db.execute(
+                "UPDATE slot_occupancy SET held=MAX(held-1, 0) WHERE service_id=? AND date=? AND time=?",
+                (row["service_id"], row["date"], row["time"]),
+            )
+        self.hold_stats.released += 1
+        logger.info(f"Hold {hold_id} released")
+
+    async def reap_expired_holds(self) -> int:
+        async with self._write() as db:
+            expired = await self._reap_expired_holds(db, time_now())
+        self.hold_stats.expired += expired
+        if expired:
+            logger.info(f"Released {expired} expired slot hold(s)")
+        return expired
+
+    async def run_hold_sweeper(self, interval: float) -> None:
+        logger.info(f"Slot hold sweeper scheduled every {interval}s")
+        while True:
+            try:
+                await self.reap_expired_holds()
+            except Exception as e:
+                logger.error(f"Slot hold sweep failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
     async def create_booking(
         self,
         *,
-        service: str,
+        service_id: int,
         date: str,
         time: str,
         name: str,
         phone: str,
         tg_user_id: Optional[str],
+        hold_id: Optional[int] = None,
     ) -> int:
-        logger.info(f"Creating booking: {service} on {date} at {time} for {name} ({phone}), tg_user_id={tg_user_id}")
+        logger.info(f"Creating booking: {service_id} on {date} at {time} for {name} ({phone}), tg_user_id={tg_user_id}")
+        request = _BookingRequest(self._service(service_id), date, time, name, phone, tg_user_id, hold_id)
+        if self._booking_queue is not None:
+            # групповой коммит: бронь запишет run_booking_writer вместе с соседними
+            request.future = asyncio.get_running_loop().create_future()
+            self._booking_queue.put_nowait(request)
+            return await request.future
+
+        now = time_now()
         # делаем атомарно: проверка вместимости + insert под транзакцией
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("BEGIN IMMEDIATE")  # блокируем на запись
             logger.debug("Started transaction for booking creation")
-            cap = await self.get_capacity(service)
+            expired = await self._reap_expired_holds(db, now, request.slot)
+            booking_id, held = await self._insert_booking(db, request, now)
+        self.outbox_event.set()
+        self.hold_stats.expired += expired
+        if held:
+            self.hold_stats.converted += 1
+        logger.info(f"Booking created successfully with id={booking_id} (from hold: {held})")
+        return booking_id
 
+    async def _insert_booking(self, db: aiosqlite.Connection, request: _BookingRequest, now: float) -> tuple[int, bool]:
+        """
+        Проверка вместимости и insert одной брони в уже открытой транзакции;
+        истёкшие холды слота вызывающий снимает до неё. До SlotFullError
+        успевает только безвредная пустая строка slot_occupancy, так что
+        откатывать её не нужно. Возвращает (id брони, переведена ли она из холда).
+        """
+        service_id, date, time = request.slot
+        cap = request.found.capacity
+
+        held = False
+        if request.hold_id is not None:
+            # живой холд этого слота: место уже зарезервировано, переводим его в бронь
             cursor = await db.execute(
-                "SELECT COUNT(*) FROM bookings WHERE status='active' AND service=? AND date=? AND time=?",
-                (service, date, time),
+                "DELETE FROM slot_holds WHERE id=? AND service_id=? AND date=? AND time=? AND expires_at > ?",
+                (request.hold_id, service_id, date, time, now),
             )
-            row = await cursor.fetchone()
-            cnt = int(row[0]) if row else 0
-            logger.debug(f"Current bookings in slot: {cnt}/{cap}")
-            if cnt >= cap:
-                logger.warning(f"Slot full for {service} on {date} at {time} (capacity: {cap})")
-                await db.execute("ROLLBACK")
+            held = cursor.rowcount > 0
+
+        if held:
+            await db.execute(
+                "UPDATE slot_occupancy SET used=used+1, held=MAX(held-1, 0) WHERE service_id=? AND date=? AND time=?",
+                (service_id, date, time),
+            )
+        else:
+            # проверка вместимости = условный инкремент счётчика слота
+            await db.execute(
+                "INSERT OR IGNORE INTO slot_occupancy(service_id, date, time, used, slot_at) VALUES(?, ?, ?, 0, ?)",
+                (service_id, date, time, slot_at(date, time)),
+            )
+            cursor = await db.execute(
+                "UPDATE slot_occupancy SET used=used+1 WHERE service_id=? AND date=? AND time=? AND used + held < ?",
+                (service_id, date, time, cap),
+            )
+            if cursor.rowcount == 0:
+                logger.warning(f"Slot full for {service_id} on {date} at {time} (capacity: {cap})")
                 raise SlotFullError()
 
-            now = datetime.utcnow().isoformat(timespec="seconds")
-            cur = await db.execute(
-                """
-                INSERT INTO bookings(created_at, status, service, date, time, name, phone, tg_user_id, calendar_event_id)
-                VALUES(?, 'active', ?, ?, ?, ?, ?, ?, NULL)
-                """,
-                (now, service, date, time, name, phone, tg_user_id),
+        created_at = datetime.utcnow().isoformat(timespec="seconds")
+        cur = await db.execute(
+            """
+            INSERT INTO bookings(
+              created_at, status, service, service_id, date, time, name, phone, tg_user_id, calendar_event_id, slot_at
             )
-            booking_id = int(cur.lastrowid)
-            await db.commit()
-            logger.info(f"Booking created successfully with id={booking_id}")
-            return booking_id
+            VALUES(?, 'active', ?, ?, ?, ?, ?, ?, ?, NULL, ?)
+            """,
+            (created_at, request.found.name, service_id, date, time, request.name, request.phone,
+             request.tg_user_id, slot_at(date, time)),
+        )
+        await self._enqueue_calendar_sync(db, service_id, date, time)
+        return int(cur.lastrowid), held
+
+    async def run_booking_writer(self, max_batch: int = 64, max_wait: float = 0.002) -> None:
+        """
+        Фоновая задача группового коммита броней: пока она работает,
+        create_booking не пишет сам, а ставит запрос в очередь. Задача берёт
+        до max_batch запросов (подождав max_wait после первого, чтобы
+        собрались соседи) и записывает их одной транзакцией: один захват
+        писателя и один коммит на пачку вместо одного на бронь. Каждый
+        вызывающий получает свой id или свой SlotFullError.
+        """
+        logger.info(f"Booking writer started (batch up to {max_batch}, wait {max_wait * 1000:.0f}ms)")
+        queue: asyncio.Queue[_BookingRequest] = asyncio.Queue()
+        self._booking_queue = queue
+        batch: list[_BookingRequest] = []
+        write: Optional[asyncio.Future] = None
+        try:
+            while True:
+                batch = [await queue.get()]
+                if max_wait > 0 and queue.qsize() < max_batch - 1:
+                    await asyncio.sleep(max_wait)
+                while len(batch) < max_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                # запись пачки и раздача результатов — под shield: отмена между
+                # коммитом и set_result оставила бы записанные брони без ответа
+                write = asyncio.ensure_future(self._write_booking_batch(batch))
+                await asyncio.shield(write)
+                batch, write = [], None
+        finally:
+            self._booking_queue = None
+            if write is not None:
+                # пачку уже пишут: дожидаемся, вызывающие получат свой id или SlotFullError
+                await asyncio.wait([write])
+            # запросы, до которых запись не дошла: вызывающие получают ошибку,
+            # а не вечное ожидание
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(RuntimeError("Booking writer stopped"))
+            logger.info("Booking writer stopped")
+
+    async def _write_booking_batch(self, batch: list[_BookingRequest]) -> None:
+        # брошенные запросы (хэндлер отменён) не пишем
+        batch = [r for r in batch if not r.future.done()]
+        if not batch:
+            return
+        now = time_now()
+        results: list[tuple[_BookingRequest, int, bool]] = []
+        rejected: list[_BookingRequest] = []
+        expired = 0
+        try:
+            async with self._write() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for request in batch:
+                    # снятые холды коммитятся вместе с пачкой, даже если слот оказался полон
+                    expired += await self._reap_expired_holds(db, now, request.slot)
+                    try:
+                        booking_id, held = await self._insert_booking(db, request, now)
+                    except SlotFullError:
+                        rejected.append(request)
+                    else:
+                        results.append((request, booking_id, held))
+        except Exception as e:
+            # пачка откатилась целиком: пишем её по одной, чтобы ошибка досталась только своему запросу
+            logger.error(f"Booking batch of {len(batch)} failed, retrying one by one: {e}", exc_info=True)
+            for request in batch:
+                await self._write_booking_alone(request)
+            return
+
+        self.outbox_event.set()
+        self.hold_stats.expired += expired
+        self.writer_stats.batches += 1
+        self.writer_stats.bookings += len(results)
+        self.writer_stats.rejected += len(rejected)
+        self.writer_stats.max_batch = max(self.writer_stats.max_batch, len(batch))
+        for request, booking_id, held in results:
+            if held:
+                self.hold_stats.converted += 1
+            if not request.future.done():
+                request.future.set_result(booking_id)
+        for request in rejected:
+            if not request.future.done():
+                request.future.set_exception(SlotFullError())
+        logger.info(f"Booking batch committed: {len(results)} created, {len(rejected)} slot full")
+
+    async def _write_booking_alone(self, request: _BookingRequest) -> None:
+        try:
+            async with self._write() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                now = time_now()
+                expired = await self._reap_expired_holds(db, now, request.slot)
+                booking_id, held = await self._insert_booking(db, request, now)
+        except Exception as e:
+            if isinstance(e, SlotFullError):
+                self.writer_stats.rejected += 1
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        self.outbox_event.set()
+        self.hold_stats.expired += expired
+        self.writer_stats.batches += 1
+        self.writer_stats.bookings += 1
+        if held:
+            self.hold_stats.converted += 1
+        if not request.future.done():
+            request.future.set_result(booking_id)
+
+    async def rebuild_slot_occupancy(self) -> int:
+        """Пересчитывает slot_occupancy из bookings и slot_holds; возвращает число занятых слотов."""
+        logger.info("Rebuilding slot_occupancy from bookings")
+        async with self._write() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            for statement in REBUILD_OCCUPANCY_SQL:
+                await db.execute(statement)
+            await db.execute(REBUILD_HELD_SQL)
+            cursor = await db.execute("SELECT COUNT(*) FROM slot_occupancy")
+            row = await cursor.fetchone()
+        slots = int(row[0])
+        logger.info(f"slot_occupancy rebuilt: {slots} slot(s)")
+        return slots
 
     async def cancel_booking(self, booking_id: int) -> None:
         logger.info(f"Cancelling booking id={booking_id}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute(
-                "SELECT service, date, time FROM bookings WHERE id=?",
+                "SELECT service_id, date, time, status FROM bookings WHERE id=?",
                 (booking_id,),
             )
             row = await cursor.fetchone()
             if row:
                 logger.debug(f"Booking {booking_id}: {row[0]} on {row[1]} at {row[2]}")
-            
+
             await db.execute(
                 "UPDATE bookings SET status='cancelled' WHERE id=?",
                 (booking_id,),
             )
-            await db.commit()
+            if row and row["status"] == "active":
+                await db.execute(
+                    "UPDATE slot_occupancy SET used=MAX(used-1, 0) WHERE service_id=? AND date=? AND time=?",
+                    (row["service_id"], row["date"], row["time"]),
+                )
+                await self._enqueue_calendar_sync(db, row["service_id"], row["date"], row["time"])
+        self.outbox_event.set()
         logger.info(f"Booking id={booking_id} cancelled successfully")
 
-    async def attach_event_id_for_slot(self, service: str, date: str, time: str, event_id: str) -> None:
-        logger.debug(f"Attaching event_id={event_id} to slot {service} on {date} at {time}")
-        # сохраняем event_id в записях этого слота (чтобы потом можно было найти/обновить)
-        async with aiosqlite.connect(self.db_path) as db:
+    # Slot events (как лист SlotEvents в AppsScript): один eventId на слот
+    async def get_slot_event_id(self, service_id: int, date: str, time: str) -> Optional[str]:
+        async with self._read() as db:
+            cursor = await db.execute(
+                "SELECT event_id FROM slot_events WHERE service_id=? AND date=? AND time=?",
+                (service_id, date, time),
+            )
+            row = await cursor.fetchone()
+        return str(row[0]) if row else None
+
+    async def set_slot_event_id(self, service_id: int, date: str, time: str, event_id: str) -> None:
+        logger.debug(f"Storing event_id={event_id} for slot {service_id} on {date} at {time}")
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        async with self._write() as db:
+            await db.execute(
+                """
+                INSERT INTO slot_events(service_id, date, time, event_id, updated_at) VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(service_id, date, time) DO UPDATE SET event_id=excluded.event_id, updated_at=excluded.updated_at
+                """,
+                (service_id, date, time, event_id, now),
+            )
+
+    async def delete_slot_event(self, service_id: int, date: str, time: str) -> None:
+        logger.debug(f"Removing event mapping for slot {service_id} on {date} at {time}")
+        async with self._write() as db:
+            await db.execute(
+                "DELETE FROM slot_events WHERE service_id=? AND date=? AND time=?",
+                (service_id, date, time),
+            )
+
+    async def save_slot_events(
+        self,
+        upserted: dict[tuple[int, str, str], str],
+        deleted: Sequence[tuple[int, str, str]],
+    ) -> None:
+        """Пакетное сохранение результатов CalendarPublisher.upsert_slots одной транзакцией."""
+        if not upserted and not deleted:
+            return
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        async with self._write() as db:
+            await db.executemany(
+                """
+                INSERT INTO slot_events(service_id, date, time, event_id, updated_at) VALUES(?, ?, ?, ?, ?)
+                ON CONFLICT(service_id, date, time) DO UPDATE SET event_id=excluded.event_id, updated_at=excluded.updated_at
+                """,
+                [(*slot, event_id, now) for slot, event_id in upserted.items()],
+            )
+            await db.executemany(
+                "DELETE FROM slot_events WHERE service_id=? AND date=? AND time=?",
+                list(deleted),
+            )
+        logger.debug(f"Slot events saved: {len(upserted)} upserted, {len(deleted)} deleted")
+
+    async def get_slots_by_event_ids(self, event_ids: Sequence[str]) -> dict[str, tuple[int, str, str]]:
+        result: dict[str, tuple[int, str, str]] = {}
+        ids = list(event_ids)
+        async with self._read() as db:
+            for offset in range(0, len(ids), 500):
+                chunk = ids[offset:offset + 500]
+                cursor = await db.execute(
+                    f"SELECT event_id, service_id, date, time FROM slot_events WHERE event_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for r in await cursor.fetchall():
+                    result[str(r["event_id"])] = (int(r["service_id"]), str(r["date"]), str(r["time"]))
+        return result
+
+    async def get_slot_occupancy(self, slots: Sequence[tuple[int, str, str]]) -> dict[tuple[int, str, str], int]:
+        """Число активных броней для набора слотов одним запросом к slot_occupancy."""
+        occupancy = {slot: 0 for slot in slots}
+        slots = list(occupancy)
+        async with self._read() as db:
+            for offset in range(0, len(slots), 300):
+                chunk = slots[offset:offset + 300]
+                cursor = await db.execute(
+                    f"""
+                    SELECT service_id, date, time, used
+                    FROM slot_occupancy
+                    WHERE (service_id, date, time) IN (VALUES {','.join(['(?, ?, ?)'] * len(chunk))})
+                    """,
+                    [v for slot in chunk for v in slot],
+                )
+                for r in await cursor.fetchall():
+                    occupancy[(int(r["service_id"]), str(r["date"]), str(r["time"]))] = int(r["used"])
+        return occupancy
+
+    async def get_unmapped_busy_slots(self, date_from: dt_date) -> list[tuple[int, str, str]]:
+        """Слоты начиная с date_from с активными бронями, для которых не сохранено событие календаря."""
+        async with self._read() as db:
             cursor = await db.execute(
                 """
-                UPDATE bookings
-                SET calendar_event_id=?
-                WHERE status='active' AND service=? AND date=? AND time=?
+                SELECT o.service_id, o.date, o.time
+                FROM slot_occupancy o
+                LEFT JOIN slot_events se ON se.service_id=o.service_id AND se.date=o.date AND se.time=o.time
+                WHERE o.slot_at >= ? AND o.used > 0 AND se.event_id IS NULL
                 """,
-                (event_id, service, date, time),
+                (date_from.isoformat(),),
             )
-            await db.commit()
-            rows_affected = cursor.rowcount
-            logger.debug(f"Event_id attached to {rows_affected} booking(s)")
+            rows = await cursor.fetchall()
+        return [(int(r[0]), str(r[1]), str(r[2])) for r in rows]
 
-    async def get_active_bookings_for_slot(self, service: str, date: str, time: str) -> list[Booking]:
-        logger.debug(f"Fetching active bookings for {service} on {date} at {time}")
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def get_calendar_sync_token(self, calendar_id: str) -> Optional[str]:
+        async with self._read() as db:
             cursor = await db.execute(
+                "SELECT sync_token FROM calendar_sync_state WHERE calendar_id=?",
+                (calendar_id,),
+            )
+            row = await cursor.fetchone()
+        return str(row[0]) if row and row[0] is not None else None
+
+    async def set_calendar_sync_token(self, calendar_id: str, sync_token: Optional[str]) -> None:
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        async with self._write() as db:
+            await db.execute(
+                """
+                INSERT INTO calendar_sync_state(calendar_id, sync_token, updated_at) VALUES(?, ?, ?)
+                ON CONFLICT(calendar_id) DO UPDATE SET sync_token=excluded.sync_token, updated_at=excluded.updated_at
+                """,
+                (calendar_id, sync_token, now),
+            )
+
+    # Calendar outbox
+    async def _enqueue_calendar_sync(self, db: aiosqlite.Connection, service_id: int, date: str, time: str) -> None:
+        # вызывается внутри транзакции брони/отмены
+        now = datetime.utcnow().isoformat(timespec="seconds")
+        await db.execute(
+            "INSERT INTO calendar_outbox(service_id, date, time, created_at) VALUES(?, ?, ?, ?)",
+            (service_id, date, time, now),
+        )
+        logger.debug(f"Calendar sync enqueued for {service_id} on {date} at {time}")
+
+    async def enqueue_calendar_syncs(self, slots: Sequence[tuple[int, str, str]]) -> None:
+        if not slots:
+            return
+        async with self._write() as db:
+            for service_id, date, time in slots:
+                await self._enqueue_calendar_sync(db, service_id, date, time)
+        self.outbox_event.set()
+        logger.info(f"Enqueued calendar sync for {len(slots)} slot(s)")
+
+    async def get_due_outbox_slots(self, now: float, limit: int = 20) -> list[OutboxSlot]:
+        """Созревшие задачи, схлопнутые до одной на (service_id, date, time)."""
+        async with self._read() as db:
+            cursor = await db.execute(
+                """
+                SELECT service_id, date, time, MAX(id) AS max_id, MAX(attempts) AS attempts
+                FROM calendar_outbox
+                WHERE next_attempt_at <= ?
+                GROUP BY service_id, date, time
+                ORDER BY MIN(id)
+                LIMIT ?
+                """,
+                (now, limit),
+            )
+            rows = await cursor.fetchall()
+        return [
+            OutboxSlot(
+                service_id=int(r["service_id"]),
+                date=str(r["date"]),
+                time=str(r["time"]),
+                max_id=int(r["max_id"]),
+                attempts=int(r["attempts"]),
+            )
+            for r in rows
+        ]
+
+    async def get_next_outbox_attempt(self) -> Optional[float]:
+        async with self._read() as db:
+            cursor = await db.execute("SELECT MIN(next_attempt_at) FROM calendar_outbox")
+            row = await cursor.fetchone()
+        return float(row[0]) if row and row[0] is not None else None
+
+    async def complete_outbox_slot(self, slot: OutboxSlot) -> None:
+        # строки, добавленные после выборки (id > max_id), остаются на следующий проход
+        async with self._write() as db:
+            await db.execute(
+                "DELETE FROM calendar_outbox WHERE service_id=? AND date=? AND time=? AND id<=?",
+                (slot.service_id, slot.date, slot.time, slot.max_id),
+            )
+
+    async def fail_outbox_slot(self, slot: OutboxSlot, error: str, retry_at: float) -> None:
+        async with self._write() as db:
+            await db.execute(
                 """
-                SELECT id, status, service, date, time, name, phone, tg_user_id, calendar_event_id
+                UPDATE calendar_outbox
+                SET attempts=attempts+1, next_attempt_at=?, last_error=?
+                WHERE service_id=? AND date=? AND time=? AND id<=?
+                """,
+                (retry_at, error[:500], slot.service_id, slot.date, slot.time, slot.max_id),
+            )
+
+    async def get_active_bookings_for_slot(self, service_id: int, date: str, time: str) -> list[Booking]:
+        logger.debug(f"Fetching active bookings for {service_id} on {date} at {time}")
+        async with self._read() as db:
+            cursor = await db.execute(
+                f"""
+                SELECT {BOOKING_COLUMNS}
                 FROM bookings
-                WHERE status='active' AND service=? AND date=? AND time=?
+                WHERE service_id=? AND date=? AND time=? AND status='active'
                 ORDER BY id ASC
                 """,
-                (service, date, time),
+                (service_id, date, time),
             )
             rows = await cursor.fetchall()
-            bookings = [
-                Booking(
-                    id=int(r["id"]),
-                    status=str(r["status"]),
-                    service=str(r["service"]),
-                    date=str(r["date"]),
-                    time=str(r["time"]),
-                    name=str(r["name"]),
-                    phone=str(r["phone"]),
-                    tg_user_id=str(r["tg_user_id"]) if r["tg_user_id"] is not None else None,
-                    calendar_event_id=str(r["calendar_event_id"]) if r["calendar_event_id"] is not None else None,
-                )
-                for r in rows
-            ]
+            bookings = [_booking_from_row(r) for r in rows]
             logger.debug(f"Found {len(bookings)} active bookings for slot")
             return bookings
     # Admin Methods
+    async def reload_roles(self) -> None:
+        async with self._read() as db:
+            cursor = await db.execute("SELECT tg_user_id, is_owner FROM admins")
+            rows = await cursor.fetchall()
+        self._roles = {str(r[0]): bool(r[1]) for r in rows}
+        self._roles_loaded_at = monotonic()
+        logger.debug(f"Admin roles cache loaded: {len(self._roles)} admins")
+
+    async def _get_roles(self) -> dict[str, bool]:
+        # TTL нужен, чтобы подхватывать правки admins из других процессов
+        if self._roles is None or monotonic() - self._roles_loaded_at > self.roles_ttl:
+            await self.reload_roles()
+        return self._roles
+
+    async def get_admin_role(self, tg_user_id: str) -> Optional[str]:
+        """Возвращает 'owner', 'admin' или None одним обращением к кэшу ролей."""
+        roles = await self._get_roles()
+        if tg_user_id not in roles:
+            return None
+        return "owner" if roles[tg_user_id] else "admin"
+
+    async def get_admin_ids(self) -> list[str]:
+        """Все админы (включая владельца) из кэша ролей — получатели уведомлений."""
+        return list(await self._get_roles())
+
     async def is_admin(self, tg_user_id: str) -> bool:
-        logger.debug(f"Checking if user {tg_user_id} is admin")
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT id FROM admins WHERE tg_user_id=?",
-                (tg_user_id,),
-            )
-            row = await cursor.fetchone()
-            is_admin_user = row is not None
-            logger.debug(f"User {tg_user_id} is_admin: {is_admin_user}")
-            return is_admin_user
+        is_admin_user = await self.get_admin_role(tg_user_id) is not None
+        logger.debug(f"User {tg_user_id} is_admin: {is_admin_user}")
+        return is_admin_user
 
     async def is_owner(self, tg_user_id: str) -> bool:
-        logger.debug(f"Checking if user {tg_user_id} is owner")
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT is_owner FROM admins WHERE tg_user_id=?",
-                (tg_user_id,),
-            )
-            row = await cursor.fetchone()
-            is_owner_user = row is not None and bool(row[0])
-            logger.debug(f"User {tg_user_id} is_owner: {is_owner_user}")
-            return is_owner_user
+        is_owner_user = await self.get_admin_role(tg_user_id) == "owner"
+        logger.debug(f"User {tg_user_id} is_owner: {is_owner_user}")
+        return is_owner_user
 
     async def add_admin(self, tg_user_id: str, username: Optional[str] = None, is_owner: bool = False) -> None:
         logger.info(f"Adding admin: tg_user_id={tg_user_id}, username={username}, is_owner={is_owner}")
         now = datetime.utcnow().isoformat(timespec="seconds")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "INSERT OR IGNORE INTO admins(tg_user_id, username, is_owner, created_at) VALUES(?, ?, ?, ?)",
                 (tg_user_id, username, int(is_owner), now),
             )
-            await db.commit()
+        if self._roles is not None:
+            # INSERT OR IGNORE не меняет существующую строку — и кэш тоже
+            self._roles.setdefault(tg_user_id, is_owner)
         logger.info(f"Admin added successfully: {tg_user_id}")
 
     async def remove_admin(self, tg_user_id: str) -> None:
         logger.info(f"Removing admin: tg_user_id={tg_user_id}")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM admins WHERE tg_user_id=?", (tg_user_id,))
-            await db.commit()
+        if self._roles is not None:
+            self._roles.pop(tg_user_id, None)
         logger.info(f"Admin removed successfully: {tg_user_id}")
 
     async def get_all_admins(self) -> list[tuple[str, Optional[str], bool]]:
         logger.debug("Fetching all admins")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT tg_user_id, username, is_owner FROM admins ORDER BY created_at DESC"
             )
@@ -273,9 +1082,19 @@ class Repo:
             return admins
 
     # Service Management
+    async def reload_services(self) -> None:
+        """Пересобирает реестр услуг из таблицы services."""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT id, name, capacity, enabled FROM services")
+            rows = await cursor.fetchall()
+        self.services = ServiceRegistry(
+            tuple(Service(int(r[0]), str(r[1]), int(r[2]), bool(r[3])) for r in rows)
+        )
+        logger.debug(f"Service registry loaded: {len(self.services)} services, {len(self.services.enabled)} enabled")
+
     async def get_all_services(self) -> list[tuple[int, str, int, bool]]:
         logger.debug("Fetching all services")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT id, name, capacity, enabled FROM services ORDER BY name"
             )
@@ -287,43 +1106,57 @@ class Repo:
     async def add_service(self, name: str, capacity: int) -> int:
         logger.info(f"Adding service: name={name}, capacity={capacity}")
         now = datetime.utcnow().isoformat(timespec="seconds")
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute(
                 "INSERT INTO services(name, capacity, enabled, created_at) VALUES(?, ?, 1, ?)",
                 (name, capacity, now),
             )
-            await db.commit()
             service_id = int(cursor.lastrowid)
+        await self.reload_services()
         logger.info(f"Service added: id={service_id}")
         return service_id
 
     async def update_service(self, service_id: int, name: Optional[str] = None, capacity: Optional[int] = None) -> None:
         logger.info(f"Updating service {service_id}: name={name}, capacity={capacity}")
-        if name is not None:
-            async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
+            if name is not None:
+                # брони и слоты ссылаются на id — переименование меняет одну строку
                 await db.execute("UPDATE services SET name=? WHERE id=?", (name, service_id))
-                await db.commit()
-        if capacity is not None:
-            async with aiosqlite.connect(self.db_path) as db:
+            if capacity is not None:
                 await db.execute("UPDATE services SET capacity=? WHERE id=?", (capacity, service_id))
-                await db.commit()
+        await self.reload_services()
         logger.info(f"Service {service_id} updated")
 
+    async def set_service_enabled(self, service_id: int, enabled: bool) -> None:
+        logger.info(f"Setting service {service_id} enabled={enabled}")
+        async with self._write() as db:
+            await db.execute("UPDATE services SET enabled=? WHERE id=?", (int(enabled), service_id))
+        await self.reload_services()
+
     async def delete_service(self, service_id: int) -> None:
         logger.info(f"Deleting service {service_id}")
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM services WHERE id=?", (service_id,))
-            await db.commit()
+        async with self._write() as db:
+            cursor = await db.execute("SELECT EXISTS(SELECT 1 FROM bookings WHERE service_id=?)", (service_id,))
+            row = await cursor.fetchone()
+            if row[0]:
+                # на услугу ссылаются брони — удаление оставило бы историю без названия
+                logger.info(f"Service {service_id} has bookings, disabling instead of deleting")
+                await db.execute("UPDATE services SET enabled=0 WHERE id=?", (service_id,))
+            else:
+                # без броней у слотов услуги остались разве что холды и пустые счётчики
+                for table in ("slot_holds", "slot_occupancy", "slot_events", "calendar_outbox"):
+                    await db.execute(f"DELETE FROM {table} WHERE service_id=?", (service_id,))
+                await db.execute("DELETE FROM services WHERE id=?", (service_id,))
+        await self.reload_services()
         logger.info(f"Service {service_id} deleted")
 
     # Booking Management
     async def get_all_bookings(self, limit: int = 50) -> list[Booking]:
         logger.debug(f"Fetching all bookings (limit={limit})")
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute(
-                """
-                SELECT id, status, service, date, time, name, phone, tg_user_id, calendar_event_id
+                f"""
+                SELECT {BOOKING_COLUMNS}
                 FROM bookings
                 ORDER BY created_at DESC
                 LIMIT ?
@@ -331,30 +1164,127 @@ class Repo:
                 (limit,),
             )
             rows = await cursor.fetchall()
-            bookings = [
-                Booking(
-                    id=int(r["id"]),
-                    status=str(r["status"]),
-                    service=str(r["service"]),
-                    date=str(r["date"]),
-                    time=str(r["time"]),
-                    name=str(r["name"]),
-                    phone=str(r["phone"]),
-                    tg_user_id=str(r["tg_user_id"]) if r["tg_user_id"] is not None else None,
-                    calendar_event_id=str(r["calendar_event_id"]) if r["calendar_event_id"] is not None else None,
-                )
-                for r in rows
-            ]
+            bookings = [_booking_from_row(r) for r in rows]
             logger.debug(f"Found {len(bookings)} bookings")
             return bookings
 
+    async def browse_bookings(
+        self,
+        filters: BookingFilter,
+        after: Optional[BookingCursor] = None,
+        before: Optional[BookingCursor] = None,
+        limit: int = 10,
+    ) -> BookingPage:
+        """
+        Страница броней от новых к старым, keyset-пагинация по (created_at, id).
+
+        after — ключ последней брони текущей страницы (следующая страница),
+        before — ключ первой (предыдущая). Вместо OFFSET поиск начинается прямо
+        с ключа по индексу (…, created_at, id), так что любая страница стоит как
+        первая. Фильтр по дате слота проверяется на строках этого же обхода.
+        """
+        where, params = [], []
+        if filters.service_id is not None:
+            where.append("service_id=?")
+            params.append(filters.service_id)
+        if filters.status is not None:
+            where.append("status=?")
+            params.append(filters.status)
+        if filters.date_from is not None:
+            where.append("slot_at >= ?")
+            params.append(filters.date_from.isoformat())
+        if filters.date_to is not None:
+            where.append("slot_at < ?")
+            params.append((filters.date_to + timedelta(days=1)).isoformat())
+
+        backwards = before is not None
+        if backwards:
+            where.append("(created_at, id) > (?, ?)")
+            params.extend(before)
+        elif after is not None:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+        order = "ASC" if backwards else "DESC"
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        logger.debug(f"Browsing bookings {filters} after={after} before={before} (limit={limit})")
+        async with self._read() as db:
+            cursor = await db.execute(
+                f"""
+                SELECT {BOOKING_COLUMNS}
+                FROM bookings
+                {where_sql}
+                ORDER BY created_at {order}, id {order}
+                LIMIT ?
+                """,
+                (*params, limit + 1),
+            )
+            rows = await cursor.fetchall()
+
+        more = len(rows) > limit
+        bookings = [_booking_from_row(r) for r in rows[:limit]]
+        if backwards:
+            bookings.reverse()
+            return BookingPage(bookings, has_prev=more, has_next=True)
+        return BookingPage(bookings, has_prev=after is not None, has_next=more)
+
+    async def get_bookings_in_range(
+        self,
+        date_from: dt_date,
+        date_to: dt_date,
+        status: str = "active",
+        limit: int = 100,
+    ) -> list[Booking]:
+        """Брони со слотом в [date_from, date_to] в порядке времени слота (range scan по slot_at)."""
+        logger.debug(f"Fetching {status} bookings from {date_from} to {date_to} (limit={limit})")
+        async with self._read() as db:
+            cursor = await db.execute(
+                f"""
+                SELECT {BOOKING_COLUMNS}
+                FROM bookings
+                WHERE status=? AND slot_at >= ? AND slot_at < ?
+                ORDER BY slot_at, id
+                LIMIT ?
+                """,
+                (status, date_from.isoformat(), (date_to + timedelta(days=1)).isoformat(), limit),
+            )
+            rows = await cursor.fetchall()
+            bookings = [_booking_from_row(r) for r in rows]
+            logger.debug(f"Found {len(bookings)} bookings in range")
+            return bookings
+
+    async def search_bookings(self, query: str, limit: int = 20) -> list[Booking]:
+        """Поиск по имени и части телефона (FTS5 bookings_fts), сначала новые брони."""
+        match = search_match_query(query)
+        if not match:
+            return []
+        logger.debug(f"Searching bookings: {match!r} (limit={limit})")
+        async with self._read() as db:
+            cursor = await db.execute(
+                f"""
+                SELECT {BOOKING_COLUMNS}
+                FROM bookings
+                WHERE id IN (
+                  SELECT rowid FROM bookings_fts
+                  WHERE bookings_fts MATCH ?
+                  ORDER BY rowid DESC
+                  LIMIT ?
+                )
+                ORDER BY id DESC
+                """,
+                (match, limit),
+            )
+            rows = await cursor.fetchall()
+            bookings = [_booking_from_row(r) for r in rows]
+            logger.debug(f"Found {len(bookings)} bookings for {query!r}")
+            return bookings
+
     async def get_booking_by_id(self, booking_id: int) -> Optional[Booking]:
         logger.debug(f"Fetching booking {booking_id}")
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute(
-                """
-                SELECT id, status, service, date, time, name, phone, tg_user_id, calendar_event_id
+                f"""
+                SELECT {BOOKING_COLUMNS}
                 FROM bookings
                 WHERE id=?
                 """,
@@ -364,28 +1294,15 @@ class Repo:
             if not row:
                 logger.debug(f"Booking {booking_id} not found")
                 return None
-            booking = Booking(
-                id=int(row["id"]),
-                status=str(row["status"]),
-                service=str(row["service"]),
-                date=str(row["date"]),
-                time=str(row["time"]),
-                name=str(row["name"]),
-                phone=str(row["phone"]),
-                tg_user_id=str(row["tg_user_id"]) if row["tg_user_id"] is not None else None,
-                calendar_event_id=str(row["calendar_event_id"]) if row["calendar_event_id"] is not None else None,
-            )
+            booking = _booking_from_row(row)
             logger.debug(f"Found booking {booking_id}")
             return booking
 
     async def update_booking(self, booking_id: int, name: Optional[str] = None, phone: Optional[str] = None) -> None:
         logger.info(f"Updating booking {booking_id}: name={name}, phone={phone}")
-        if name is not None:
-            async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
+            if name is not None:
                 await db.execute("UPDATE bookings SET name=? WHERE id=?", (name, booking_id))
-                await db.commit()
-        if phone is not None:
-            async with aiosqlite.connect(self.db_path) as db:
+            if phone is not None:
                 await db.execute("UPDATE bookings SET phone=? WHERE id=?", (phone, booking_id))
-                await db.commit()
-        logger.info(f"Booking {booking_id} updated")
\ No newline at end of file
+        logger.info(f"Booking {booking_id} updated")
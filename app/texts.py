@@ -8,6 +8,7 @@ ASK_DATE = "Выберите дату:"
 ASK_TIME = "Выберите время:"
 ASK_NAME = "Как вас зовут? (Имя и фамилия, как удобно)"
 ASK_PHONE = "Введите номер телефона (в любом формате, например +375...)"
+SERVICE_GONE = "Эта услуга сейчас недоступна. Выберите услугу заново:"
 
 CONFIRM_TEMPLATE = (
     "Проверьте запись:\n\n"
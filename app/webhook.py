@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """
+    Приём webhook'ов Telegram с ограниченной очередью.
+
+    Запрос только проверяет секрет, кладёт апдейт в очередь и сразу отвечает
+    200 — обработка идёт в пуле воркеров. Когда очередь заполнена, отвечаем
+    503: Telegram повторит доставку позже, а бот не копит неограниченно
+    задачи в памяти.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: Optional[str] = None,
+        queue_size: int = 1000,
+        workers: int = 8,
+        **data: Any,
+    ):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self._worker_tasks: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self._overloaded = False
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._start_workers)
+        super().register(app, path, **kwargs)
+
+    async def _start_workers(self, *a: Any, **kw: Any) -> None:
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Webhook workers started: {self.workers} (queue size {self.queue.maxsize})")
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            if not self._overloaded:
+                # пишем один раз на эпизод перегрузки, а не на каждый отказ
+                self._overloaded = True
+                logger.warning(f"Webhook queue is full ({self.queue.maxsize}), asking Telegram to retry updates")
+            return web.Response(status=503)
+        if self._overloaded:
+            self._overloaded = False
+            logger.info(f"Webhook queue accepts updates again ({self.rejected} rejected so far)")
+        self.accepted += 1
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self.queue.get()
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to process update {update.get('update_id')}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def close(self) -> None:
+        # дорабатываем принятые апдейты: Telegram уже получил на них 200
+        if self.queue.qsize():
+            logger.info(f"Draining {self.queue.qsize()} queued update(s)")
+        await self.queue.join()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        logger.info(f"Webhook stopped: accepted={self.accepted}, rejected={self.rejected}, failed={self.failed}")
+        # сессию бота закрывает main
+
+
+def build_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    path: str,
+    secret_token: Optional[str],
+    queue_size: int,
+    workers: int,
+) -> tuple[web.Application, QueuedRequestHandler]:
+    app = web.Application()
+    handler = QueuedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        queue_size=queue_size,
+        workers=workers,
+    )
+    handler.register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app, handler
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    path: str,
+    secret_token: Optional[str],
+    host: str,
+    port: int,
+    queue_size: int,
+    workers: int,
+) -> None:
+    """Регистрирует webhook в Telegram и обслуживает его до отмены задачи."""
+    app, _ = build_webhook_app(dp, bot, path, secret_token, queue_size, workers)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Webhook server listening on {host}:{port}{path}")
+
+    await bot.set_webhook(
+        url=url.rstrip("/") + path,
+        secret_token=secret_token or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Webhook registered: {url.rstrip('/')}{path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк FSM-хранилища: MemoryStorage против SQLiteStorage.
+
+Запуск:
+    python -m bench.bench_fsm_storage [--users 200] [--steps 6] [--budget-ms 0.5]
+
+Каждый "апдейт" повторяет то, что делает шаг сценария брони: get_state (фильтр
+состояния в dispatcher'е), get_data, два update_data и set_state. Меряется
+средняя латентность апдейта и сколько записей в базу ушло на самом деле.
+Если накладные расходы SQLiteStorage над MemoryStorage выше --budget-ms,
+скрипт завершается с кодом 1.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.db import init_db
+from app.fsm_storage import SQLiteStorage
+
+BOT_ID = 1
+
+
+async def one_update(storage: BaseStorage, key: StorageKey, step: int) -> None:
+    await storage.get_state(key)
+    await storage.get_data(key)
+    await storage.update_data(key, {f"field_{step}": "x" * 20})
+    await storage.update_data(key, {"step": step})
+    await storage.set_state(key, f"BookingFlow:step_{step}")
+
+
+async def run(storage: BaseStorage, users: int, steps: int) -> float:
+    keys = [StorageKey(bot_id=BOT_ID, chat_id=u, user_id=u) for u in range(users)]
+    started = time.perf_counter()
+    for step in range(steps):
+        for key in keys:
+            await one_update(storage, key, step)
+    return (time.perf_counter() - started) / (users * steps) * 1000
+
+
+async def main(users: int, steps: int, budget_ms: float) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        await init_db(db_path)
+
+        memory = await run(MemoryStorage(), users, steps)
+
+        results = {}
+        for label, cache_ttl in (("sqlite (cache)", 300.0), ("sqlite (no cache)", 0.0)):
+            storage = SQLiteStorage(db_path, cache_ttl=cache_ttl)
+            await storage.open()
+            flushes = 0
+            flush = storage.flush
+
+            async def counting_flush() -> None:
+                nonlocal flushes
+                flushes += 1
+                await flush()
+
+            storage.flush = counting_flush
+            try:
+                ms = await run(storage, users, steps)
+                await asyncio.sleep(storage.flush_delay * 2)
+                results[label] = (ms, flushes)
+            finally:
+                await storage.close()
+
+    print(f"{'storage':<20}{'ms/update':>12}{'overhead, ms':>14}{'flushes':>10}")
+    print(f"{'memory':<20}{memory:>12.3f}{0:>14.3f}{'-':>10}")
+    for label, (ms, flushes) in results.items():
+        print(f"{label:<20}{ms:>12.3f}{ms - memory:>14.3f}{flushes:>10}")
+
+    overhead = results["sqlite (cache)"][0] - memory
+    if overhead > budget_ms:
+        print(f"FAIL: overhead {overhead:.3f} ms > budget {budget_ms} ms")
+        return 1
+    print(f"OK: overhead {overhead:.3f} ms <= budget {budget_ms} ms ({users * steps} updates)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=6)
+    parser.add_argument("--budget-ms", type=float, default=0.5)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.users, args.steps, args.budget_ms)))
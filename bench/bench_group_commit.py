@@ -0,0 +1,115 @@
+"""
+Бенчмарк группового коммита броней (Repo.run_booking_writer) против
+транзакции на каждую бронь.
+
+Запуск:
+    python -m bench.bench_group_commit [--users 500] [--slots 8] [--capacity 20] [--batch 64] [--wait-ms 2]
+
+Открытие записи на популярные выходные: --users подтверждений приходят
+одновременно и делятся между --slots слотами вместимостью --capacity,
+половина — из холда. Меряются время всего наплыва, латентность отдельного
+подтверждения (p50/p99) и число транзакций записи; проверяется, что броней создано
+ровно столько, сколько мест, а остальные получили SlotFullError.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from app.db import init_db
+from app.repo import Repo, SlotFullError
+
+DATE = "07.06.2031"
+
+
+async def confirm(repo: Repo, service_id: int, slot: str, user: int, hold_id) -> tuple[float, bool]:
+    started = time.perf_counter()
+    try:
+        await repo.create_booking(
+            service_id=service_id, date=DATE, time=slot, name=f"user {user}", phone="+70000000000",
+            tg_user_id=str(user), hold_id=hold_id,
+        )
+        ok = True
+    except SlotFullError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+async def run(args: argparse.Namespace, batched: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        await init_db(db_path)
+        repo = Repo(db_path)
+        await repo.open()
+        writer = None
+        try:
+            service = repo.services.enabled[0]
+            await repo.update_service(service.id, capacity=args.capacity)
+            slots = [f"{10 + i:02d}:00" for i in range(args.slots)]
+            # половина пришедших успела поставить холд, пока места были
+            holds: dict[int, int] = {}
+            for user in range(0, args.users, 2):
+                try:
+                    holds[user] = await repo.hold_slot(service.id, DATE, slots[user % args.slots], str(user), 600)
+                except SlotFullError:
+                    pass
+
+            if batched:
+                writer = asyncio.create_task(repo.run_booking_writer(args.batch, args.wait_ms / 1000))
+                await asyncio.sleep(0)
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                confirm(repo, service.id, slots[user % args.slots], user, holds.get(user))
+                for user in range(args.users)
+            ))
+            elapsed = time.perf_counter() - started
+            created = sum([await repo.count_active(service.id, DATE, slot) for slot in slots])
+        finally:
+            if writer is not None:
+                writer.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
+            await repo.close()
+
+    latencies = sorted(latency for latency, _ in results)
+    ok = sum(1 for _, success in results if success)
+    assert ok == created == min(args.users, args.slots * args.capacity), (ok, created)
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "txns": repo.writer_stats.batches if batched else args.users,
+        "ok": ok,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    per_booking = await run(args, batched=False)
+    group = await run(args, batched=True)
+    print(
+        f"{args.users} simultaneous confirms over {args.slots} slots x {args.capacity} places "
+        f"(batch up to {args.batch}, wait {args.wait_ms}ms)"
+    )
+    print(f"{'mode':<14}{'total ms':>10}{'p50 ms':>9}{'p99 ms':>9}{'txns':>9}{'booked':>8}")
+    for label, r in (("per booking", per_booking), ("group commit", group)):
+        print(
+            f"{label:<14}{r['elapsed'] * 1000:>10.1f}{r['p50'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}"
+            f"{r['txns']:>9}{r['ok']:>8}"
+        )
+    print(f"throughput: {per_booking['elapsed'] / group['elapsed']:.1f}x")
+
+
+if __name__ == "__main__":
+    # иначе на каждый отказ печатается предупреждение "Slot full"
+    logging.disable(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--capacity", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=2)
+    asyncio.run(main(parser.parse_args()))
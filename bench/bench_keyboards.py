@@ -0,0 +1,82 @@
+"""
+Микробенчмарк сборки клавиатур на апдейт: до и после кэша в app/keyboards.py.
+
+Запуск:
+    python -m bench.bench_keyboards [--rounds 2000]
+
+Один "проход" — клавиатуры сценария брони, по одной на апдейт: услуги, выбор
+даты, недельный календарь с бейджами, время, подтверждение. "Без кэша" —
+прямые вызовы сборщиков (так было до кэша: InlineKeyboardBuilder + pydantic
+на каждый вызов), "с кэшем" — публичные функции модуля. Занятость для
+календаря берётся из небольшого набора вариантов, как у реальных
+пользователей, смотрящих одни и те же дни.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from app import keyboards as kb
+from app.db import DEFAULT_SERVICES
+from app.repo import Service
+
+TIMES = [f"{h:02d}:00" for h in range(8, 22)]
+STEPS = 5
+SERVICES = tuple(Service(i, name, capacity) for i, (name, _, capacity) in enumerate(DEFAULT_SERVICES, 1))
+
+
+def availability(variant: int) -> tuple[dict[str, int], list[str]]:
+    today = kb.local_today()
+    free = {(today + timedelta(days=i)).strftime("%d.%m.%Y"): (i * 3 + variant) % 5 for i in range(28)}
+    return free, TIMES[variant % 4:]
+
+
+def uncached(page: int, free: dict[str, int], times: list[str]) -> None:
+    kb.services_kb.__wrapped__(SERVICES)
+    kb._build_date_kb()
+    start, end = kb.week_page_range(page, 3)
+    days = ((start + timedelta(days=i)).strftime("%d.%m.%Y") for i in range((end - start).days + 1))
+    kb._build_week_picker_kb(page, 3, start, end, tuple(free.get(day, 0) for day in days))
+    kb._time_kb.__wrapped__(tuple(times))
+    kb._build_confirm_kb()
+
+
+def cached(page: int, free: dict[str, int], times: list[str]) -> None:
+    kb.services_kb(SERVICES)
+    kb.date_kb()
+    kb.week_picker_kb(page, 3, free)
+    kb.time_kb(times)
+    kb.confirm_kb()
+
+
+def measure(fn, inputs: list) -> float:
+    started = time.perf_counter()
+    for args in inputs:
+        fn(*args)
+    return (time.perf_counter() - started) / (len(inputs) * STEPS) * 1_000_000
+
+
+def main(rounds: int) -> None:
+    rnd = random.Random(1)
+    variants = [availability(v) for v in range(8)]
+    inputs = [(rnd.randrange(4), *variants[rnd.randrange(len(variants))]) for _ in range(rounds)]
+
+    # прогрев: импорт pydantic-схем и первые промахи кэша не меряем
+    measure(uncached, inputs[:50])
+    measure(cached, inputs[:50])
+
+    before = measure(uncached, inputs)
+    after = measure(cached, inputs)
+    print(f"{rounds} booking flows, {STEPS} keyboards each")
+    print(f"{'':<12}{'us/update':>12}")
+    print(f"{'no cache':<12}{before:>12.1f}")
+    print(f"{'cached':<12}{after:>12.1f}")
+    print(f"speedup: {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=2000)
+    main(parser.parse_args().rounds)
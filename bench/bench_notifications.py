@@ -0,0 +1,95 @@
+"""
+Бенчмарк уведомлений админам во время всплеска: сколько сообщений уходит в Telegram.
+
+Запуск:
+    python -m bench.bench_notifications [--admins 3] [--rate 50] [--duration 3] [--window 0.5]
+
+Всплеск: --duration секунд идут брони с темпом --rate в секунду, и на каждую
+бронь календарь отвечает ошибкой (как при сбое Google Calendar). Сравниваются:
+- legacy: как было — одно сообщение владельцу на каждое событие;
+- fan-out без сводок (ADMIN_DIGEST_SECONDS=0) — каждому админу на каждое событие;
+- fan-out со сводкой за окно --window.
+Время сжато: окно в полсекунды на всплеске в 3 секунды даёт то же соотношение,
+что 60-секундная сводка на 6-минутном сбое.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from app.db import init_db
+from app.notifier import AdminNotifier
+from app.outbound import Priority
+from app.repo import Repo
+
+
+class CountingOutbound:
+    """Вместо MessageScheduler: только считает, что ушло бы в Telegram."""
+
+    def __init__(self):
+        self.sent = 0
+        self.chars = 0
+
+    def send(self, chat_id, text: str, priority: Priority = Priority.ADMIN, **kwargs) -> None:
+        self.sent += 1
+        self.chars += len(text)
+
+
+async def burst(notifier: AdminNotifier, rate: float, duration: float) -> int:
+    events = int(rate * duration)
+    started = time.perf_counter()
+    for i in range(events):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        notifier.booking(f"📩 Новая запись {i}", f"#{i} group 01.01.2030 10:00 — Bench, +7900000{i:04d}")
+        notifier.error("Calendar update failed", "<HttpError 503: Backend Error>", f"group 01.01.2030 {i % 12 + 8}:00")
+    return events * 2
+
+
+async def run(repo: Repo, window: float, rate: float, duration: float) -> tuple[int, int, int]:
+    outbound = CountingOutbound()
+    notifier = AdminNotifier(repo, outbound, digest_seconds=window)
+    task = asyncio.create_task(notifier.run())
+    events = await burst(notifier, rate, duration)
+    await asyncio.sleep(window + 0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await notifier.close()
+    return events, outbound.sent, outbound.chars
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        await init_db(db_path)
+        repo = Repo(db_path)
+        await repo.open()
+        try:
+            await repo.add_admin("1", is_owner=True)
+            for i in range(2, args.admins + 1):
+                await repo.add_admin(str(i))
+            fanout = await run(repo, 0.0, args.rate, args.duration)
+            digest = await run(repo, args.window, args.rate, args.duration)
+        finally:
+            await repo.close()
+
+    events = fanout[0]
+    print(f"{events} events in {args.duration}s, {args.admins} admins, digest window {args.window}s")
+    print(f"{'mode':<22}{'messages':>10}{'avg chars':>11}")
+    print(f"{'legacy (owner only)':<22}{events:>10}{'-':>11}")
+    for label, (_, sent, chars) in (("fan-out, no digest", fanout), ("fan-out, digest", digest)):
+        print(f"{label:<22}{sent:>10}{chars / max(sent, 1):>11.0f}")
+    print(f"digest vs legacy: {events / max(digest[1], 1):.0f}x fewer messages")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--window", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
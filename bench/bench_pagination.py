@@ -0,0 +1,116 @@
+"""
+Бенчмарк админского списка броней: LIMIT/OFFSET против keyset-пагинации.
+
+Запуск:
+    python -m bench.bench_pagination [--rows 1000000] [--repeat 20]
+
+На временной базе с --rows бронями меряется время получения страницы N
+(10 записей, от новых к старым) без фильтров и с фильтром по статусу.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from app.db import init_db
+from app.repo import BOOKING_COLUMNS, BookingFilter, Repo
+
+PAGE_SIZE = 10
+PAGES = (1, 100, 10_000)
+
+
+def fill(db_path: str, rows: int) -> None:
+    start = datetime(2024, 1, 1)
+    db = sqlite3.connect(db_path)
+    services = db.execute("SELECT name, id FROM services ORDER BY id").fetchall()
+    db.executemany(
+        """
+        INSERT INTO bookings(created_at, status, service, service_id, date, time, name, phone, slot_at)
+        VALUES(?, ?, ?, ?, ?, ?, 'bench', '+70000000000', ?)
+        """,
+        (
+            (
+                (start + timedelta(seconds=i * 30)).isoformat(timespec="seconds"),
+                "active" if i % 4 else "cancelled",
+                *services[i % len(services)],
+                (slot := start + timedelta(days=i % 700, hours=10 + i % 12)).strftime("%d.%m.%Y"),
+                slot.strftime("%H:%M"),
+                slot.strftime("%Y-%m-%d %H:%M"),
+            )
+            for i in range(rows)
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+async def offset_page(db: aiosqlite.Connection, page: int, status: str | None) -> None:
+    where = "WHERE status=?" if status else ""
+    params = (status,) if status else ()
+    cursor = await db.execute(
+        f"""
+        SELECT {BOOKING_COLUMNS} FROM bookings {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ? OFFSET ?
+        """,
+        (*params, PAGE_SIZE, (page - 1) * PAGE_SIZE),
+    )
+    await cursor.fetchall()
+
+
+async def keyset_cursors(repo: Repo, filters: BookingFilter) -> dict[int, tuple]:
+    """Ключи, с которых начинаются страницы из PAGES (как если бы админ долистал до них)."""
+    cursors, after = {}, None
+    for page in range(1, max(PAGES) + 1):
+        if page in PAGES:
+            cursors[page] = after
+        result = await repo.browse_bookings(filters, after=after, limit=PAGE_SIZE)
+        after = result.last
+    return cursors
+
+
+async def timed(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def main(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        await init_db(db_path)
+        print(f"Filling {rows} bookings...")
+        fill(db_path, rows)
+
+        repo = Repo(db_path)
+        await repo.open()
+        try:
+            async with aiosqlite.connect(db_path) as db:
+                print(f"{'filter':<10}{'page':>8}{'offset, ms':>14}{'keyset, ms':>14}")
+                for status in (None, "active"):
+                    filters = BookingFilter(status=status)
+                    cursors = await keyset_cursors(repo, filters)
+                    for page in PAGES:
+                        off = await timed(lambda: offset_page(db, page, status), repeat)
+                        key = await timed(
+                            lambda: repo.browse_bookings(filters, after=cursors[page], limit=PAGE_SIZE), repeat
+                        )
+                        print(f"{status or 'all':<10}{page:>8}{off:>14.3f}{key:>14.3f}")
+        finally:
+            await repo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
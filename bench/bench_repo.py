@@ -0,0 +1,123 @@
+"""
+Бенчмарк Repo: connect-per-call (как было) против пула соединений.
+
+Запуск:
+    python -m bench.bench_repo [--calls 2000] [--bookings 500]
+
+Меряется латентность одного чтения (count_active) и пропускная способность
+create_booking (брони/сек) на временной базе.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import aiosqlite
+
+from app.db import init_db
+from app.repo import Repo
+
+SERVICE = "🏋️ Фитнес"
+DATE = "01.02.2026"
+
+
+class LegacyRepo:
+    """Старое поведение: новое aiosqlite-соединение на каждый вызов."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    async def _get_capacity(self, service: str) -> int:
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT capacity FROM services WHERE name = ?", (service,))
+            row = await cursor.fetchone()
+            return int(row[0])
+
+    async def count_active(self, service: str, date: str, time_: str) -> int:
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM bookings WHERE status='active' AND service=? AND date=? AND time=?",
+                (service, date, time_),
+            )
+            row = await cursor.fetchone()
+            return int(row[0])
+
+    async def create_booking(self, *, service_id, date, time, name, phone, tg_user_id) -> int:
+        # старая схема адресовала услугу названием — его и передаём вместо id
+        service = service_id
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("BEGIN IMMEDIATE")
+            cap = await self._get_capacity(service)
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM bookings WHERE status='active' AND service=? AND date=? AND time=?",
+                (service, date, time),
+            )
+            row = await cursor.fetchone()
+            if int(row[0]) >= cap:
+                await db.execute("ROLLBACK")
+                raise RuntimeError("slot full")
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            cur = await db.execute(
+                "INSERT INTO bookings(created_at, status, service, date, time, name, phone, tg_user_id) "
+                "VALUES(?, 'active', ?, ?, ?, ?, ?, ?)",
+                (now, service, date, time, name, phone, tg_user_id),
+            )
+            await db.commit()
+            return int(cur.lastrowid)
+
+
+async def _prepare(path: str) -> None:
+    await init_db(path)
+    async with aiosqlite.connect(path) as db:
+        # большая вместимость, чтобы бенчмарк не упирался в SlotFullError
+        await db.execute("UPDATE services SET capacity=1000000 WHERE name=?", (SERVICE,))
+        await db.commit()
+
+
+async def _bench(repo, service, calls: int, bookings: int) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        await repo.count_active(service, DATE, "10:00")
+    per_call_ms = (time.perf_counter() - t0) / calls * 1000
+
+    t0 = time.perf_counter()
+    for i in range(bookings):
+        await repo.create_booking(
+            service_id=service, date=DATE, time=f"{10 + i % 12:02d}:00",
+            name=f"User {i}", phone="+375000000000", tg_user_id=str(i),
+        )
+    per_sec = bookings / (time.perf_counter() - t0)
+    return per_call_ms, per_sec
+
+
+async def main(calls: int, bookings: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.sqlite3")
+        pooled_path = os.path.join(tmp, "pooled.sqlite3")
+        await _prepare(legacy_path)
+        await _prepare(pooled_path)
+
+        legacy = await _bench(LegacyRepo(legacy_path), SERVICE, calls, bookings)
+
+        repo = Repo(pooled_path)
+        await repo.open()
+        try:
+            pooled = await _bench(repo, repo.services.get(SERVICE).id, calls, bookings)
+        finally:
+            await repo.close()
+
+    print(f"{'':<20}{'read, ms/call':>16}{'bookings/sec':>16}")
+    print(f"{'connect-per-call':<20}{legacy[0]:>16.3f}{legacy[1]:>16.1f}")
+    print(f"{'pooled':<20}{pooled[0]:>16.3f}{pooled[1]:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--bookings", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.bookings))
@@ -0,0 +1,144 @@
+"""
+Бенчмарк перевода bookings.service (название с эмодзи) на service_id (миграция 9).
+
+Запуск:
+    python -m bench.bench_service_fk [--rows 1000000] [--lookups 20000]
+
+Синтетическая таблица в схеме до миграции: название услуги текстом и индексы,
+которые начинаются с него (idx_bookings_slot и др.). Меряются размер индексов
+(dbstat) и латентность поиска броней слота до и после, а также время самой
+миграции — пачечного бэкфилла service_id и пересоздания индексов.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.db import init_db
+
+OLD_INDEXES_SQL = """
+DROP TRIGGER IF EXISTS trg_bookings_service_id;
+DROP INDEX IF EXISTS idx_bookings_service_id_slot;
+DROP INDEX IF EXISTS idx_bookings_service_id_slot_at;
+DROP INDEX IF EXISTS idx_bookings_service_id_created;
+CREATE INDEX idx_bookings_slot ON bookings(service, date, time, status);
+CREATE INDEX idx_bookings_service_slot_at ON bookings(service, status, slot_at);
+CREATE INDEX idx_bookings_service_created ON bookings(service, created_at, id);
+PRAGMA user_version = 8;
+"""
+
+
+def fill(db_path: str, rows: int) -> list[tuple[str, str, str]]:
+    """Брони без service_id (как до миграции); возвращает слоты для поиска."""
+    db = sqlite3.connect(db_path)
+    db.executescript(OLD_INDEXES_SQL)
+    services = [r[0] for r in db.execute("SELECT name FROM services ORDER BY id")]
+    start = datetime(2024, 1, 1)
+    slots = []
+    for i in range(rows // 20):
+        slot = start + timedelta(days=i % 900, hours=8 + i % 14)
+        slots.append((services[i % len(services)], slot.strftime("%d.%m.%Y"), slot.strftime("%H:%M")))
+    db.executemany(
+        """
+        INSERT INTO bookings(created_at, status, service, date, time, name, phone, slot_at)
+        VALUES(?, ?, ?, ?, ?, 'bench', '+70000000000', ?)
+        """,
+        (
+            (
+                (start + timedelta(seconds=i * 30)).isoformat(timespec="seconds"),
+                "active" if i % 4 else "cancelled",
+                *slots[i % len(slots)],
+                datetime.strptime(f"{slots[i % len(slots)][1]} {slots[i % len(slots)][2]}", "%d.%m.%Y %H:%M")
+                .strftime("%Y-%m-%d %H:%M"),
+            )
+            for i in range(rows)
+        ),
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+    return slots
+
+
+def index_sizes(db_path: str) -> dict[str, int]:
+    db = sqlite3.connect(db_path)
+    rows = db.execute(
+        """
+        SELECT name, SUM(pgsize) FROM dbstat
+        WHERE name IN (SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='bookings')
+        GROUP BY name
+        """
+    ).fetchall()
+    db.close()
+    return dict(rows)
+
+
+def lookups(db_path: str, sql: str, params: list[tuple], n: int) -> float:
+    db = sqlite3.connect(db_path)
+    rnd = random.Random(1)
+    sample = [params[rnd.randrange(len(params))] for _ in range(n)]
+    started = time.perf_counter()
+    for p in sample:
+        db.execute(sql, p).fetchone()
+    elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed / n * 1_000_000
+
+
+async def main(rows: int, n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite3")
+        await init_db(db_path)
+        print(f"Filling {rows} bookings...")
+        slots = fill(db_path, rows)
+
+        before_sizes = index_sizes(db_path)
+        before = lookups(
+            db_path,
+            "SELECT COUNT(*) FROM bookings WHERE service=? AND date=? AND time=? AND status='active'",
+            slots,
+            n,
+        )
+
+        started = time.perf_counter()
+        await init_db(db_path)
+        migration = time.perf_counter() - started
+
+        db = sqlite3.connect(db_path)
+        ids = dict(db.execute("SELECT name, id FROM services"))
+        db.execute("ANALYZE")
+        db.close()
+        after_sizes = index_sizes(db_path)
+        after = lookups(
+            db_path,
+            "SELECT COUNT(*) FROM bookings WHERE service_id=? AND date=? AND time=? AND status='active'",
+            [(ids[s], d, t) for s, d, t in slots],
+            n,
+        )
+
+    mb = 1024 * 1024
+    print(f"{rows} bookings, {len(slots)} distinct slots, migration 9 took {migration:.1f}s")
+    print(f"{'index':<36}{'MB':>8}")
+    for name, size in sorted(before_sizes.items()):
+        print(f"{name:<36}{size / mb:>8.1f}")
+    print("after:")
+    for name, size in sorted(after_sizes.items()):
+        print(f"{name:<36}{size / mb:>8.1f}")
+    old_slot = before_sizes["idx_bookings_slot"]
+    new_slot = after_sizes["idx_bookings_service_id_slot"]
+    print(f"slot index: {old_slot / mb:.1f} MB -> {new_slot / mb:.1f} MB ({old_slot / new_slot:.1f}x smaller)")
+    print(f"slot lookup: {before:.1f} us -> {after:.1f} us per query ({n} lookups)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.lookups))
@@ -0,0 +1,232 @@
+"""
+Нагрузочный тест приёма апдейтов: long polling против webhook (app/webhook.py).
+
+Запуск:
+    python -m bench.bench_webhook [--updates 3000] [--rate 500] [--work-ms 5] [--net-ms 20]
+
+Поднимается локальный фейковый Bot API (getUpdates с long polling) и webhook-
+сервер бота. Синтетические апдейты (сообщения от 200 разных пользователей)
+идут с темпом --rate в секунду; обработчик держит каждый --work-ms.
+--net-ms — односторонняя сетевая задержка до Telegram, добавляется и к ответу
+getUpdates, и к доставке webhook'а. Меряются пропускная способность и
+латентность от "Telegram получил апдейт" до начала обработки (p50/p99),
+для webhook — ещё время ответа 200.
+
+Генератор нагрузки работает в том же процессе и event loop, что и бот, так
+что на высоких темпах он отъедает CPU у обработки (у webhook это HTTP-запрос
+на каждый апдейт, у polling — один запрос на пачку до 100 апдейтов).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+
+from aiohttp import ClientSession, TCPConnector, web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from aiogram.types import Message
+
+from app.webhook import build_webhook_app
+
+TOKEN = "123456:BENCHMARK-token"
+SECRET = "bench-secret"
+USERS = 200
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 1000 + update_id % USERS, "is_bot": False, "first_name": "Bench"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": repr(time.perf_counter()),
+        },
+    }
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+class FakeBotApi:
+    """Минимальный Bot API: getMe, getUpdates (long polling) и заглушки остальных методов."""
+
+    def __init__(self, net_delay: float):
+        self.net_delay = net_delay
+        self.pending: list[dict] = []
+        self.arrived = asyncio.Event()
+
+    def push(self, update: dict) -> None:
+        self.pending.append(update)
+        self.arrived.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        if method == "getme":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getupdates":
+            offset = int(form.get("offset") or 0)
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            if not self.pending:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), float(form.get("timeout") or 0))
+                except asyncio.TimeoutError:
+                    pass
+            result = self.pending[:100]
+            await asyncio.sleep(self.net_delay)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_dispatcher(latencies: list[float], work: float, done: asyncio.Event, total: int) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message) -> None:
+        latencies.append(time.perf_counter() - float(message.text))
+        await asyncio.sleep(work)
+        if len(latencies) == total:
+            done.set()
+
+    dp = Dispatcher(events_isolation=SimpleEventIsolation())
+    dp.include_router(router)
+    return dp
+
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def produce(send, updates: int, rate: float) -> None:
+    started = time.perf_counter()
+    for i in range(1, updates + 1):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        send(make_update(i))
+
+
+async def bench_polling(updates: int, rate: float, work: float, net_delay: float) -> dict:
+    api = FakeBotApi(net_delay)
+    api_app = web.Application()
+    api_app.router.add_post("/bot{token}/{method}", api.handle)
+    api_port = free_port()
+    api_runner = await start_site(api_app, api_port)
+
+    latencies: list[float] = []
+    done = asyncio.Event()
+    dp = make_dispatcher(latencies, work, done, updates)
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{api_port}")))
+    polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=10, handle_signals=False))
+    try:
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        await produce(api.push, updates, rate)
+        await asyncio.wait_for(done.wait(), 120)
+        elapsed = time.perf_counter() - started
+    finally:
+        await dp.stop_polling()
+        await polling
+        await bot.session.close()
+        await api_runner.cleanup()
+    return {"throughput": updates / elapsed, "latencies": latencies, "acks": []}
+
+
+async def bench_webhook(updates: int, rate: float, work: float, net_delay: float, queue_size: int, workers: int) -> dict:
+    latencies: list[float] = []
+    acks: list[float] = []
+    rejected = 0
+    done = asyncio.Event()
+    dp = make_dispatcher(latencies, work, done, updates)
+    bot = Bot(TOKEN)
+    app, handler = build_webhook_app(dp, bot, "/webhook", SECRET, queue_size, workers)
+    port = free_port()
+    runner = await start_site(app, port)
+    url = f"http://127.0.0.1:{port}/webhook"
+
+    async with ClientSession(connector=TCPConnector(limit=100)) as client:
+        inflight: set[asyncio.Task] = set()
+
+        async def deliver(update: dict) -> None:
+            nonlocal rejected
+            await asyncio.sleep(net_delay)
+            while True:
+                sent = time.perf_counter()
+                async with client.post(
+                    url,
+                    data=json.dumps(update),
+                    headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": SECRET},
+                ) as resp:
+                    acks.append(time.perf_counter() - sent)
+                    if resp.status == 200:
+                        return
+                # 503: очередь бота полна — Telegram повторит позже
+                rejected += 1
+                await asyncio.sleep(0.05)
+
+        def send(update: dict) -> None:
+            task = asyncio.create_task(deliver(update))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+
+        try:
+            started = time.perf_counter()
+            await produce(send, updates, rate)
+            await asyncio.wait_for(done.wait(), 120)
+            elapsed = time.perf_counter() - started
+        finally:
+            await asyncio.gather(*inflight, return_exceptions=True)
+            await runner.cleanup()
+            await bot.session.close()
+    return {"throughput": updates / elapsed, "latencies": latencies, "acks": acks, "rejected": rejected}
+
+
+async def main(args: argparse.Namespace) -> None:
+    work, net = args.work_ms / 1000, args.net_ms / 1000
+    results = {
+        "polling": await bench_polling(args.updates, args.rate, work, net),
+        "webhook": await bench_webhook(args.updates, args.rate, work, net, args.queue_size, args.workers),
+    }
+    print(f"{args.updates} updates at {args.rate}/s, handler {args.work_ms} ms, network {args.net_ms} ms one way")
+    print(f"{'mode':<10}{'upd/s':>10}{'p50, ms':>10}{'p99, ms':>10}{'ack p99, ms':>14}")
+    for mode, r in results.items():
+        ack = f"{percentile(r['acks'], 0.99) * 1000:.2f}" if r["acks"] else "-"
+        print(
+            f"{mode:<10}{r['throughput']:>10.0f}"
+            f"{percentile(r['latencies'], 0.5) * 1000:>10.2f}"
+            f"{percentile(r['latencies'], 0.99) * 1000:>10.2f}{ack:>14}"
+        )
+    if results["webhook"]["rejected"]:
+        print(f"webhook: {results['webhook']['rejected']} delivery(ies) rejected with 503 (queue full) and retried")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=500)
+    parser.add_argument("--work-ms", type=float, default=5)
+    parser.add_argument("--net-ms", type=float, default=20)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
@@ -1,13 +1,21 @@
 import asyncio
 import os
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 
 from app.config import load_config
 from app.db import init_db
+from app.fsm_storage import SQLiteStorage
 from app.repo import Repo
 from app.calendar_publisher import CalendarPublisher
+from app.calendar_outbox import CalendarOutboxWorker
+from app.calendar_reconcile import CalendarReconciler
 from app.logger import setup_logger
+from app.keyboards import set_timezone
 from app.handlers import start, booking, admin
+from app.webhook import run_webhook
+from app.outbound import MessageScheduler
+from app.notifier import AdminNotifier
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -23,14 +31,33 @@ async def main():
     await init_db(config.db_path)
     logger.info("Database initialized")
 
+    # "сегодня" в календаре записи — в часовом поясе клуба, а не сервера
+    set_timezone(config.tz)
+
     bot = Bot(token=config.bot_token)
     logger.info("Bot instance created")
     logger.debug(f"Bot token: {config.bot_token[:10]}...")
     
-    dp = Dispatcher()
-    logger.debug("Dispatcher created")
+    # FSM в SQLite: недописанные брони переживают рестарт
+    storage = None
+    if config.fsm_storage == "sqlite":
+        storage = SQLiteStorage(
+            config.db_path,
+            session_ttl=config.fsm_session_ttl_seconds,
+            cache_ttl=config.fsm_cache_ttl_seconds,
+        )
+        await storage.open()
+    # и webhook, и polling (handle_as_tasks) обрабатывают апдейты параллельно:
+    # апдейты одного пользователя сериализуем
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
+    logger.debug(f"Dispatcher created (FSM storage: {config.fsm_storage})")
 
-    repo = Repo(config.db_path)
+    repo = Repo(
+        config.db_path,
+        read_pool_size=config.db_read_pool_size,
+        roles_ttl=config.admin_cache_ttl_seconds,
+    )
+    await repo.open()
     logger.debug("Repository initialized")
     
     # Initialize owner admin
@@ -45,15 +72,36 @@ async def main():
         credentials_path=config.gcal_credentials_path,
         token_path=config.gcal_token_path,
         tz=config.tz,
+        max_workers=config.gcal_max_workers,
+        call_timeout=config.gcal_call_timeout,
+        service_account_path=config.gcal_service_account_path,
     )
+    try:
+        await publisher.start()
+    except Exception as e:
+        # календарь вторичен: бот работает и без него, клиент дособерёт фоновая задача publisher'а
+        logger.error(f"Calendar publisher start failed: {e}", exc_info=True)
     logger.debug(f"Calendar publisher initialized with timezone: {config.tz}")
 
+    reconciler = CalendarReconciler(repo, publisher)
+
+    outbound = MessageScheduler(
+        bot,
+        global_rate=config.outbound_global_rate,
+        chat_rate=config.outbound_chat_rate,
+        chat_burst=config.outbound_chat_burst,
+    )
+    notifier = AdminNotifier(repo, outbound, digest_seconds=config.admin_digest_seconds)
+
     # сюда подключишь роутеры, и в зависимости от твоей реализации
     # прокинь repo/publisher через dp["repo"]=repo или через DI/closure
     # например:
     dp["repo"] = repo
     dp["publisher"] = publisher
+    dp["reconciler"] = reconciler
     dp["config"] = config
+    dp["outbound"] = outbound
+    dp["notifier"] = notifier
     logger.debug("Dependencies injected into dispatcher")
 
     # include routers...
@@ -62,14 +110,60 @@ async def main():
     dp.include_router(admin.router)
     logger.debug("Routers registered")
 
-    logger.info("Starting polling...")
+    outbox_worker = CalendarOutboxWorker(repo, publisher, notify=notifier.error)
+
+    outbound_task = asyncio.create_task(outbound.run())
+    background_tasks: list[asyncio.Task] = [
+        asyncio.create_task(outbox_worker.run()),
+        asyncio.create_task(notifier.run()),
+    ]
+    if config.calendar_reconcile_seconds > 0:
+        background_tasks.append(asyncio.create_task(reconciler.run_periodic(config.calendar_reconcile_seconds)))
+    background_tasks.append(asyncio.create_task(repo.run_hold_sweeper(config.hold_sweep_seconds)))
+    if config.booking_batch_size > 0:
+        background_tasks.append(asyncio.create_task(
+            repo.run_booking_writer(config.booking_batch_size, config.booking_batch_wait_ms / 1000)
+        ))
+    if config.settings_reload_seconds > 0:
+        background_tasks.append(asyncio.create_task(repo.run_settings_reloader(config.settings_reload_seconds)))
+
     try:
-        await dp.start_polling(bot)
+        if config.webhook_url:
+            logger.info("Starting webhook...")
+            await run_webhook(
+                dp,
+                bot,
+                url=config.webhook_url,
+                path=config.webhook_path,
+                secret_token=config.webhook_secret,
+                host=config.webhook_host,
+                port=config.webhook_port,
+                queue_size=config.webhook_queue_size,
+                workers=config.webhook_workers,
+            )
+        else:
+            logger.info("Starting polling...")
+            await dp.start_polling(bot)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
-        logger.error(f"Error during polling: {e}", exc_info=True)
+        logger.error(f"Error while receiving updates: {e}", exc_info=True)
         raise
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        # досылаем незакрытую сводку и всё, что уже стоит в очереди
+        await notifier.close()
+        await outbound.close()
+        outbound_task.cancel()
+        await asyncio.gather(outbound_task, return_exceptions=True)
+        await publisher.close()
+        if storage is not None:
+            await storage.close()
+        await repo.close()
+        await bot.session.close()
+        logger.info("Shutdown completed")
 
 if __name__ == "__main__":
     asyncio.run(main())
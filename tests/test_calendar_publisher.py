@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.calendar_publisher import CalendarPublisher
+
+
+class BlockingRequest:
+    """Поддельный запрос googleapiclient: execute() блокирует поток, как сетевой вызов."""
+
+    def __init__(self, seconds: float, result=None):
+        self.seconds = seconds
+        self.result = result
+        self.thread = None
+
+    def execute(self, http=None):
+        self.thread = threading.current_thread()
+        time.sleep(self.seconds)
+        return self.result
+
+
+def make_publisher(**kwargs) -> CalendarPublisher:
+    # repo и credentials для _execute не нужны
+    return CalendarPublisher(
+        repo=None, calendar_id="test", credentials_path="", token_path="", tz="Europe/Moscow", **kwargs
+    )
+
+
+def test_execute_does_not_block_event_loop():
+    async def scenario():
+        publisher = make_publisher()
+        request = BlockingRequest(0.3, result={"id": "ev1"})
+        finished = []
+
+        async def other():
+            await asyncio.sleep(0.01)
+            finished.append("other")
+
+        async def call():
+            result = await publisher._execute(request)
+            finished.append("execute")
+            return result
+
+        try:
+            result, _ = await asyncio.gather(call(), other())
+        finally:
+            await publisher.close()
+        return result, finished, request.thread
+
+    result, finished, thread = asyncio.run(scenario())
+    assert result == {"id": "ev1"}
+    # пока запрос висит в пуле, соседняя корутина успевает завершиться
+    assert finished == ["other", "execute"]
+    assert thread is not threading.main_thread()
+    assert thread.name.startswith("gcal")
+
+
+def test_execute_raises_on_call_timeout():
+    async def scenario():
+        publisher = make_publisher(call_timeout=0.05)
+        started = time.perf_counter()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await publisher._execute(BlockingRequest(0.5))
+        finally:
+            await publisher.close()
+        return time.perf_counter() - started
+
+    assert asyncio.run(scenario()) < 0.4
+
+
+class FakeCredentials:
+    expiry = None
+    valid = True
+
+
+def test_start_failure_keeps_retrying_in_background(monkeypatch):
+    attempts = []
+
+    def flaky_load_credentials(credentials_path, token_path, service_account_path=""):
+        attempts.append(credentials_path)
+        if len(attempts) < 3:
+            raise OSError("network is unreachable")
+        return FakeCredentials()
+
+    monkeypatch.setattr("app.calendar_publisher.load_credentials", flaky_load_credentials)
+    monkeypatch.setattr("app.calendar_publisher.build_service", lambda creds: "svc")
+
+    async def scenario():
+        publisher = make_publisher(init_retry=0.01)
+        try:
+            with pytest.raises(OSError):
+                await publisher.start()
+            # клиент не построился, но фоновая задача запущена и повторяет сборку
+            assert publisher._refresh_task is not None
+            for _ in range(100):
+                if publisher._svc is not None:
+                    break
+                await asyncio.sleep(0.01)
+            return publisher._svc
+        finally:
+            await publisher.close()
+
+    assert asyncio.run(scenario()) == "svc"
+    assert len(attempts) == 3
+
+
+def test_credentials_bootstrap_is_not_bound_by_call_timeout(monkeypatch):
+    def interactive_load_credentials(credentials_path, token_path, service_account_path=""):
+        # как InstalledAppFlow: ждём, пока пользователь авторизуется в браузере
+        time.sleep(0.2)
+        return FakeCredentials()
+
+    monkeypatch.setattr("app.calendar_publisher.load_credentials", interactive_load_credentials)
+    monkeypatch.setattr("app.calendar_publisher.build_service", lambda creds: "svc")
+
+    async def scenario():
+        publisher = make_publisher(call_timeout=0.05)
+        try:
+            await publisher.start()
+            return publisher._svc
+        finally:
+            await publisher.close()
+
+    assert asyncio.run(scenario()) == "svc"
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.calendar_publisher import CalendarPublisher
+from app.calendar_reconcile import CalendarReconciler
+from app.db import init_db
+from app.repo import Repo
+
+DATE = "01.02.2031"
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, http=None):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeEvents:
+    """events() Calendar API: list отдаёт заготовленные ответы по очереди, delete записывается."""
+
+    def __init__(self):
+        self.responses = []
+        self.list_calls = []
+        self.deleted = []
+
+    def list(self, **params):
+        self.list_calls.append(params)
+        return FakeRequest(self.responses.pop(0))
+
+    def delete(self, calendarId, eventId):
+        self.deleted.append(eventId)
+        return FakeRequest("")
+
+
+class FakeService:
+    def __init__(self, events: FakeEvents):
+        self._events = events
+
+    def events(self):
+        return self._events
+
+
+def slot_event(event_id: str, service_id: int, time_: str, used: int) -> dict:
+    return {
+        "id": event_id,
+        "status": "confirmed",
+        "description": f"[RKBOOK]\nService: test\nService ID: {service_id}\nSlot: {DATE} {time_}\nUsed: {used}/3\n",
+    }
+
+
+def gone() -> HttpError:
+    return HttpError(httplib2.Response({"status": 410}), b"Sync token is no longer valid")
+
+
+async def book(repo: Repo, service_id: int, time_: str) -> None:
+    await repo.create_booking(
+        service_id=service_id, date=DATE, time=time_, name="Test", phone="+70000000000", tg_user_id="1"
+    )
+
+
+async def outbox_slots(repo: Repo) -> set:
+    return {(s.service_id, s.date, s.time) for s in await repo.get_due_outbox_slots(time.time() + 1)}
+
+
+def test_reconcile(tmp_path):
+    async def scenario():
+        path = os.path.join(tmp_path, "test.sqlite3")
+        await init_db(path)
+        repo = Repo(path)
+        await repo.open()
+        events = FakeEvents()
+        publisher = CalendarPublisher(
+            repo=repo, calendar_id="test", credentials_path="", token_path="", tz="Europe/Moscow"
+        )
+        publisher._svc = FakeService(events)
+        reconciler = CalendarReconciler(repo, publisher)
+        try:
+            service_id = repo.services.enabled[0].id
+            slot_a = (service_id, DATE, "10:00")
+            slot_b = (service_id, DATE, "11:00")
+            slot_c = (service_id, DATE, "12:00")
+            await book(repo, service_id, "10:00")
+            await book(repo, service_id, "12:00")
+            await repo.set_slot_event_id(*slot_a, "ev-a")
+            # очередь после самих броней не нужна — проверяем только то, что добавит сверка
+            for slot in await repo.get_due_outbox_slots(time.time() + 1):
+                await repo.complete_outbox_slot(slot)
+
+            # 1) первый запуск: полный список без syncToken
+            events.responses.append({
+                "items": [
+                    slot_event("ev-a", service_id, "10:00", 1),      # совпадает с БД
+                    slot_event("ev-dup", service_id, "10:00", 1),    # второе событие того же слота
+                    slot_event("ev-b", service_id, "11:00", 2),      # в БД слот пуст
+                    {"id": "foreign", "status": "confirmed", "description": "чужое событие"},
+                ],
+                "nextSyncToken": "token-1",
+            })
+            report = await reconciler.reconcile()
+            assert "syncToken" not in events.list_calls[-1]
+            assert report.full
+            assert events.deleted == ["ev-dup"]
+            assert report.duplicates_deleted == 1
+            # слот C занят, но события у него нет вовсе — находится только при полной сверке
+            assert set(report.corrected) == {slot_b, slot_c}
+            assert await outbox_slots(repo) == {slot_b, slot_c}
+            assert await repo.get_slot_event_id(*slot_b) == "ev-b"
+            assert await repo.get_calendar_sync_token("test") == "token-1"
+
+            # 2) инкрементальный запуск по сохранённому токену
+            events.responses.append({"items": [], "nextSyncToken": "token-2"})
+            report = await reconciler.reconcile()
+            assert events.list_calls[-1]["syncToken"] == "token-1"
+            assert not report.full
+            assert report.corrected == []
+            assert await repo.get_calendar_sync_token("test") == "token-2"
+
+            # 3) токен протух (410) — полная сверка заново
+            events.responses.append(gone())
+            events.responses.append({"items": [slot_event("ev-a", service_id, "10:00", 0)], "nextSyncToken": "token-3"})
+            report = await reconciler.reconcile()
+            assert events.list_calls[-2]["syncToken"] == "token-2"
+            assert "syncToken" not in events.list_calls[-1]
+            assert report.full
+            assert slot_a in report.corrected
+            assert await repo.get_calendar_sync_token("test") == "token-3"
+        finally:
+            await publisher.close()
+            await repo.close()
+
+    asyncio.run(scenario())
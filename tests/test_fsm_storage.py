@@ -0,0 +1,26 @@
+import asyncio
+import os
+
+from aiogram.fsm.storage.base import StorageKey
+
+from app.db import init_db
+from app.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+def test_concurrent_cache_misses_keep_writes(tmp_path):
+    async def scenario():
+        path = os.path.join(tmp_path, "test.sqlite3")
+        await init_db(path)
+        storage = SQLiteStorage(path)
+        await storage.open()
+        try:
+            # оба вызова промахиваются мимо кэша и ждут SELECT одновременно;
+            # чтение, закончившееся вторым, не должно затереть запись первого
+            await asyncio.gather(storage.set_data(KEY, {"date": "01.02.2031"}), storage.get_state(KEY))
+            return await storage.get_data(KEY)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == {"date": "01.02.2031"}
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.notifier import AdminNotifier
+
+
+class FakeRepo:
+    async def get_admin_ids(self):
+        return [100]
+
+
+class RecordingOutbound:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, chat_id, text, **kwargs):
+        self.sent.append((asyncio.get_running_loop().time(), chat_id, text))
+
+
+def test_first_event_is_sent_at_once_and_burst_is_digested():
+    async def scenario():
+        outbound = RecordingOutbound()
+        notifier = AdminNotifier(FakeRepo(), outbound, digest_seconds=0.3)
+        task = asyncio.create_task(notifier.run())
+        try:
+            started = asyncio.get_running_loop().time()
+            notifier.booking("📩 Запись A", "A")
+            await asyncio.sleep(0.05)
+            # одиночное событие не ждёт окна
+            assert [text for _, _, text in outbound.sent] == ["📩 Запись A"]
+            assert outbound.sent[0][0] - started < 0.1
+
+            # всплеск внутри окна — одна сводка по его концу
+            for name in "BCD":
+                notifier.booking(f"📩 Запись {name}", name)
+            await asyncio.sleep(0.1)
+            assert len(outbound.sent) == 1
+            await asyncio.sleep(0.35)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return outbound.sent, notifier.stats
+
+    sent, stats = asyncio.run(scenario())
+    assert len(sent) == 2
+    digest = sent[1][2]
+    assert "Новые записи: 3" in digest
+    assert "• B" in digest and "• D" in digest
+    assert stats.events == 4
+    assert stats.digests == 2
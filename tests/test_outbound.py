@@ -0,0 +1,127 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from app.outbound import MessageScheduler, Priority
+
+
+class RecordingBot:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("send", chat_id, text))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.calls.append(("edit", chat_id, message_id, text))
+
+
+def test_user_replies_overtake_admin_notifications():
+    async def scenario():
+        bot = RecordingBot()
+        # concurrency=1: порядок отправки = порядок в очереди
+        outbound = MessageScheduler(bot, concurrency=1)
+        outbound.send(100, "admin 1", priority=Priority.ADMIN)
+        outbound.send(100, "admin 2", priority=Priority.ADMIN)
+        outbound.edit(1, 42, "✅ booked", priority=Priority.USER)
+        assert outbound.depth_by_priority() == {"USER": 1, "ADMIN": 2}
+
+        task = asyncio.create_task(outbound.run())
+        await outbound.close(timeout=1.0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return bot.calls, outbound.stats
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == [
+        ("edit", 1, 42, "✅ booked"),
+        ("send", 100, "admin 1"),
+        ("send", 100, "admin 2"),
+    ]
+    assert stats.sent == 3
+
+
+class RateLimitedBot(RecordingBot):
+    """Первая отправка в чаты из limited получает RetryAfter, остальные проходят."""
+
+    def __init__(self, limited, retry_after=30):
+        super().__init__()
+        self.limited = set(limited)
+        self.retry_after = retry_after
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.limited:
+            self.limited.discard(chat_id)
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Too Many Requests", self.retry_after)
+        await super().send_message(chat_id, text, **kwargs)
+
+
+async def run_until_sent(outbound, bot, expected, timeout=1.0):
+    task = asyncio.create_task(outbound.run())
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if len(bot.calls) >= expected:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_retry_after_in_one_chat_does_not_pause_other_chats():
+    async def scenario():
+        bot = RateLimitedBot(limited={1})
+        outbound = MessageScheduler(bot, concurrency=1)
+        outbound.send(1, "to limited chat")
+        outbound.send(2, "to chat 2")
+        outbound.send(3, "to chat 3")
+        await run_until_sent(outbound, bot, expected=2)
+        return bot.calls, outbound
+
+    calls, outbound = asyncio.run(scenario())
+    assert calls == [("send", 2, "to chat 2"), ("send", 3, "to chat 3")]
+    assert outbound.global_bucket.blocked_until == 0
+    assert outbound.stats.retried == 1
+
+
+def test_retry_after_from_several_chats_pauses_the_bot():
+    async def scenario():
+        bot = RateLimitedBot(limited={1, 2, 3})
+        outbound = MessageScheduler(bot, concurrency=1, global_retry_chats=3)
+        for chat_id in (1, 2, 3):
+            outbound.send(chat_id, f"to chat {chat_id}")
+        await run_until_sent(outbound, bot, expected=1, timeout=0.1)
+        blocked = outbound.global_bucket.blocked_until > 0
+        outbound.send(4, "to chat 4")
+        await run_until_sent(outbound, bot, expected=1, timeout=0.1)
+        return blocked, bot.calls
+
+    blocked, calls = asyncio.run(scenario())
+    # три чата разом получили RetryAfter — ограничен весь бот, чат 4 ждёт
+    assert blocked
+    assert calls == []
+
+
+class FailingEditBot(RecordingBot):
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        raise TelegramBadRequest(SendMessage(chat_id=chat_id, text=text), "message to edit not found")
+
+
+def test_failed_edit_is_counted_and_logged_with_label(caplog):
+    async def scenario():
+        bot = FailingEditBot()
+        outbound = MessageScheduler(bot, concurrency=1)
+        outbound.edit(1, 42, "✅ booked", label="booking 7")
+        task = asyncio.create_task(outbound.run())
+        await outbound.close(timeout=1.0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return outbound.stats
+
+    with caplog.at_level(logging.ERROR, logger="app.outbound"):
+        stats = asyncio.run(scenario())
+    assert stats.dropped == 1
+    assert stats.sent == 0
+    assert "booking 7" in caplog.text
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+
+from app.db import init_db
+from app.repo import Repo, SlotFullError
+
+DATE = "01.02.2031"
+
+
+async def full_slot_with_expired_hold(repo: Repo) -> int:
+    """Слот вместимостью 1: одна бронь и истёкший холд, места нет и после его снятия."""
+    service = repo.services.enabled[0]
+    await repo.update_service(service.id, capacity=2)
+    await repo.create_booking(service_id=service.id, date=DATE, time="10:00", name="A", phone="1", tg_user_id="1")
+    await repo.hold_slot(service.id, DATE, "10:00", "2", ttl=0.01)
+    await repo.update_service(service.id, capacity=1)
+    await asyncio.sleep(0.05)
+    return service.id
+
+
+async def open_repo(tmp_path) -> Repo:
+    path = os.path.join(tmp_path, "test.sqlite3")
+    await init_db(path)
+    repo = Repo(path)
+    await repo.open()
+    return repo
+
+
+def test_expired_holds_not_counted_on_rollback(tmp_path):
+    async def scenario():
+        repo = await open_repo(tmp_path)
+        try:
+            service_id = await full_slot_with_expired_hold(repo)
+            with pytest.raises(SlotFullError):
+                await repo.create_booking(
+                    service_id=service_id, date=DATE, time="10:00", name="B", phone="2", tg_user_id="3"
+                )
+            # SlotFullError откатил транзакцию: холд на месте и не посчитан
+            assert repo.hold_stats.expired == 0
+            assert await repo.reap_expired_holds() == 1
+            assert repo.hold_stats.expired == 1
+        finally:
+            await repo.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_holds_counted_when_batch_commits(tmp_path):
+    async def scenario():
+        repo = await open_repo(tmp_path)
+        writer = asyncio.create_task(repo.run_booking_writer(8, 0.01))
+        try:
+            service_id = await full_slot_with_expired_hold(repo)
+            with pytest.raises(SlotFullError):
+                await repo.create_booking(
+                    service_id=service_id, date=DATE, time="10:00", name="B", phone="2", tg_user_id="3"
+                )
+            # отказ внутри пачки не откатывает её: снятый холд закоммичен и посчитан
+            assert repo.hold_stats.expired == 1
+            assert await repo.reap_expired_holds() == 0
+        finally:
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            await repo.close()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_writer_resolves_the_batch_in_flight(tmp_path):
+    async def scenario():
+        repo = await open_repo(tmp_path)
+        writer = asyncio.create_task(repo.run_booking_writer(8, 0))
+        inserting = asyncio.Event()
+        insert_booking = repo._insert_booking
+
+        async def slow_insert(db, request, now):
+            inserting.set()
+            await asyncio.sleep(0.05)
+            return await insert_booking(db, request, now)
+
+        repo._insert_booking = slow_insert
+        try:
+            service_id = repo.services.enabled[0].id
+            booking = asyncio.create_task(repo.create_booking(
+                service_id=service_id, date=DATE, time="10:00", name="A", phone="1", tg_user_id="1"
+            ))
+            await inserting.wait()
+            # остановка посреди пачки: бронь всё равно записана, и вызывающий получает её id
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+            booking_id = await booking
+            return booking_id, await repo.count_active(service_id, DATE, "10:00")
+        finally:
+            await repo.close()
+
+    booking_id, active = asyncio.run(scenario())
+    assert booking_id > 0
+    assert active == 1